@@ -2,14 +2,20 @@ import pandemics.repo
 import pandemics.processing
 import pandemics.utils
 import pandemics.fetch
+import pandemics.changes
+import pandemics.store
+import pandemics.scheduler
+import pandemics.parallel
+import pandemics.metrics
+import pandemics.gazetteer
+import pandemics.api
+import pandemics.derived
+import pandemics.delta
+import logging
 from datetime import datetime
 import pandas as pd
-import schedule
-import shutil
-import time
-import git
-import sys
-from os.path import join
+import threading
+from os.path import basename, exists, join, relpath, splitext
 
 # Common paths to be used for the scheduled tasks
 DATA_ROOT_DIR = '/srv/miner/'
@@ -18,6 +24,8 @@ JHU_REPO_PATH = join(DATA_ROOT_DIR, 'COVID-19')
 JHU_TIMESERIES_PATH = join(JHU_REPO_PATH, 'csse_covid_19_data/csse_covid_19_time_series')
 TIMESERIES_FOLDER = 'covid_19_timeseries_data/'
 TIMESERIES_PATH = join(UNH_REPO_PATH,TIMESERIES_FOLDER)
+DERIVED_FOLDER = 'covid_19_derived_data/'
+DERIVED_PATH = join(UNH_REPO_PATH, DERIVED_FOLDER)
 
 WORLD_RECOVERED_CSV = 'world_country_recovered.csv'
 WORLD_CONFIRMED_CSV = 'world_country_confirmed.csv'
@@ -41,61 +49,191 @@ STATE_DEATHS_PATH = join(TIMESERIES_PATH, STATE_DEATHS_CSV)
 COUNTY_CONFIRMED_PATH = join(TIMESERIES_PATH, COUNTY_CONFIRMED_CSV)
 COUNTY_DEATHS_PATH = join(TIMESERIES_PATH, COUNTY_DEATHS_CSV)
 
+# Also write a long Parquet/Feather copy of each CSV next to it, None to only write CSVs
+COLUMNAR_FORMAT = 'parquet'
+
 REALTIME_FILES = [join(TIMESERIES_FOLDER, d) for d in (WORLD_CONFIRMED_CSV, WORLD_RECOVERED_CSV, WORLD_DEATHS_CSV, STATE_CONFIRMED_CSV, STATE_DEATHS_CSV, COUNTY_CONFIRMED_CSV, COUNTY_DEATHS_CSV)]
+# Daily new counts, their 7 day average and doubling times of every table, see pandemics.derived
+DERIVED_FILES = [join(DERIVED_FOLDER, f'{splitext(basename(f))[0]}_{metric}.csv') for f in REALTIME_FILES for metric in pandemics.derived.METRICS]
+
+print(f'Files to be pushed: {REALTIME_FILES + DERIVED_FILES}')
+
+def write_output(outputs: dict, df: pd.DataFrame, path: str, columnar: bool = True) -> None:
+    name = relpath(path, UNH_REPO_PATH)
+    with pandemics.metrics.stage('write', file=name) as record:
+        # CSVs are rendered in memory, the publisher only writes the ones whose contents changed
+        outputs[name] = df.to_csv().encode()
+        record.rows = len(df)
+        record.bytes = len(outputs[name])
+        if columnar and COLUMNAR_FORMAT and pandemics.store.is_available():
+            pandemics.store.write_columnar(df, path, COLUMNAR_FORMAT)
+
+# Metrics of the last cycle of each table, so a new cycle only recomputes its trailing dates
+derived = pandemics.derived.DerivedCache()
+
+def write_derived(outputs: dict, df: pd.DataFrame, path: str) -> None:
+    tables = pandemics.derived.derive_tables(splitext(basename(path))[0], df, derived)
+    for name, table in tables.items():
+        # The long columnar copies only hold counts
+        write_output(outputs, table, join(DERIVED_PATH, f'{name}.csv'), columnar=False)
+
+# DEBUG also dumps the head of every table as it is built
+LOG_LEVEL = logging.INFO
+# Serve Prometheus metrics on this local port, None to turn it off
+METRICS_PORT = 9108
+
+# Serve the published tables to local dashboards on this port, None to turn it off
+API_PORT = 9109
+
+# Also publish what changed in each timeseries CSV since the last cycle, see pandemics.delta
+DELTAS = True
+
+# Hold tables as int32 blocks with a validity mask instead of Int64 columns, same CSVs either way
+COMPACT_DTYPES = True
+pandemics.processing.COMPACT = COMPACT_DTYPES
+
+# Build the series of each pipeline in a process pool, needs pyarrow to hand results back
+PARALLEL = True
+pipelines = pandemics.parallel if PARALLEL and pandemics.parallel.is_available() else pandemics.processing
+
+# Timing of the scheduled jobs, in seconds
+UPDATE_INTERVAL = 10 * 60
+SYNC_INTERVAL = 6 * 60 * 60
+UPDATE_TIMEOUT = 8 * 60
+SYNC_TIMEOUT = 30 * 60
+JITTER = 30
+
+# Pipelines read the JHU mirror concurrently, a sync waits for them to finish and they for it
+jhu_lock = pandemics.scheduler.SharedLock()
+# Git is not safe to drive from several threads at once
+publish_lock = threading.Lock()
+
+def sync_jhu():
+    print('Syncing JHU repo...')
+    with jhu_lock.exclusive():
+        repo, changed = pandemics.repo.sync_jhu(JHU_REPO_PATH)
+    print(f'JHU sync complete, changed files: {changed or "none"}')
+
+# Remembers what each pipeline last ran with so unchanged ones can be skipped
+changes = pandemics.changes.ChangeDetector()
+# Keeps track of unpushed commits and push backoff across cycles
+publisher = pandemics.repo.Publisher()
+# What the query API serves, replaced table by table as cycles publish them
+api_store = pandemics.api.Store()
+
+def publish(stage: str, outputs: dict):
+    with publish_lock:
+        print('Cloning CFREG repo if it does not exist...')
+        repo = pandemics.repo.clone_repo('git@github.com:unhcfreg/COVID19-DATA.git', UNH_REPO_PATH, force=False, use_ssh=True)
+        print('Clone complete!')
+
+        # Pulled first, so changesets start from the versions consumers have, not a stale clone
+        publisher.pull(repo)
+        published = dict(outputs)
+        if DELTAS:
+            published.update(pandemics.delta.changesets(UNH_REPO_PATH, {f: d for f, d in outputs.items() if f in REALTIME_FILES}))
+
+        # Publish real time data, files identical to the last commit are left alone
+        update_time = datetime.now().strftime('%-m/%-d/%Y @ %H:%M')
+        print(f'Publishing {stage} files')
+        #pandemics.repo.push_files_cmd(UNH_REPO_PATH, REALTIME_FILES, msg=f'Automatic update {update_time}')
+        with pandemics.metrics.stage('push', pipeline=stage) as record:
+            report = publisher.publish(repo, published, msg=f'Automatic {stage} update {update_time}', pull=False)
+            record.bytes = report.bytes
+    print(f'Published {len(report.files)} changed files ({report.bytes} bytes): {report.files or "none"}')
+    print(f'Committed: {report.committed}, pushed: {report.pushed}, unpushed commits: {report.pending_commits}')
+    # Files that are not listed or did not make it to the clone are not served again after a restart
+    missing = [f for f in outputs if f not in REALTIME_FILES + DERIVED_FILES or not exists(join(UNH_REPO_PATH, f))]
+    if missing:
+        print(f'Warning: {stage} files not listed in REALTIME_FILES/DERIVED_FILES or missing from the clone: {missing}')
+    if API_PORT:
+        api_store.update_csvs(outputs)
+
+def update_world():
+    files = [join(JHU_TIMESERIES_PATH, f) for f in pandemics.processing.JHU_WORLD_CSVS]
+    with jhu_lock.shared():
+        inputs = changes.digest(files=files, urls=[pandemics.fetch.WORLD_URL])
+        # Our own scrapes are stamped with today's date, so they must be rewritten when the day rolls over
+        inputs['date'] = pandemics.utils.timeseries_date()
+        if not changes.changed('world', inputs):
+            print('World inputs unchanged, skipping')
+            return
+        confirmed_global, recovered_global, deaths_global = pipelines.get_world_update(JHU_TIMESERIES_PATH, normalize=True, greatest=True)
+
+    outputs = {}
+    write_output(outputs, recovered_global, WORLD_RECOVERED_PATH)
+    write_output(outputs, confirmed_global, WORLD_CONFIRMED_PATH)
+    write_output(outputs, deaths_global, WORLD_DEATHS_PATH)
+    write_derived(outputs, recovered_global, WORLD_RECOVERED_PATH)
+    write_derived(outputs, confirmed_global, WORLD_CONFIRMED_PATH)
+    write_derived(outputs, deaths_global, WORLD_DEATHS_PATH)
+    publish('world', outputs)
+    # Only remember the inputs once their outputs are published so a failed cycle is retried
+    changes.record('world', inputs)
+
+def update_state():
+    files = [join(JHU_TIMESERIES_PATH, f) for f in pandemics.processing.JHU_STATE_CSVS]
+    with jhu_lock.shared():
+        inputs = changes.digest(files=files, urls=[pandemics.fetch.STATE_URL])
+        inputs['date'] = pandemics.utils.timeseries_date()
+        if not changes.changed('state', inputs):
+            print('State inputs unchanged, skipping')
+            return
+        confirmed_state, deaths_state = pipelines.get_state_update(JHU_TIMESERIES_PATH, normalize=True, greatest=True)
+
+    outputs = {}
+    write_output(outputs, confirmed_state, STATE_CONFIRMED_PATH)
+    write_output(outputs, deaths_state, STATE_DEATHS_PATH)
+    write_derived(outputs, confirmed_state, STATE_CONFIRMED_PATH)
+    write_derived(outputs, deaths_state, STATE_DEATHS_PATH)
+    publish('state', outputs)
+    changes.record('state', inputs)
+
+def update_county():
+    inputs = changes.digest(urls=[pandemics.fetch.COUNTY_URL])
+    # County coordinates come from the local gazetteer, only a rebuild of it changes them
+    inputs['gazetteer'] = pandemics.gazetteer.get_gazetteer().built
+    if not changes.changed('county', inputs):
+        print('County inputs unchanged, skipping')
+        return
+    confirmed_county, deaths_county = pipelines.get_county_update(normalize=True)
+
+    outputs = {}
+    write_output(outputs, confirmed_county, COUNTY_CONFIRMED_PATH)
+    write_output(outputs, deaths_county, COUNTY_DEATHS_PATH)
+    write_derived(outputs, confirmed_county, COUNTY_CONFIRMED_PATH)
+    write_derived(outputs, deaths_county, COUNTY_DEATHS_PATH)
+    publish('county', outputs)
+    changes.record('county', inputs)
 
-print(f'Files to be pushed: {REALTIME_FILES}')
-
-def realtime_update():
-   
-    confirmed_global, recovered_global, deaths_global = pandemics.processing.get_world_update(JHU_TIMESERIES_PATH, normalize=True, greatest=True)
-    confirmed_state, deaths_state = pandemics.processing.get_state_update(JHU_TIMESERIES_PATH, normalize=True, greatest=True)
-    confirmed_county, deaths_county = pandemics.processing.get_county_update(normalize=True)
-
-    print('Cloning CFREG repo if it does not exist...')
-    repo = pandemics.repo.clone_repo('git@github.com:unhcfreg/COVID19-DATA.git', UNH_REPO_PATH, force=False, use_ssh=True)
-    print('Clone complete!')
-    # Save world and state data out to repo
-
-    print('Writing out CSVs...')
-    recovered_global.to_csv(WORLD_RECOVERED_PATH)
-    print(f'Wrote to {WORLD_RECOVERED_PATH}')
-    confirmed_global.to_csv(WORLD_CONFIRMED_PATH)
-    print(f'Wrote to {WORLD_CONFIRMED_PATH}')
-    deaths_global.to_csv(WORLD_DEATHS_PATH)
-    print(f'Wrote to {WORLD_DEATHS_PATH}')
-
-    confirmed_state.to_csv(STATE_CONFIRMED_PATH)
-    print(f'Wrote to {STATE_CONFIRMED_PATH}')
-    deaths_state.to_csv(STATE_DEATHS_PATH)
-    print(f'Wrote to {STATE_DEATHS_PATH}')
-
-    confirmed_county.to_csv(COUNTY_CONFIRMED_PATH)
-    deaths_county.to_csv(COUNTY_DEATHS_PATH)
-
-    print('Writing CSVs complete...')
-
-    # Push real time data
-    update_time = datetime.now().strftime('%-m/%-d/%Y @ %H:%M')
-    print('Pushing files')
-    #pandemics.repo.push_files_cmd(UNH_REPO_PATH, REALTIME_FILES, msg=f'Automatic update {update_time}')
-    pandemics.repo.push_files(repo, files=REALTIME_FILES, msg=f'Automatic update {update_time}')
-    print('Pushing files complete')
-    
 
 if __name__ == '__main__':
 
-    pandemics.utils.build_path(DATA_ROOT_DIR)
+    # Stage metrics are logged as one JSON object per line
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    if METRICS_PORT:
+        pandemics.metrics.serve(METRICS_PORT)
 
-    # Do both of our tasks when the service starts immediately
-    pandemics.repo.clone_jhu(JHU_REPO_PATH, force=True)
-    realtime_update()
+    if (PARALLEL or COLUMNAR_FORMAT) and not pandemics.store.is_available():
+        print('Warning: pyarrow is not installed, running the pipelines serially and writing CSVs only')
 
-    schedule.every(10).minutes.do(realtime_update)
-    schedule.every(6).hours.do(pandemics.repo.clone_jhu, JHU_REPO_PATH, force=True)
+    pandemics.utils.build_path(DATA_ROOT_DIR)
 
-    while True:
-        schedule.run_pending()
-        time.sleep(30)
+    if API_PORT:
+        # Serve what the last run published until this one has caught up
+        api_store.load([join(UNH_REPO_PATH, f) for f in REALTIME_FILES + DERIVED_FILES])
+        pandemics.api.serve(api_store, API_PORT)
+
+    # Make sure the JHU mirror exists before the pipelines read it
+    sync_jhu()
+
+    # Each pipeline runs on its own timer, a slow source only delays its own outputs
+    scheduler = pandemics.scheduler.Scheduler()
+    scheduler.every(UPDATE_INTERVAL, update_world, timeout=UPDATE_TIMEOUT, jitter=JITTER)
+    scheduler.every(UPDATE_INTERVAL, update_state, timeout=UPDATE_TIMEOUT, jitter=JITTER)
+    scheduler.every(UPDATE_INTERVAL, update_county, timeout=UPDATE_TIMEOUT, jitter=JITTER)
+    scheduler.every(SYNC_INTERVAL, sync_jhu, timeout=SYNC_TIMEOUT, run_now=False)
+    scheduler.run_forever()
     
     
     
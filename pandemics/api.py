@@ -0,0 +1,289 @@
+import pandas as pd
+import numpy as np
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import *
+from urllib.parse import parse_qs, urlsplit
+import pandemics.store
+import pandemics.utils
+
+if TYPE_CHECKING:
+    from http.server import HTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Key columns that locate a region rather than name it, they cannot be queried on
+COORDINATE_COLUMNS = ('latitude', 'longitude')
+# Smaller responses are not worth compressing
+GZIP_MIN_BYTES = 1024
+# Rendered responses kept per dataset, dropped with it on reload
+RESPONSE_CACHE_SIZE = 256
+FORMATS = {
+    'json': 'application/json',
+    'csv': 'text/csv'
+}
+
+class QueryError(ValueError):
+    pass
+
+class Response(NamedTuple):
+    body: bytes
+    content_type: str
+    etag: str
+    gzipped: bool = False
+
+class Dataset:
+    """One published table held in memory, indexed by its key columns and by date.
+
+    A dataset never changes once built, a reload replaces it as a whole, so requests can
+    read it without locking.
+    """
+
+    def __init__(self, name: str, keys: pd.DataFrame, labels: Sequence[str], values: np.ndarray, digest: str):
+        dates = pandemics.utils.parse_date_labels(labels).values.astype('datetime64[D]')
+        order = np.argsort(dates, kind='stable')
+        self.name = name
+        self.digest = digest
+        self.key_columns = list(keys.columns)
+        # Kept as the strings the CSV has, so they are written back out unchanged
+        self.keys = {col: keys[col].to_numpy(dtype=object) for col in self.key_columns}
+        self.dates = dates[order]
+        self.labels = [labels[i] for i in order]
+        self.values = values[:, order]
+        # Counts are served as integers, derived tables such as averages as floats
+        with np.errstate(invalid='ignore'):
+            self.integral = bool(np.all(np.isnan(self.values) | (self.values == np.round(self.values))))
+
+        self.index = {}
+        for col in self.key_columns:
+            if col not in COORDINATE_COLUMNS:
+                codes, uniques = pd.factorize(self.keys[col])
+                rows = np.argsort(codes, kind='stable')
+                bounds = np.searchsorted(codes[rows], np.arange(len(uniques) + 1))
+                self.index[col] = {value: rows[bounds[i]:bounds[i + 1]] for i, value in enumerate(uniques)}
+
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, name: str, data: bytes) -> 'Dataset':
+        """Builds a dataset from a timeseries CSV as the service writes it.
+
+        Args:
+            name (str): What the dataset is served as, e.g. world_country_confirmed.
+            data (bytes): The CSV, with an index column, key columns and an M/D/YY column per date.
+
+        Returns:
+            Dataset: The dataset.
+        """
+        table = pandemics.store.read_wide(data)
+        return cls(name, table.keys, table.dates, table.values, hashlib.sha1(data).hexdigest())
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'regions': len(self.values),
+            'first': str(self.dates[0]) if len(self.dates) else None,
+            'last': str(self.dates[-1]) if len(self.dates) else None,
+            'keys': list(self.index)
+        }
+
+    def select(self, filters: Dict[str, Sequence[str]], start: Optional[datetime] = None,
+               end: Optional[datetime] = None) -> Tuple[np.ndarray, slice]:
+        """Finds the rows matching every filter and the dates from start to end, both included.
+
+        Args:
+            filters (Dict[str, Sequence[str]]): Values to match per key column, e.g. {'state': ['Ohio']}.
+            start (Optional[datetime]): First date.
+            end (Optional[datetime]): Last date.
+
+        Returns:
+            Tuple[np.ndarray, slice]: Row positions in table order and the slice of dates.
+        """
+        rows = None
+        for col, wanted in filters.items():
+            if col not in self.index:
+                raise QueryError(f'cannot filter {self.name} on {col}, only on {", ".join(self.index)}')
+            index = self.index[col]
+            found = np.concatenate([index[v] for v in wanted if v in index] or [np.empty(0, dtype='int64')])
+            rows = found if rows is None else np.intersect1d(rows, found)
+        rows = np.arange(len(self.values)) if rows is None else np.unique(rows)
+
+        lo = np.searchsorted(self.dates, np.datetime64(start, 'D'), side='left') if start else 0
+        hi = np.searchsorted(self.dates, np.datetime64(end, 'D'), side='right') if end else len(self.dates)
+        return rows, slice(lo, hi)
+
+    def render(self, rows: np.ndarray, dates: slice, fmt: str) -> bytes:
+        block = self.values[rows, dates]
+        missing = np.isnan(block)
+        cells = np.nan_to_num(block)
+        cells = cells.astype('int64' if self.integral else 'float64').astype(object)
+
+        if fmt == 'json':
+            cells[missing] = None
+            regions = [{col: self.keys[col][r] for col in self.key_columns} for r in rows]
+            for region in regions:
+                for col in COORDINATE_COLUMNS:
+                    if col in region:
+                        region[col] = float(region[col]) if region[col] else None
+            for region, series in zip(regions, cells.tolist()):
+                region['values'] = series
+            doc = {'dataset': self.name, 'dates': [str(d) for d in self.dates[dates]], 'regions': regions}
+            return json.dumps(doc, separators=(',', ':')).encode()
+
+        # The csv module formats numbers faster than numpy turns them into strings
+        cells[missing] = ''
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(self.key_columns + self.labels[dates])
+        keys = [self.keys[col][rows] for col in self.key_columns]
+        writer.writerows(list(key) + series for key, series in zip(zip(*keys), cells.tolist()))
+        return buffer.getvalue().encode()
+
+    def query(self, params: Dict[str, List[str]], gzipped: bool = False) -> Response:
+        """Answers a request's query string, reusing the rendered response of an identical earlier one.
+
+        Args:
+            params (Dict[str, List[str]]): Parsed query, start and end (YYYY-MM-DD), format (json or csv) and key column filters.
+            gzipped (bool): Whether the client accepts gzip.
+
+        Returns:
+            Response: The response, gzipped only when the client accepts it and it is worth it.
+        """
+        params = dict(params)
+        fmt = params.pop('format', ['json'])[-1]
+        if fmt not in FORMATS:
+            raise QueryError(f'format must be one of {", ".join(FORMATS)}')
+        try:
+            start = datetime.strptime(params.pop('start')[-1], '%Y-%m-%d') if 'start' in params else None
+            end = datetime.strptime(params.pop('end')[-1], '%Y-%m-%d') if 'end' in params else None
+        except ValueError:
+            raise QueryError('start and end must be YYYY-MM-DD dates')
+
+        canonical = json.dumps([fmt, str(start), str(end), sorted((k, sorted(v)) for k, v in params.items())])
+        key = (canonical, gzipped)
+        with self._lock:
+            cached = self._responses.get(key)
+            if cached is not None:
+                self._responses.move_to_end(key)
+                return cached
+
+        rows, dates = self.select(params, start, end)
+        body = self.render(rows, dates, fmt)
+        etag = hashlib.sha1(f'{self.digest}{canonical}'.encode()).hexdigest()[:20]
+        if gzipped and len(body) >= GZIP_MIN_BYTES:
+            response = Response(gzip.compress(body, compresslevel=6), FORMATS[fmt], f'"{etag}-gz"', True)
+        else:
+            response = Response(body, FORMATS[fmt], f'"{etag}"')
+
+        with self._lock:
+            self._responses[key] = response
+            if len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        return response
+
+class Store:
+    """The datasets being served, swapped out as a whole so a reload is atomic for readers."""
+
+    def __init__(self):
+        self.datasets = {}
+        self._lock = threading.Lock()
+
+    def update(self, datasets: Iterable[Dataset]) -> None:
+        """Replaces the given datasets, leaving the others as they are."""
+        with self._lock:
+            merged = dict(self.datasets)
+            merged.update((d.name, d) for d in datasets)
+            # Requests hold on to whichever dict they started with
+            self.datasets = merged
+
+    def update_csvs(self, outputs: Dict[str, bytes]) -> None:
+        """Loads CSVs rendered by the service, each served under its file name without .csv."""
+        self.update(Dataset.from_csv(dataset_name(path), data) for path, data in outputs.items())
+
+    def load(self, paths: Iterable[str]) -> None:
+        """Loads CSV files written by an earlier run, skipping the ones that do not exist."""
+        outputs = {}
+        for path in paths:
+            if os.path.exists(path):
+                with open(path, 'rb') as fp:
+                    outputs[path] = fp.read()
+        self.update_csvs(outputs)
+
+def dataset_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+def serve(store: Store, port: int, host: str = '127.0.0.1') -> 'HTTPServer':
+    """Serves store's datasets at http://host:port from a background thread.
+
+    GET / lists the datasets. GET /<dataset> returns its rows, narrowed by key column values,
+    e.g. ?state=Ohio&state=Iowa, and dates from ?start to ?end (YYYY-MM-DD), as ?format=json
+    (the default) or csv.
+
+    Args:
+        store (Store): The datasets to serve.
+        port (int): Port to listen on, 0 for any free one.
+        host (str): Address to bind, local only by default.
+
+    Returns:
+        HTTPServer: The running server, shut it down with server.shutdown().
+    """
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+    class ApiHandler(BaseHTTPRequestHandler):
+        # Keep connections open between requests
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately, Nagle would hold the body back for the client's delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            name = url.path.strip('/')
+            datasets = store.datasets
+            gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+            try:
+                if not name:
+                    body = json.dumps({n: d.describe() for n, d in sorted(datasets.items())}).encode()
+                    response = Response(body, FORMATS['json'], '"' + hashlib.sha1(body).hexdigest()[:20] + '"')
+                elif name in datasets:
+                    response = datasets[name].query(parse_qs(url.query), gzipped)
+                else:
+                    self.send_error(404, f'No dataset {name}')
+                    return
+            except QueryError as e:
+                self.send_error(400, str(e))
+                return
+
+            if response.etag in self.headers.get('If-None-Match', ''):
+                self.send_response(304)
+                self.send_header('ETag', response.etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', response.content_type)
+            self.send_header('Content-Length', str(len(response.body)))
+            self.send_header('ETag', response.etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            if response.gzipped:
+                self.send_header('Content-Encoding', 'gzip')
+            self.end_headers()
+            self.wfile.write(response.body)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    threading.Thread(target=server.serve_forever, name='api', daemon=True).start()
+    return server
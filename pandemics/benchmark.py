@@ -0,0 +1,516 @@
+import pandas as pd
+import numpy as np
+import argparse
+import http.client
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import *
+from urllib.parse import urlencode
+import pandemics.api
+import pandemics.compact
+import pandemics.derived
+import pandemics.jhu
+import pandemics.legacy
+import pandemics.processing
+import pandemics.synthetic
+import pandemics.tables
+
+def bench_take_greatest(days: int, regions: int) -> Dict[str, float]:
+    df = pandemics.synthetic.merged(days, regions)
+    result = {'days': days, 'regions': regions}
+
+    start = time.perf_counter()
+    pandemics.processing.take_greatest(df.copy())
+    result['engine_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pandemics.legacy.take_greatest(df.copy())
+    result['legacy_s'] = time.perf_counter() - start
+    result['speedup'] = result['legacy_s'] / result['engine_s']
+    return result
+
+def bench_table_extraction(countries: int = 200, path: Optional[str] = None, repeat: int = 5) -> Dict[str, float]:
+    """Times and measures peak memory of lxml extraction against the BeautifulSoup loop.
+
+    Args:
+        countries (int): Size of the synthetic sheet when no saved page is given.
+        path (Optional[str]): A saved copy of the world sheet to parse instead.
+        repeat (int): Parses per timing, the best is reported.
+
+    Returns:
+        Dict[str, float]: Timings, peak memory and whether both parsers agree.
+    """
+    if path:
+        with open(path, encoding='utf-8') as fp:
+            text = fp.read()
+    else:
+        text = pandemics.synthetic.world_sheet(countries)
+    result = {'bytes': len(text)}
+
+    for name, parse in (('lxml', lambda: pandemics.tables.extract_table(text, pandemics.tables.WORLD_SHEET)),
+                        ('bs4', lambda: pandemics.legacy.world_rows(text))):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parse()
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        df = parse()
+        result[f'{name}_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        result[f'{name}_s'] = best
+        result[name] = df
+
+    new, old = result.pop('lxml'), result.pop('bs4')
+    result['speedup'] = result['bs4_s'] / result['lxml_s']
+    result['identical'] = new.astype(object).where(new.notna(), None).equals(old.astype(object).where(old.notna(), None))
+    return result
+
+def _nyt_dates(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.rename(columns={'cases': 'confirmed'})
+    df['date'] = df.date.map(lambda d: datetime.strptime(d, '%Y-%m-%d').strftime('%-m/%-d/%y'))
+    return df
+
+def _same_table(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    keys = ['county', 'state', 'fips']
+    # The legacy merge matches NaN fips to each other, repeating those counties
+    b = b.drop_duplicates(keys)
+    a = a.sort_values(keys).reset_index(drop=True)
+    b = b.sort_values(keys).reset_index(drop=True)
+    return list(a.columns) == list(b.columns) and a.astype(object).equals(b.astype(object))
+
+def bench_county_pivot(days: int, counties: int, legacy: bool = True) -> Dict[str, float]:
+    df = _nyt_dates(pandemics.synthetic.nyt_counties(days, counties))
+    result = {'days': days, 'counties': counties, 'rows': len(df)}
+
+    start = time.perf_counter()
+    confirmed, deaths = pandemics.processing.pivot_nyt_data(df)
+    result['pivot_s'] = time.perf_counter() - start
+
+    if legacy:
+        start = time.perf_counter()
+        old_confirmed = pandemics.legacy.transpose_nyt_data(df.loc[:, df.columns != 'deaths'], 'confirmed')
+        old_deaths = pandemics.legacy.transpose_nyt_data(df.loc[:, df.columns != 'confirmed'], 'deaths')
+        result['legacy_s'] = time.perf_counter() - start
+        result['speedup'] = result['legacy_s'] / result['pivot_s']
+        result['identical'] = _same_table(confirmed, old_confirmed) and _same_table(deaths, old_deaths)
+
+    return result
+
+def measure(func: Callable[[], Any], repeat: int = 3) -> Tuple[Any, Dict[str, float]]:
+    """Times func and measures its peak Python memory.
+
+    Timing runs without tracemalloc, which slows allocation heavy code, and the peak is taken
+    from one extra traced run.
+
+    Returns:
+        Tuple[Any, Dict[str, float]]: func's result, its best time in seconds and its peak memory in MiB.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, {'s': best, 'peak_mb': peak / 2 ** 20}
+
+def appended_read(df: pd.DataFrame, normalize: Callable[[pd.DataFrame], pd.DataFrame], path: str) -> Callable[[], pd.DataFrame]:
+    """Sets up a cycle where JHU appended df's last date column, returning a function that reads it.
+
+    The cache holds df without its last column every time the function runs, so each run reads
+    only the appended column like the service does once a day.
+    """
+    cache = pandemics.jhu.SeriesCache()
+    df.iloc[:, :-1].to_csv(path, index=False)
+    cache.read(path, normalize)
+    primed = dict(cache._series)
+    df.to_csv(path, index=False)
+
+    def read():
+        cache._series = dict(primed)
+        return cache.read(path, normalize)
+    return read
+
+def appended_derive(df: pd.DataFrame) -> Callable[[], np.ndarray]:
+    """Like appended_read, for deriving the metrics of a table that gained its last date column."""
+    keys, _, counts = pandemics.derived.split_wide(df)
+    cache = pandemics.derived.DerivedCache()
+    cache.update('bench', counts[:, :-1], keys)
+    primed = dict(cache._tables)
+
+    def derive():
+        cache._tables = dict(primed)
+        return cache.update('bench', counts, keys)['avg7']
+    return derive
+
+def bench_stages(days: int, countries: int = 190, counties: int = 3200, repeat: int = 3, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Benchmarks every processing stage on synthetic data of one size.
+
+    Args:
+        days (int): Days of data every source spans.
+        countries (int): Countries in the world data.
+        counties (int): Counties in the JHU US and NYT data.
+        repeat (int): Runs per timing, the best is reported.
+        seed (int): Seed for the generators.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Seconds, peak MiB and output rows per stage.
+    """
+    jhu_world = pandemics.synthetic.jhu_global(days, countries, seed)
+    jhu_us = pandemics.synthetic.jhu_us(days, counties, seed)
+    nyt = pandemics.synthetic.nyt_counties(days, counties, seed)
+    merged = pandemics.synthetic.merged(days, countries, seed)
+
+    world = pandemics.processing.jhu_world_normalize(jhu_world)
+    # Our snapshot is for the day after JHU's last column
+    today = pandemics.synthetic.date_labels(days + 1)[-1]
+    unh = pandemics.synthetic.unh_world(countries, seed)
+    unh = unh[['country', 'latitude', 'longitude', 'cases']].rename(columns={'cases': today})
+    state = pandemics.processing.jhu_state_normalize(jhu_us)
+
+    tmp = tempfile.mkdtemp(prefix='pandemics-bench-')
+    us_csv = os.path.join(tmp, pandemics.processing.JHU_STATE_CONFIRMED_CSV)
+
+    stages = {
+        'read_jhu_us_full': lambda: pandemics.processing.jhu_state_normalize(pd.read_csv(us_csv)),
+        'read_jhu_us_append': appended_read(jhu_us, pandemics.processing.jhu_state_normalize, us_csv),
+        'jhu_world_normalize': lambda: pandemics.processing.jhu_world_normalize(jhu_world),
+        'jhu_state_normalize': lambda: pandemics.processing.jhu_state_normalize(jhu_us),
+        'split_jhu_state_data': lambda: pandemics.processing.split_jhu_state_data(state)[1],
+        'join_unh_jhu': lambda: pandemics.processing.join_unh_jhu(world, unh),
+        'take_greatest': lambda: pandemics.processing.take_greatest(merged.copy()),
+        'nyt_county_normalize': lambda: pandemics.processing.nyt_county_normalize(nyt.copy())[0],
+        'derive_full': lambda: pandemics.derived.derive(pandemics.derived.split_wide(state)[2])['avg7'],
+        'derive_append': appended_derive(state)
+    }
+
+    results = {}
+    try:
+        with pandemics.synthetic.stubbed_network(county_table=pandemics.synthetic.county_table(nyt.fips, seed)):
+            for name, stage in stages.items():
+                df, stats = measure(stage, repeat)
+                stats['rows'] = len(df)
+                results[name] = stats
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+def scaling_sweep(days: Sequence[int], countries: int = 190, counties: int = 3200, repeat: int = 3) -> List[Dict[str, Any]]:
+    """Runs bench_stages at each number of days, printing how each stage grows with them."""
+    sweep = []
+    for d in days:
+        sweep.append({'days': d, 'stages': bench_stages(d, countries, counties, repeat)})
+
+    first = sweep[0]
+    print(f'{"stage":<22}' + ''.join(f'{r["days"]:>10}d' for r in sweep) + '   growth')
+    for stage in first['stages']:
+        times = [r['stages'][stage]['s'] for r in sweep]
+        cells = ''.join(f'{t * 1000:>9.1f}ms' for t in times)
+        print(f'{stage:<22}{cells}   x{times[-1] / times[0]:.1f}')
+    return sweep
+
+@contextmanager
+def compact_mode(enabled: bool) -> Iterator[None]:
+    """Builds tables with pandemics.processing.COMPACT set to enabled for the duration."""
+    original = pandemics.processing.COMPACT
+    pandemics.processing.COMPACT = enabled
+    try:
+        yield
+    finally:
+        pandemics.processing.COMPACT = original
+
+def bench_memory(days: int, countries: int = 190, counties: int = 3200, repeat: int = 3, seed: int = 0) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Reports the memory each stage that builds tables takes, with Int64 columns and with compact dtypes.
+
+    Every stage runs once with pandemics.processing.COMPACT off and once with it on. Besides
+    its time and peak, what the tables it returns hold is measured, and their CSVs are checked
+    to be the same bytes in both modes.
+
+    Args:
+        days (int): Days of data every source spans.
+        countries (int): Countries in the world data.
+        counties (int): Counties in the NYT data.
+        repeat (int): Runs per timing, the best is reported.
+        seed (int): Seed for the generators.
+
+    Returns:
+        Dict[str, Dict[str, Dict[str, Any]]]: Per stage and mode (int64 or compact), seconds, peak MiB,
+            MiB held by the tables returned and whether their CSVs match the int64 mode's.
+    """
+    world = pandemics.processing.jhu_world_normalize(pandemics.synthetic.jhu_global(days, countries, seed))
+    unh = pandemics.synthetic.unh_world(countries, seed)
+    unh = unh[['country', 'latitude', 'longitude', 'cases']].rename(columns={'cases': pandemics.synthetic.date_labels(days + 1)[-1]})
+    merged = pandemics.synthetic.merged(days, countries, seed)
+    nyt = pandemics.synthetic.nyt_counties(days, counties, seed)
+
+    builds = {
+        'join_unh_jhu': lambda: (pandemics.processing.join_unh_jhu(world, unh),),
+        'take_greatest': lambda: (pandemics.processing.take_greatest(merged.copy()),),
+        'nyt_county_normalize': lambda: pandemics.processing.nyt_county_normalize(nyt.copy())
+    }
+
+    results = {}
+    csvs = {}
+    with pandemics.synthetic.stubbed_network(county_table=pandemics.synthetic.county_table(nyt.fips, seed)):
+        for mode, enabled in (('int64', False), ('compact', True)):
+            with compact_mode(enabled):
+                built = {}
+                for name, build in builds.items():
+                    built[name], stats = measure(build, repeat)
+                    stats['table_mb'] = sum(pandemics.compact.memory_usage(t) for t in built[name]) / 2 ** 20
+                    results.setdefault(name, {})[mode] = stats
+                    rendered = [t.to_csv() for t in built[name]]
+                    stats['same_csv'] = csvs.setdefault(name, rendered) == rendered
+
+                # What the service does with each table once built
+                county = built['nyt_county_normalize'][0]
+                downstream = {
+                    'write_county_csv': lambda: county.to_csv(),
+                    'derive_county': lambda: pandemics.derived.derive_tables('bench', county)
+                }
+                for name, stage in downstream.items():
+                    _, stats = measure(stage, repeat)
+                    results.setdefault(name, {})[mode] = stats
+    return results
+
+def load_test(port: int, path: str, headers: Dict[str, str], requests: int, concurrency: int) -> Dict[str, float]:
+    """Sends requests GETs of path to a local server from concurrency clients with kept-alive connections.
+
+    Returns:
+        Dict[str, float]: Requests per second, median and 99th percentile latency in milliseconds.
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def client(n):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        mine = []
+        try:
+            for _ in range(n):
+                start = time.perf_counter()
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                mine.append(time.perf_counter() - start)
+                if response.status not in (200, 304):
+                    raise RuntimeError(f'{path} answered {response.status}')
+        finally:
+            conn.close()
+            with lock:
+                latencies.extend(mine)
+
+    per_client = max(1, requests // concurrency)
+    threads = [threading.Thread(target=client, args=(per_client,)) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99))
+    }
+
+def bench_api(days: int = 365, countries: int = 190, counties: int = 3200, requests: int = 2000,
+              concurrency: int = 8, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """Load tests the query API serving a synthetic world and county table.
+
+    Every query is asked once first, which is timed on its own as first_ms, so the load test
+    mostly measures the server answering from its rendered response cache.
+
+    Args:
+        days (int): Days of data in the tables.
+        countries (int): Countries in the world table.
+        counties (int): Counties in the county table.
+        requests (int): Requests per query.
+        concurrency (int): Clients sending them at once.
+        seed (int): Seed for the generators.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Requests per second and latencies per query.
+    """
+    nyt = pandemics.synthetic.nyt_counties(days, counties, seed)
+    with pandemics.synthetic.stubbed_network(county_table=pandemics.synthetic.county_table(nyt.fips, seed)):
+        county = pandemics.processing.nyt_county_normalize(nyt)[0]
+    world = pandemics.processing.jhu_world_normalize(pandemics.synthetic.jhu_global(days, countries, seed))
+    unh = pandemics.synthetic.unh_world(countries, seed)
+    world = pandemics.processing.join_unh_jhu(world, unh[['country', 'latitude', 'longitude', 'cases']].rename(columns={'cases': pandemics.synthetic.date_labels(days + 1)[-1]}))
+
+    store = pandemics.api.Store()
+    store.update_csvs({'world_country_confirmed.csv': world.to_csv().encode(), 'us_county_confirmed.csv': county.to_csv().encode()})
+    state = next(iter(store.datasets['us_county_confirmed'].index['state']))
+    gzipped = {'Accept-Encoding': 'gzip'}
+    queries = {
+        'country_json': ('/world_country_confirmed?' + urlencode({'country': 'Country 1'}), {}),
+        'country_range_csv': ('/world_country_confirmed?' + urlencode({'country': 'Country 1', 'start': '2020-03-01', 'end': '2020-04-30', 'format': 'csv'}), {}),
+        'state_counties_gzip': ('/us_county_confirmed?' + urlencode({'state': state}), gzipped),
+        'world_csv_gzip': ('/world_country_confirmed?format=csv', gzipped),
+        'county_csv_gzip': ('/us_county_confirmed?format=csv', gzipped)
+    }
+
+    server = pandemics.api.serve(store, 0)
+    port = server.server_address[1]
+    results = {}
+    try:
+        for name, (path, headers) in queries.items():
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            start = time.perf_counter()
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+            first = time.perf_counter() - start
+            etag = response.getheader('ETag')
+            conn.close()
+
+            results[name] = {'first_ms': first * 1000, 'bytes': len(body), **load_test(port, path, headers, requests, concurrency)}
+            if name == 'country_json':
+                # Clients that kept the response only revalidate it
+                results['country_304'] = load_test(port, path, {'If-None-Match': etag}, requests, concurrency)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+IMPORT_MODULES = ('pandemics.utils', 'pandemics.geocoding', 'pandemics.changes', 'pandemics.metrics', 'pandemics.repo',
+                  'pandemics.scheduler', 'pandemics.fetch', 'pandemics.processing')
+# Dependencies worth knowing about when a module pulls them in
+HEAVY_IMPORTS = ('pandas', 'numpy', 'requests', 'geopy', 'git', 'lxml', 'bs4', 'pyarrow')
+
+def bench_import_time(modules: Sequence[str] = IMPORT_MODULES, repeat: int = 3) -> Dict[str, Dict[str, Any]]:
+    """Measures how long importing each module takes in a fresh interpreter with python -X importtime.
+
+    Args:
+        modules (Sequence[str]): The modules to import, each in its own interpreter.
+        repeat (int): Interpreters per module, the best is reported.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Milliseconds taken and the heavy dependencies loaded per module.
+    """
+    results = {}
+    for module in modules:
+        best = float('inf')
+        for _ in range(repeat):
+            proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+            # Lines look like: import time:  self [us] | cumulative | imported package
+            timings = {}
+            for line in proc.stderr.splitlines():
+                parts = line.split('|')
+                if len(parts) == 3 and parts[1].strip().isdigit():
+                    timings[parts[2].strip()] = int(parts[1])
+            best = min(best, timings[module] / 1000)
+        results[module] = {'ms': best, 'loads': [name for name in HEAVY_IMPORTS if name in timings]}
+    return results
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_runs(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Dict[int, float]]:
+    """Compares two saved sweeps, returning new over old time per stage and number of days.
+
+    Ratios above 1 are regressions.
+    """
+    before = {r['days']: r['stages'] for r in old['sweep']}
+    ratios = {}
+    for run in new['sweep']:
+        if run['days'] not in before:
+            continue
+        for stage, stats in run['stages'].items():
+            if stage in before[run['days']]:
+                ratios.setdefault(stage, {})[run['days']] = stats['s'] / before[run['days']][stage]['s']
+    return ratios
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks the pandemics processing stages on synthetic data')
+    parser.add_argument('--days', type=int, nargs='+', default=[90, 365, 730])
+    parser.add_argument('--countries', type=int, default=190)
+    parser.add_argument('--counties', type=int, default=3200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='Write the stage sweep to this file')
+    parser.add_argument('--compare', help='A JSON file from an earlier run to compare the sweep against')
+    parser.add_argument('--stages-only', action='store_true', help='Only run the stage sweep')
+    parser.add_argument('--imports', action='store_true', help='Only measure how long importing each module takes')
+    parser.add_argument('--no-legacy', action='store_true', help='Skip timing the original reshape')
+    parser.add_argument('--html', help='A saved copy of the world sheet to benchmark table extraction on')
+    parser.add_argument('--api', action='store_true', help='Only load test the query API')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per query when load testing the API')
+    parser.add_argument('--concurrency', type=int, default=8, help='Clients when load testing the API')
+    parser.add_argument('--memory', action='store_true', help='Only compare the memory stages take with and without compact dtypes')
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        for module, result in bench_import_time().items():
+            print(f'{module:<22}{result["ms"]:>9.1f}ms  loads: {", ".join(result["loads"]) or "-"}')
+        return
+
+    if args.api:
+        for query, result in bench_api(args.days[-1], args.countries, args.counties, args.requests, args.concurrency).items():
+            first = f'first {result["first_ms"]:>7.1f}ms  ' if 'first_ms' in result else ' ' * 21
+            print(f'{query:<20}{first}{result["rps"]:>8.0f} req/s  p50 {result["p50_ms"]:>6.2f}ms  p99 {result["p99_ms"]:>6.2f}ms')
+        return
+
+    if args.memory:
+        for days in args.days:
+            print(f'{days} days: {"stage":<22}{"int64":>22}{"compact":>22}   csv')
+            for stage, modes in bench_memory(days, args.countries, args.counties, args.repeat).items():
+                cells = ''
+                for mode in ('int64', 'compact'):
+                    stats = modes[mode]
+                    held = f'{stats["table_mb"]:.1f}/' if 'table_mb' in stats else ''
+                    cells += f'{held}{stats["peak_mb"]:.1f}MiB {stats["s"] * 1000:.0f}ms'.rjust(22)
+                same = modes['compact'].get('same_csv')
+                print(f'{"":>{len(str(days)) + 7}}{stage:<22}{cells}   {"-" if same is None else "same" if same else "DIFFERENT"}')
+        return
+
+    if not args.stages_only:
+        print(bench_table_extraction(path=args.html))
+        for days in args.days:
+            print(bench_county_pivot(days, args.counties, legacy=not args.no_legacy))
+            print(bench_take_greatest(days, 250))
+
+    run = {
+        'commit': _commit(),
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'sweep': scaling_sweep(args.days, args.countries, args.counties, args.repeat)
+    }
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(run, fp, indent=2)
+        print(f'Wrote results to {args.json}')
+
+    if args.compare:
+        with open(args.compare) as fp:
+            old = json.load(fp)
+        print(f'Compared with {old.get("commit")}, new time / old time:')
+        for stage, ratios in compare_runs(old, run).items():
+            print(f'{stage:<22}' + ''.join(f'{d:>6}d x{r:.2f}' for d, r in ratios.items()))
+
+if __name__ == '__main__':
+    main()
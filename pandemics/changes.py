@@ -0,0 +1,64 @@
+import hashlib
+import os
+from typing import *
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class ChangeDetector:
+    """Remembers the inputs each pipeline stage last ran with, so unchanged stages can be skipped.
+
+    Files are fingerprinted by content hash, which is only recomputed when their mtime or size
+    moves. Pages are fingerprinted concurrently with pandemics.fetch.page_digests.
+    """
+
+    def __init__(self):
+        # path -> (mtime_ns, size, digest)
+        self._files = {}
+        # stage -> {input: digest} of the last successful run
+        self._stages = {}
+
+    def file_digest(self, path: str) -> str:
+        st = os.stat(path)
+        cached = self._files.get(path)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+        digest = file_digest(path)
+        self._files[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def digest(self, files: Iterable[str] = (), urls: Iterable[str] = ()) -> Dict[str, str]:
+        """Fingerprints a stage's inputs.
+
+        Args:
+            files (Iterable[str]): Local files the stage reads.
+            urls (Iterable[str]): Pages the stage scrapes.
+
+        Returns:
+            Dict[str, str]: Digest of each input keyed by its path or url.
+        """
+        inputs = {path: self.file_digest(path) for path in files}
+        urls = list(urls)
+        if urls:
+            # The scraping stack is only loaded by stages that have pages to fingerprint
+            import pandemics.fetch
+            inputs.update(pandemics.fetch.page_digests(urls))
+        return inputs
+
+    def changed(self, stage: str, inputs: Dict[str, str]) -> bool:
+        return self._stages.get(stage) != inputs
+
+    def record(self, stage: str, inputs: Dict[str, str]) -> None:
+        """Marks a stage as up to date with inputs, call once it has finished successfully."""
+        self._stages[stage] = inputs
+
+    def forget(self, stage: Optional[str] = None) -> None:
+        """Forces stage (or every stage) to rerun on its next cycle."""
+        if stage is None:
+            self._stages.clear()
+        else:
+            self._stages.pop(stage, None)
@@ -0,0 +1,133 @@
+import pandas as pd
+import numpy as np
+import csv
+import io
+import os
+from typing import *
+
+# Counts are held in the narrowest type that fits them, int32 for anything a count has reached so far
+COUNT_DTYPES = (np.int32, np.int64)
+# Key columns that are numbers, kept as float64 so they print the same digits. Every other key column is a categorical
+COORDINATE_COLUMNS = ('latitude', 'longitude')
+# Rows turned into Python objects at once when writing a CSV
+CSV_CHUNK_ROWS = 256
+
+def count_dtype(values: np.ndarray) -> np.dtype:
+    """The first of COUNT_DTYPES that holds every value of values."""
+    for dtype in COUNT_DTYPES:
+        info = np.iinfo(dtype)
+        if not len(values) or (values.min() >= info.min and values.max() <= info.max):
+            return np.dtype(dtype)
+    return np.dtype(COUNT_DTYPES[-1])
+
+def compact_keys(keys: pd.DataFrame) -> pd.DataFrame:
+    """Holds region names as categoricals and coordinates as float64, on a fresh RangeIndex."""
+    columns = {}
+    for col in keys.columns:
+        if col in COORDINATE_COLUMNS:
+            columns[col] = keys[col].to_numpy(dtype='float64', na_value=np.nan)
+        else:
+            columns[col] = pd.Categorical(keys[col].to_numpy(dtype=object))
+    return pd.DataFrame(columns)
+
+class CompactTable:
+    """A wide timeseries table held as one block of counts instead of a nullable column per date.
+
+    counts is a C-contiguous regions by dates block of int32 (int64 once a count no longer
+    fits), zero where valid is False. keys holds the key columns in output order, region
+    names as categoricals. It writes the same CSV as the DataFrame with Int64 date columns
+    it stands in for, to_frame gives that DataFrame back.
+    """
+
+    def __init__(self, keys: pd.DataFrame, labels: Sequence[str], counts: np.ndarray, valid: np.ndarray):
+        self.keys = keys
+        self.labels = list(labels)
+        self.counts = np.ascontiguousarray(counts)
+        self.valid = np.ascontiguousarray(valid, dtype=bool)
+
+    @classmethod
+    def from_values(cls, keys: pd.DataFrame, labels: Sequence[str], values: np.ndarray) -> 'CompactTable':
+        """Builds a table from a float64 block of counts, NaN where a cell has no number."""
+        valid = ~np.isnan(values)
+        present = values[valid]
+        counts = np.zeros(values.shape, dtype=count_dtype(present))
+        counts[valid] = present
+        return cls(compact_keys(keys), labels, counts, valid)
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.keys.columns) + self.labels
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.keys), len(self.keys.columns) + len(self.labels)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.counts.nbytes + self.valid.nbytes + self.keys.memory_usage(index=True, deep=True).sum())
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def to_values(self) -> np.ndarray:
+        """The counts as a float64 block, NaN where a cell has no number."""
+        return np.where(self.valid, self.counts, np.nan)
+
+    def to_frame(self) -> pd.DataFrame:
+        """The table as a DataFrame with the key columns as strings and Int64 date columns."""
+        counts = self.counts.astype('int64')
+        columns = {label: pd.arrays.IntegerArray(counts[:, i], ~self.valid[:, i]) for i, label in enumerate(self.labels)}
+        keys = pd.DataFrame({col: self.keys[col] if col in COORDINATE_COLUMNS else self.keys[col].to_numpy(dtype=object, na_value=np.nan)
+                             for col in self.keys.columns})
+        return pd.concat([keys, pd.DataFrame(columns, index=keys.index)], axis=1)
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        return self.take(np.arange(min(n, len(self)))).to_frame()
+
+    def take(self, rows: np.ndarray) -> 'CompactTable':
+        keys = self.keys.iloc[rows].reset_index(drop=True)
+        return CompactTable(keys, self.labels, self.counts[rows], self.valid[rows])
+
+    def to_csv(self, path_or_buf: Optional[Union[str, IO[str]]] = None) -> Optional[str]:
+        """Writes the table like DataFrame.to_csv, with the row number as the first column.
+
+        Args:
+            path_or_buf (Optional[Union[str, IO[str]]]): Where to write, the CSV is returned when None.
+
+        Returns:
+            Optional[str]: The CSV when path_or_buf is None.
+        """
+        buffer = io.StringIO()
+        # Same dialect as pandas, so the bytes match what the Int64 DataFrame writes
+        writer = csv.writer(buffer, lineterminator=os.linesep, quoting=csv.QUOTE_MINIMAL)
+        writer.writerow([''] + self.columns)
+
+        keys = list(zip(range(len(self)), *[_key_cells(self.keys[col]) for col in self.keys.columns]))
+        # The csv module formats ints faster than numpy, a few rows at a time keeps the objects few
+        for start in range(0, len(self), CSV_CHUNK_ROWS):
+            rows = slice(start, start + CSV_CHUNK_ROWS)
+            cells = self.counts[rows].astype(object)
+            cells[~self.valid[rows]] = ''
+            writer.writerows(list(key) + series for key, series in zip(keys[rows], cells.tolist()))
+
+        if path_or_buf is None:
+            return buffer.getvalue()
+        if isinstance(path_or_buf, str):
+            with open(path_or_buf, 'w', newline='') as fp:
+                fp.write(buffer.getvalue())
+        else:
+            path_or_buf.write(buffer.getvalue())
+        return None
+
+def _key_cells(column: pd.Series) -> List[Any]:
+    # pandas writes missing keys as empty cells and floats as their repr, like the csv module
+    cells = column.to_numpy(dtype=object, na_value='')
+    if column.dtype.kind == 'f':
+        cells[np.isnan(column.to_numpy())] = ''
+    return cells.tolist()
+
+def memory_usage(table: Union[pd.DataFrame, CompactTable]) -> int:
+    """Bytes a wide table holds, counting the strings of object columns."""
+    if isinstance(table, CompactTable):
+        return table.nbytes
+    return int(table.memory_usage(index=True, deep=True).sum())
@@ -0,0 +1,255 @@
+import pandas as pd
+import numpy as np
+import argparse
+import hashlib
+import io
+import json
+import os
+from datetime import datetime
+from os.path import join
+from typing import *
+import pandemics.metrics
+import pandemics.store
+import pandemics.utils
+
+# Where changesets and their manifest are published, relative to the repository root
+DELTA_FOLDER = 'covid_19_deltas'
+MANIFEST_NAME = 'manifest.json'
+# Changesets kept per table, a day of 10 minute cycles. Files are reused round robin
+DELTA_SLOTS = 144
+# Key columns that locate a region rather than identify it
+COORDINATE_COLUMNS = ('latitude', 'longitude')
+
+class Changeset(NamedTuple):
+    """What changed between two versions of a wide table.
+
+    cells has the region's key columns, date, old and new, with a row per cell that changed.
+    regions is the new table's key columns in row order, only when regions were added, removed,
+    reordered or moved. A changeset that is not keyed cannot be applied, the table has to be
+    downloaded again.
+    """
+    cells: Optional[pd.DataFrame]
+    regions: Optional[pd.DataFrame]
+    added_dates: List[str]
+    removed_dates: List[str]
+    keyed: bool = True
+
+def region_columns(keys: pd.DataFrame) -> List[str]:
+    return [col for col in keys.columns if col not in COORDINATE_COLUMNS]
+
+def region_index(keys: pd.DataFrame) -> pd.Index:
+    cols = region_columns(keys)
+    if len(cols) == 1:
+        return pd.Index(keys[cols[0]])
+    return pd.MultiIndex.from_frame(keys[cols])
+
+def align(old: pandemics.store.WideTable, rows: np.ndarray, dates: Sequence[str]) -> np.ndarray:
+    """Lays old's values out on other rows and dates, rows being old's row for each, -1 for none."""
+    cols = pd.Index(old.dates).get_indexer(dates)
+    aligned = np.full((len(rows), len(dates)), np.nan)
+    found_rows, found_cols = rows >= 0, cols >= 0
+    aligned[np.ix_(found_rows, found_cols)] = old.values[np.ix_(rows[found_rows], cols[found_cols])]
+    return aligned
+
+def diff(old: pandemics.store.WideTable, new: pandemics.store.WideTable) -> Changeset:
+    """Finds every cell that differs between two versions of a table, matching regions by their keys.
+
+    Args:
+        old (WideTable): The published version.
+        new (WideTable): The version about to be published.
+
+    Returns:
+        Changeset: The changes, not keyed when the tables' regions cannot be matched up.
+    """
+    old_ids, new_ids = region_index(old.keys), region_index(new.keys)
+    if list(old.keys.columns) != list(new.keys.columns) or not old_ids.is_unique or not new_ids.is_unique:
+        return Changeset(None, None, [], [], keyed=False)
+
+    rows = old_ids.get_indexer(new_ids)
+    before = align(old, rows, new.dates)
+    same = (before == new.values) | (np.isnan(before) & np.isnan(new.values))
+    r, c = np.nonzero(~same)
+
+    cells = new.keys[region_columns(new.keys)].iloc[r].reset_index(drop=True)
+    cells['date'] = np.asarray(new.dates, dtype=object)[c]
+    cells['old'] = pd.array(before[r, c], dtype='Float64')
+    cells['new'] = pd.array(new.values[r, c], dtype='Float64')
+
+    regions = None if old.keys.equals(new.keys) else new.keys
+    old_dates = set(old.dates)
+    new_dates = set(new.dates)
+    return Changeset(cells, regions, [d for d in new.dates if d not in old_dates], [d for d in old.dates if d not in new_dates])
+
+def apply(table: pandemics.store.WideTable, changeset: Changeset) -> pandemics.store.WideTable:
+    """Applies a changeset to the table it was computed from, giving the table it was computed against."""
+    if not changeset.keyed:
+        raise ValueError('changeset is not keyed, download the whole table instead')
+
+    keys = table.keys if changeset.regions is None else changeset.regions
+    rows = region_index(table.keys).get_indexer(region_index(keys))
+    dates = [d for d in table.dates if d not in set(changeset.removed_dates)] + list(changeset.added_dates)
+    dates = pandemics.utils.sort_date_labels(dates)
+    values = align(table, rows, dates)
+
+    cells = changeset.cells
+    if cells is not None and len(cells):
+        cell_rows = region_index(keys).get_indexer(region_index(cells[region_columns(keys)]))
+        cell_cols = pd.Index(dates).get_indexer(cells.date)
+        if (cell_rows < 0).any() or (cell_cols < 0).any():
+            raise ValueError('changeset does not match the table')
+        values[cell_rows, cell_cols] = cells.new.to_numpy(dtype='float64', na_value=np.nan)
+    return pandemics.store.WideTable(keys.reset_index(drop=True), dates, values)
+
+def write_cells(cells: pd.DataFrame) -> bytes:
+    # Counts are written as integers like the tables, other values as they are
+    values = cells[['old', 'new']].to_numpy(dtype='float64', na_value=np.nan)
+    if np.array_equal(values[~np.isnan(values)], np.round(values[~np.isnan(values)])):
+        cells = cells.astype({'old': 'Int64', 'new': 'Int64'})
+    return cells.to_csv(index=False).encode()
+
+def read_cells(data: bytes) -> pd.DataFrame:
+    cells = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+    for col in ('old', 'new'):
+        cells[col] = pd.to_numeric(cells[col].replace('', np.nan)).astype('Float64')
+    return cells
+
+def read_regions(data: bytes) -> pd.DataFrame:
+    return pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+
+def sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+def load_manifest(root: str) -> Dict[str, Any]:
+    path = join(root, DELTA_FOLDER, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'sequence': 0, 'tables': {}}
+    with open(path) as fp:
+        return json.load(fp)
+
+def table_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+def changesets(root: str, outputs: Dict[str, bytes], slots: int = DELTA_SLOTS) -> Dict[str, bytes]:
+    """Works out the changesets of tables about to be published and the manifest listing them.
+
+    Each table is compared with the version in the repository at root, which is the one
+    consumers have. Every changeset gets the next sequence number and is listed with the
+    sha1 of the table before and after it, so consumers can chain them from whatever version
+    they hold. Tables that did not change get no changeset.
+
+    Args:
+        root (str): The repository the tables are published to.
+        outputs (Dict[str, bytes]): The CSVs about to be published, keyed by path relative to root.
+        slots (int): Changesets kept per table.
+
+    Returns:
+        Dict[str, bytes]: Changeset files and the manifest, keyed by path relative to root, to publish along with outputs.
+    """
+    manifest = load_manifest(root)
+    files = {}
+    for path, data in outputs.items():
+        name = table_name(path)
+        entry = manifest['tables'].setdefault(name, {'file': path, 'deltas': [], 'written': 0})
+        if 'written' not in entry:
+            # Slots used to follow the sequence shared by every table, so listed changesets could share files
+            entry['deltas'], entry['written'] = [], 0
+        current = sha1(data)
+        previous_path = join(root, path)
+        if not os.path.exists(previous_path):
+            entry['sha1'] = current
+            continue
+        with open(previous_path, 'rb') as fp:
+            previous = fp.read()
+        if previous == data:
+            entry['sha1'] = current
+            continue
+
+        with pandemics.metrics.stage('delta', file=path) as record:
+            changeset = diff(pandemics.store.read_wide(previous), pandemics.store.read_wide(data))
+            manifest['sequence'] += 1
+            delta = {
+                'sequence': manifest['sequence'],
+                'time': datetime.now().isoformat(timespec='seconds'),
+                'previous_sha1': sha1(previous),
+                'sha1': current
+            }
+            if changeset.keyed:
+                # Counted per table, so the changesets it lists never share a file
+                slot = join(DELTA_FOLDER, name, str(entry['written'] % slots))
+                entry['written'] += 1
+                delta['cells'] = f'{slot}.csv'
+                files[delta['cells']] = write_cells(changeset.cells)
+                delta['changed'] = len(changeset.cells)
+                if changeset.regions is not None:
+                    delta['regions'] = f'{slot}.regions.csv'
+                    files[delta['regions']] = changeset.regions.to_csv(index=False).encode()
+                delta['added_dates'] = changeset.added_dates
+                delta['removed_dates'] = changeset.removed_dates
+                record.rows = len(changeset.cells)
+                record.bytes = len(files[delta['cells']])
+            else:
+                delta['full'] = True
+            # Older changesets' files are about to be reused
+            entry['deltas'] = (entry['deltas'] + [delta])[-slots:]
+            entry['file'] = path
+            entry['sha1'] = current
+
+    files[join(DELTA_FOLDER, MANIFEST_NAME)] = json.dumps(manifest, indent=2, sort_keys=True).encode()
+    return files
+
+def rebuild(base: bytes, manifest: Dict[str, Any], name: str, root: str) -> bytes:
+    """Brings a table up to date by applying the changesets published since it.
+
+    Args:
+        base (bytes): The version of the table held, as published.
+        manifest (Dict[str, Any]): The manifest listing the changesets.
+        name (str): The table, e.g. us_county_confirmed.
+        root (str): Where the changeset files listed in the manifest can be read from.
+
+    Returns:
+        bytes: The table as last published, byte for byte.
+    """
+    entry = manifest['tables'][name]
+    by_previous = {d['previous_sha1']: d for d in entry['deltas']}
+    digest = sha1(base)
+    if digest == entry['sha1']:
+        return base
+
+    table = pandemics.store.read_wide(base)
+    while digest != entry['sha1']:
+        delta = by_previous.get(digest)
+        if delta is None:
+            raise ValueError(f'no changeset of {name} follows the version held, download {entry["file"]} instead')
+        if delta.get('full'):
+            raise ValueError(f'changeset {delta["sequence"]} of {name} replaced the table, download {entry["file"]} instead')
+        with open(join(root, delta['cells']), 'rb') as fp:
+            cells = read_cells(fp.read())
+        regions = None
+        if 'regions' in delta:
+            with open(join(root, delta['regions']), 'rb') as fp:
+                regions = read_regions(fp.read())
+        table = apply(table, Changeset(cells, regions, delta['added_dates'], delta['removed_dates']))
+        digest = delta['sha1']
+
+    data = pandemics.store.write_wide(table)
+    if sha1(data) != entry['sha1']:
+        raise ValueError(f'applying the changesets of {name} did not give the published table')
+    return data
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Rebuilds a published table from an older copy and the changesets since')
+    parser.add_argument('table', help='The table, e.g. us_county_confirmed')
+    parser.add_argument('base', help='The copy of the table held')
+    parser.add_argument('--root', required=True, help='A copy of the published repository, or at least of its deltas folder')
+    parser.add_argument('--out', help='Where to write the rebuilt table, defaults to overwriting base')
+    args = parser.parse_args(argv)
+
+    with open(args.base, 'rb') as fp:
+        base = fp.read()
+    data = rebuild(base, load_manifest(args.root), args.table, args.root)
+    with open(args.out or args.base, 'wb') as fp:
+        fp.write(data)
+    print(f'Rebuilt {args.table} ({len(data)} bytes) to {args.out or args.base}')
+
+if __name__ == '__main__':
+    main()
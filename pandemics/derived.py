@@ -0,0 +1,149 @@
+import pandas as pd
+import numpy as np
+import threading
+from typing import *
+import pandemics.compact
+import pandemics.metrics
+
+# Days a rolling average or growth rate looks back over
+WINDOW = 7
+# Metrics derived from each cumulative table, written as <table>_<metric>.csv
+METRICS = ('new', 'avg7', 'doubling_days')
+# Decimals kept in the float metrics
+DECIMALS = 2
+
+class Derived(NamedTuple):
+    # The cumulative counts the metrics were derived from, regions by dates, NaN where missing
+    counts: np.ndarray
+    metrics: Dict[str, np.ndarray]
+
+def split_wide(df: Union[pd.DataFrame, pandemics.compact.CompactTable]) -> Tuple[pd.DataFrame, List[str], np.ndarray]:
+    """Splits a wide timeseries table into its key columns, date labels and a float64 block of counts."""
+    if isinstance(df, pandemics.compact.CompactTable):
+        return df.keys, df.labels, df.to_values()
+    date_cols = [col for col in df.columns if '/' in col]
+    keys = df[[col for col in df.columns if col not in date_cols]]
+    return keys, date_cols, df[date_cols].to_numpy(dtype='float64', na_value=np.nan)
+
+def daily_new(counts: np.ndarray) -> np.ndarray:
+    """Day over day change of cumulative counts, NaN on the first date and next to missing days."""
+    new = np.full(counts.shape, np.nan)
+    new[:, 1:] = np.diff(counts, axis=1)
+    return new
+
+def rolling_mean(values: np.ndarray, window: int = WINDOW) -> np.ndarray:
+    """Mean of the trailing window days, NaN until a full window without missing days is available."""
+    out = np.full(values.shape, np.nan)
+    if values.shape[1] < window:
+        return out
+    missing = np.isnan(values)
+    # Running sums make every window a subtraction instead of a sum over it
+    sums = np.cumsum(np.where(missing, 0.0, values), axis=1)
+    gaps = np.cumsum(missing, axis=1)
+    sums = np.concatenate([np.zeros((len(values), 1)), sums], axis=1)
+    gaps = np.concatenate([np.zeros((len(values), 1), dtype=gaps.dtype), gaps], axis=1)
+    window_sums = sums[:, window:] - sums[:, :-window]
+    window_gaps = gaps[:, window:] - gaps[:, :-window]
+    out[:, window - 1:] = np.where(window_gaps == 0, window_sums / window, np.nan)
+    return out
+
+def doubling_days(counts: np.ndarray, window: int = WINDOW) -> np.ndarray:
+    """Days cumulative counts take to double at the growth rate of the trailing window, NaN without growth."""
+    out = np.full(counts.shape, np.nan)
+    if counts.shape[1] <= window:
+        return out
+    now, before = counts[:, window:], counts[:, :-window]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growing = (before > 0) & (now > before)
+        out[:, window:] = np.where(growing, window * np.log(2) / np.log(now / before), np.nan)
+    return out
+
+def derive(counts: np.ndarray) -> Dict[str, np.ndarray]:
+    """Computes every metric for a block of cumulative counts, regions by dates, in one pass."""
+    new = daily_new(counts)
+    return {
+        'new': new,
+        'avg7': rolling_mean(new),
+        'doubling_days': doubling_days(counts)
+    }
+
+def to_wide(keys: pd.DataFrame, labels: Sequence[str], metric: str, values: np.ndarray) -> pd.DataFrame:
+    """Lays a metric out like the table it was derived from, counts as integers and rates rounded."""
+    if metric == 'new':
+        missing = np.isnan(values)
+        ints = np.where(missing, 0, values).astype('int64')
+        columns = {label: pd.arrays.IntegerArray(ints[:, i], missing[:, i]) for i, label in enumerate(labels)}
+    else:
+        rounded = values.round(DECIMALS)
+        columns = {label: rounded[:, i] for i, label in enumerate(labels)}
+    return pd.concat([keys, pd.DataFrame(columns, index=keys.index)], axis=1)
+
+def first_change(old: np.ndarray, new: np.ndarray) -> int:
+    """The first date column where new differs from old, len(old's dates) when new only adds dates."""
+    shared = new[:, :old.shape[1]]
+    same = (shared == old) | (np.isnan(shared) & np.isnan(old))
+    changed = np.flatnonzero(~same.all(axis=0))
+    return int(changed[0]) if len(changed) else old.shape[1]
+
+class DerivedCache:
+    """Keeps the metrics of each table between cycles, recomputing only the dates that can have changed.
+
+    A cycle usually only adds a date or revises the last few, so only the metrics from the
+    first changed date onwards are recomputed, from the counts of WINDOW days before it. A
+    table whose regions changed is recomputed in full.
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.Lock()
+        self.full = 0
+        self.partial = 0
+
+    def update(self, name: str, counts: np.ndarray, keys: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Returns the metrics of counts, the current cumulative block of table name.
+
+        Args:
+            name (str): The table, e.g. world_country_confirmed.
+            counts (np.ndarray): Its cumulative counts, regions by dates, kept until the next update.
+            keys (pd.DataFrame): Its key columns, the cached metrics are only reused when they are the same.
+
+        Returns:
+            Dict[str, np.ndarray]: Each metric's block, shaped like counts.
+        """
+        with self._lock:
+            cached = self._tables.get(name)
+        if cached is not None and cached[0].equals(keys) and counts.shape[1] >= cached[1].counts.shape[1]:
+            # Metrics of a date only depend on the WINDOW days before it
+            start = first_change(cached[1].counts, counts)
+            lookback = min(start, WINDOW)
+            tail = derive(counts[:, start - lookback:])
+            metrics = {}
+            for metric, values in cached[1].metrics.items():
+                merged = np.empty(counts.shape)
+                merged[:, :start] = values[:, :start]
+                merged[:, start:] = tail[metric][:, lookback:]
+                metrics[metric] = merged
+            self.partial += 1
+        else:
+            metrics = derive(counts)
+            self.full += 1
+        with self._lock:
+            # counts is not copied, callers hand over a block they do not change afterwards
+            self._tables[name] = (keys.copy(), Derived(counts, metrics))
+        return metrics
+
+@pandemics.metrics.timed('derive')
+def derive_tables(name: str, df: Union[pd.DataFrame, pandemics.compact.CompactTable], cache: Optional[DerivedCache] = None) -> Dict[str, pd.DataFrame]:
+    """Derives daily new counts, their 7 day average and the doubling time from a cumulative table.
+
+    Args:
+        name (str): The table, e.g. world_country_confirmed, used to find its cached metrics.
+        df (Union[pd.DataFrame, CompactTable]): The cumulative wide table as published.
+        cache (Optional[DerivedCache]): Metrics of earlier cycles, everything is computed when None.
+
+    Returns:
+        Dict[str, pd.DataFrame]: A wide table per metric, keyed <name>_<metric>.
+    """
+    keys, labels, counts = split_wide(df)
+    metrics = cache.update(name, counts, keys) if cache is not None else derive(counts)
+    return {f'{name}_{metric}': to_wide(keys, labels, metric, metrics[metric]) for metric in METRICS}
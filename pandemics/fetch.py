@@ -1,149 +1,302 @@
-import requests
-from bs4 import BeautifulSoup
-from geopy.geocoders import Nominatim
-from geopy.geocoders.base import Geocoder
 import pandas as pd
-from pandemics.utils import geocode, try_int, write_csv
+from pandemics.utils import write_csv
+from pandemics.tables import extract_table, WORLD_SHEET, STATE_SHEET, CANADA_SHEET, COUNTY_TABLE
+from pandemics.geocoding import geocode_many
 import pandemics.processing
+import pandemics.metrics
 from typing import *
 from io import StringIO
+import hashlib
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# requests and geopy are only imported once the first page is fetched or name geocoded
+if TYPE_CHECKING:
+    import requests
+    from geopy.geocoders.base import Geocoder
 
 headers = {
     'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:10.0) Gecko/20100101 Firefox/10.0'
 }
 
-geocoder = Nominatim(user_agent=headers['User-Agent'], timeout=60)
+WORLD_URL = 'https://docs.google.com/spreadsheets/u/0/d/e/2PACX-1vR30F8lYP3jG7YOq8es0PBpJIE5yvRVZffOyaqC0GgMBN6yt0Q-NI8pxS7hd1F9dYXnowSC6zpZmW9D/pubhtml/sheet?headers=false&gid=0&range=A1:I183'
+STATE_URL = 'https://docs.google.com/spreadsheets/u/0/d/e/2PACX-1vR30F8lYP3jG7YOq8es0PBpJIE5yvRVZffOyaqC0GgMBN6yt0Q-NI8pxS7hd1F9dYXnowSC6zpZmW9D/pubhtml/sheet?headers=false&gid=1902046093'
+CANADA_URL = 'https://docs.google.com/spreadsheets/u/0/d/e/2PACX-1vR30F8lYP3jG7YOq8es0PBpJIE5yvRVZffOyaqC0GgMBN6yt0Q-NI8pxS7hd1F9dYXnowSC6zpZmW9D/pubhtml/sheet?headers=false&gid=338130207'
+COUNTY_TABLE_URL = 'https://en.wikipedia.org/wiki/User:Michael_J/County_table'
+COUNTY_URL = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv'
+
+# Large feeds that are parsed straight off the wire and never held in memory as a whole
+STREAMED_URLS = {COUNTY_URL}
+
+COUNTY_CHUNK_ROWS = 100000
+# Compact dtypes for the NYT feed, nullable ints since NYC and Unknown rows have no fips
+COUNTY_DTYPES = {
+    'county': 'category',
+    'state': 'category',
+    'fips': 'Int32',
+    'cases': 'Int32',
+    'deaths': 'Int32'
+}
+
+# (connect, read) timeout in seconds for every request
+REQUEST_TIMEOUT = (10, 120)
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+MAX_WORKERS = 8
+
+_session = None
+_session_lock = threading.Lock()
+
+# Bodies fetched by page_digest or prefetch, handed to the next get_text of the same url
+PAGE_FRESH_SECONDS = 120
+_bodies = {}
+# ETag/Last-Modified and body digest of the last response for each url
+_validators = {}
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+def get_geocoder() -> 'Geocoder':
+    """Returns the geocoder used for geolocation, a Nominatim one unless set_geocoder was called."""
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            from geopy.geocoders import Nominatim
+            _geocoder = Nominatim(user_agent=headers['User-Agent'], timeout=60)
+        return _geocoder
 
-def set_geocoder(new_geocoder: Geocoder) -> None:
+def set_geocoder(new_geocoder: 'Geocoder') -> None:
     """Sets the geocoder to use for geolocation.
 
     Args:
         new_geocoder (Geocoder): The geocoder to use. Must be a valid geopy geocoder.
     """
-    global geocoder
-    geocoder = new_geocoder
+    global _geocoder
+    _geocoder = new_geocoder
+
+def make_session(pool_size: int = MAX_WORKERS) -> 'requests.Session':
+    """Builds a keep-alive session that retries connection errors and 5xx/429 responses with backoff.
+
+    Args:
+        pool_size (int): Connections kept open per host.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=MAX_RETRIES, backoff_factor=RETRY_BACKOFF,
+                  status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.headers.update(headers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def get_session() -> 'requests.Session':
+    """Returns the session shared by every fetch, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+def set_session(new_session: 'requests.Session') -> None:
+    """Sets the session to use for every fetch, e.g. one pointed at a stub server.
+
+    Args:
+        new_session (requests.Session): The session to use.
+    """
+    global _session
+    with _session_lock:
+        _session = new_session
+
+def _get(url: str, **kwargs) -> 'requests.Response':
+    return get_session().get(url, timeout=REQUEST_TIMEOUT, **kwargs)
+
+def _map(func: Callable[[str], Any], urls: Iterable[str]) -> Dict[str, Any]:
+    urls = list(dict.fromkeys(urls))
+    if len(urls) <= 1:
+        return {url: func(url) for url in urls}
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(urls))) as pool:
+        return dict(zip(urls, pool.map(func, urls)))
+
+def prefetch(urls: Iterable[str]) -> None:
+    """Downloads every url concurrently so the parsers that follow get their pages without waiting.
+
+    STREAMED_URLS are skipped since their parsers read them straight off the wire.
+
+    Args:
+        urls (Iterable[str]): The pages about to be parsed.
+    """
+    def fetch(url):
+        if url in STREAMED_URLS:
+            return
+        fetched = _bodies.get(url)
+        if fetched and time.time() - fetched[0] < PAGE_FRESH_SECONDS:
+            return
+        r = _get(url)
+        r.raise_for_status()
+        _bodies[url] = (time.time(), r.text)
+    _map(fetch, urls)
+
+def page_digests(urls: Iterable[str]) -> Dict[str, str]:
+    """Runs page_digest on every url concurrently.
+
+    Args:
+        urls (Iterable[str]): The pages to fingerprint.
+
+    Returns:
+        Dict[str, str]: Digest of each page keyed by url.
+    """
+    return _map(page_digest, urls)
+
+def get_text(url: str) -> str:
+    """Returns the body of url, reusing the one page_digest or prefetch just downloaded if it is still fresh.
+
+    Args:
+        url (str): The url to fetch.
+
+    Returns:
+        str: The decoded response body.
+    """
+    fetched = _bodies.pop(url, None)
+    if fetched and time.time() - fetched[0] < PAGE_FRESH_SECONDS:
+        return fetched[1]
+    with pandemics.metrics.stage('fetch', url=url) as record:
+        r = _get(url)
+        record.bytes = len(r.content)
+    return r.text
+
+def page_digest(url: str) -> str:
+    """Fingerprints the current contents of url.
+
+    A conditional request is made with the ETag/Last-Modified of the previous response, so
+    sources that support them cost a 304 when unchanged. Otherwise the body is hashed and kept
+    for the next get_text call, so the page is not downloaded twice in one cycle. STREAMED_URLS
+    are fingerprinted by their ETag/Last-Modified without reading the body, which their parser
+    downloads itself. Only when a server sends neither is their body hashed block by block.
+
+    Args:
+        url (str): The url to fingerprint.
+
+    Returns:
+        str: A digest that changes whenever the page does.
+    """
+    req_headers = {}
+    etag, last_modified, digest = _validators.get(url, (None, None, None))
+    if etag:
+        req_headers['If-None-Match'] = etag
+    if last_modified:
+        req_headers['If-Modified-Since'] = last_modified
+
+    streamed = url in STREAMED_URLS
+    with pandemics.metrics.stage('fetch', url=url, conditional=True) as record:
+        r = _get(url, headers=req_headers, stream=streamed)
+        if r.status_code == 304 and digest:
+            r.close()
+            record.bytes = 0
+            return digest
+        r.raise_for_status()
+
+        validators = (r.headers.get('ETag'), r.headers.get('Last-Modified'))
+        if streamed and any(validators):
+            # The validators change with the body, so the feed is only downloaded by its parser
+            r.close()
+            digest = hashlib.sha1(repr(validators).encode()).hexdigest()
+            record.bytes = 0
+        elif streamed:
+            # Hash the body as it arrives, the parser will stream it again itself
+            h = hashlib.sha1()
+            record.bytes = 0
+            for block in r.iter_content(chunk_size=1 << 20):
+                h.update(block)
+                record.bytes += len(block)
+            digest = h.hexdigest()
+        else:
+            digest = hashlib.sha1(r.content).hexdigest()
+            record.bytes = len(r.content)
+            _bodies[url] = (time.time(), r.text)
+    _validators[url] = validators + (digest,)
+    return digest
+
+def _locate(df: pd.DataFrame, pk: str, suffix: str = '') -> pd.DataFrame:
+    # Geocode every row in one batch, then order the rows by name
+    names = [f'{name}{suffix}' for name in df[pk]]
+    coords = geocode_many(get_geocoder(), names)
+    df['latitude'] = [coords[name][0] for name in names]
+    df['longitude'] = [coords[name][1] for name in names]
+    return df.sort_values(pk, kind='stable').reset_index(drop=True)
 
 def state_data(normalize: bool = True) -> pd.DataFrame:
-    r = requests.get('https://docs.google.com/spreadsheets/u/0/d/e/2PACX-1vR30F8lYP3jG7YOq8es0PBpJIE5yvRVZffOyaqC0GgMBN6yt0Q-NI8pxS7hd1F9dYXnowSC6zpZmW9D/pubhtml/sheet?headers=false&gid=1902046093', headers=headers)
-    soup = BeautifulSoup(r.text, 'lxml')
-
-    tbody = soup.find('tbody')
-    raw_rows = tbody.find_all('tr')[5:64]
-    rows = []
-
-    for row in raw_rows:
-        tds = row.find_all('td')
-        state = tds[0].string
-        cases = try_int(tds[1].string)
-        deaths = try_int(tds[3].string)
-        recovered = try_int(tds[7].string)
-
-        lat, lon = geocode(geocoder, f'{state}, United States')
-        
-        rows.append((state, cases, deaths, recovered, lat, lon))
-    
-    rows.sort(key=lambda r: r[0])
-    
-    df = pd.DataFrame(rows, columns=('state', 'cases', 'deaths', 'recovered', 'latitude', 'longitude'))
+    text = get_text(STATE_URL)
+
+    df = extract_table(text, STATE_SHEET)
+    df = _locate(df, 'state', suffix=', United States')
+
     if normalize:
         df = pandemics.processing.unh_state_normalize(df)
     return df
 
 def county_table() -> pd.DataFrame:
-    r = requests.get('https://en.wikipedia.org/wiki/User:Michael_J/County_table', headers=headers)
-    
-    soup = BeautifulSoup(r.text, 'lxml')
-    table = soup.find('table')
-    tbody = table.find('tbody')
+    text = get_text(COUNTY_TABLE_URL)
 
-    rows = []
+    df = extract_table(text, COUNTY_TABLE)
+    df.fips = df.fips.astype(str).str.zfill(5)
 
-    for row in tbody.find_all('tr')[1:]:
-        tds = row.find_all('td')
-        fips = tds[2].text
-        lat = tds[-2].text.strip('\n').strip('°').replace('–', '-') # Remove degree symbol
-        lon = tds[-1].text.strip('\n').strip('°').replace('–', '-')
-        lat = float(lat)
-        lon = float(lon)
-        rows.append((fips, lat, lon))
+    return df
 
-    df = pd.DataFrame(rows, columns=('fips', 'latitude', 'longitude'))
+def county_chunks(chunk_rows: int = COUNTY_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Streams the NYT us-counties.csv feed as compact DataFrame chunks.
 
-    df = df.astype({
-        'latitude': 'float64',
-        'longitude': 'float64'
-    })
+    The response is parsed as it downloads, so neither the raw body nor the whole long
+    frame is ever held in memory.
 
-    df.fips = df.fips.astype(str).str.zfill(5)
+    Args:
+        chunk_rows (int): Rows per chunk.
 
-    return df
+    Yields:
+        pd.DataFrame: Chunks with parsed dates, categorical county/state and nullable integer fips and counts.
+    """
+    with _get(COUNTY_URL, stream=True) as r:
+        r.raise_for_status()
+        r.raw.decode_content = True
+        reader = pd.read_csv(r.raw, chunksize=chunk_rows, dtype=COUNTY_DTYPES, parse_dates=['date'])
+        for chunk in reader:
+            yield chunk
+
+def county_data(normalize: bool = True, stream: bool = True) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
+    if stream:
+        if normalize:
+            return pandemics.processing.nyt_county_normalize_chunks(county_chunks())
+        return pd.concat(county_chunks(), ignore_index=True)
 
-def county_data(normalize: bool = True) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
-    r = requests.get('https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv', headers=headers)
+    text = get_text(COUNTY_URL)
     
-    stream = StringIO(r.text)
-    df = pd.read_csv(stream)
+    buffer = StringIO(text)
+    df = pd.read_csv(buffer)
     
     if normalize:
         df = pandemics.processing.nyt_county_normalize(df)
     return df
 
 def world_data(normalize: bool = True) -> pd.DataFrame:
-    r = requests.get('https://docs.google.com/spreadsheets/u/0/d/e/2PACX-1vR30F8lYP3jG7YOq8es0PBpJIE5yvRVZffOyaqC0GgMBN6yt0Q-NI8pxS7hd1F9dYXnowSC6zpZmW9D/pubhtml/sheet?headers=false&gid=0&range=A1:I183', headers=headers)
-    soup = BeautifulSoup(r.text, 'lxml')
-
-    tbody = soup.find('tbody')
-    raw_rows = tbody.find_all('tr')[7:-3]
-    rows = []
-
-    for row in raw_rows:
-        tds = row.find_all('td')
-        country = tds[0].string
-        cases = try_int(tds[1].string)
-        new_cases = try_int(tds[2].string)
-        deaths = try_int(tds[3].string)
-        new_deaths = try_int(tds[4].string)
-        percent_deaths = float(tds[5].string[:-1]) * .01
-        percent_deaths = round(percent_deaths, 4)
-        serious_and_critical = try_int(tds[6].string)
-        recovered = try_int(tds[7].string)
-
-        lat, lon = geocode(geocoder, country)
-        rows.append((country, cases, new_cases, deaths, new_deaths,
-                     percent_deaths, serious_and_critical, recovered,
-                     lat, lon))
-    
-    rows.sort(key=lambda r: r[0])
+    text = get_text(WORLD_URL)
+
+    df = extract_table(text, WORLD_SHEET)
+    df = _locate(df, 'country')
 
-    df = pd.DataFrame(rows, columns=('country', 'cases', 'new_cases', 'deaths', 'new_deaths', 
-                                'percent_deaths', 'serious_and_critical', 'recovered',
-                                'latitude', 'longitude'))
     if normalize:
         df = pandemics.processing.unh_world_normalize(df)
     return df
 
 def canada_province_data() -> pd.DataFrame:
-    r = requests.get('https://docs.google.com/spreadsheets/u/0/d/e/2PACX-1vR30F8lYP3jG7YOq8es0PBpJIE5yvRVZffOyaqC0GgMBN6yt0Q-NI8pxS7hd1F9dYXnowSC6zpZmW9D/pubhtml/sheet?headers=false&gid=338130207', headers=headers)
-    soup = BeautifulSoup(r.text, 'lxml')
-
-    tbody = soup.find('tbody')
-    raw_rows = tbody.find_all('tr')[5:-1]
-    rows = []
-
-    for row in raw_rows:
-        tds = row.find_all('td')
+    text = get_text(CANADA_URL)
 
-        province = tds[0].string
-        cases = try_int(tds[1].string)
-        deaths = try_int(tds[2].string)
-        serious = try_int(tds[3].string)
-        critical = try_int(tds[4].string)
-        recovered = try_int(tds[5].string)
-
-        lat, lon = geocode(geocoder, f'{province}, Canada')
-
-        rows.append((province, cases, deaths, serious, critical, recovered, lat, lon))
-    
-    rows.sort(key=lambda r: r[0])
-    
-    return pd.DataFrame(rows, columns=('province', 'cases', 'deaths', 'serious', 'critical', 'recovered', 'latitude', 'longitude'))
+    df = extract_table(text, CANADA_SHEET)
+    return _locate(df, 'province', suffix=', Canada')
@@ -0,0 +1,135 @@
+import numpy as np
+import os
+import tempfile
+import threading
+import time
+from typing import *
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+GAZETTEER_PATH = 'county_gazetteer.npz'
+# Bump when the layout of the file changes so old files are rebuilt
+GAZETTEER_VERSION = 1
+# County coordinates hardly ever change, rebuild from the county table monthly
+GAZETTEER_TTL = 30 * 24 * 60 * 60
+# Seconds to keep using a stale gazetteer after a failed rebuild before trying again
+GAZETTEER_RETRY = 60 * 60
+
+class Gazetteer(NamedTuple):
+    """Coordinates of every county, indexed by integer FIPS code.
+
+    fips is a sorted int32 array and latitude/longitude are float64 arrays aligned with it,
+    kept at full precision so the county CSVs do not change.
+    """
+    fips: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    built: float
+    version: int = GAZETTEER_VERSION
+
+    def lookup(self, fips: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the coordinates of many FIPS codes at once.
+
+        Args:
+            fips (Any): Codes as numbers, NaN for rows that have none.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Latitudes and longitudes, NaN where a code is missing or unknown.
+        """
+        codes = np.asarray(fips, dtype='float64')
+        latitude = np.full(len(codes), np.nan)
+        longitude = np.full(len(codes), np.nan)
+        known = np.flatnonzero(~np.isnan(codes))
+        if not len(known) or not len(self.fips):
+            return latitude, longitude
+
+        pos = np.minimum(np.searchsorted(self.fips, codes[known]), len(self.fips) - 1)
+        hit = self.fips[pos] == codes[known]
+        latitude[known[hit]] = self.latitude[pos[hit]]
+        longitude[known[hit]] = self.longitude[pos[hit]]
+        return latitude, longitude
+
+def build(table: 'pd.DataFrame') -> Gazetteer:
+    """Builds a gazetteer from a fips, latitude, longitude table like pandemics.fetch.county_table returns.
+
+    Codes that are not numbers are dropped, and a code listed twice keeps its first coordinates.
+    """
+    import pandas as pd
+    codes = pd.to_numeric(table.fips, errors='coerce')
+    table = table.assign(fips=codes)[codes.notna()].drop_duplicates('fips')
+    table = table.sort_values('fips', kind='stable')
+    return Gazetteer(
+        table.fips.to_numpy(dtype='int32'),
+        table.latitude.to_numpy(dtype='float64'),
+        table.longitude.to_numpy(dtype='float64'),
+        time.time()
+    )
+
+def save(gazetteer: Gazetteer, path: str = GAZETTEER_PATH) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            np.savez(fp, **gazetteer._asdict())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def load(path: str = GAZETTEER_PATH) -> Gazetteer:
+    with np.load(path) as data:
+        return Gazetteer(data['fips'], data['latitude'], data['longitude'], float(data['built']), int(data['version']))
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+# time.time() before which a failed rebuild is not retried
+_retry_at = 0.0
+
+def set_gazetteer(gazetteer: Optional[Gazetteer]) -> None:
+    """Sets the gazetteer get_gazetteer returns, None to load it from disk again on next use."""
+    global _gazetteer, _retry_at
+    with _gazetteer_lock:
+        _gazetteer = gazetteer
+        _retry_at = 0.0
+
+def get_gazetteer(path: str = GAZETTEER_PATH, ttl: float = GAZETTEER_TTL) -> Gazetteer:
+    """Returns the county gazetteer, building it from the county table when needed.
+
+    The file at path is loaded once per process. It is only rebuilt, which downloads the county
+    table, when it is missing, older than ttl or from an older version of this module. A stale
+    gazetteer is kept unchanged when the rebuild fails, and the rebuild is retried after
+    GAZETTEER_RETRY seconds.
+
+    Args:
+        path (str): Where the gazetteer is stored.
+        ttl (float): Seconds after which it is rebuilt.
+
+    Returns:
+        Gazetteer: The gazetteer.
+    """
+    global _gazetteer, _retry_at
+    with _gazetteer_lock:
+        gazetteer = _gazetteer
+        if gazetteer is None and os.path.exists(path):
+            gazetteer = load(path)
+        now = time.time()
+        if gazetteer is not None and gazetteer.version == GAZETTEER_VERSION and (now - gazetteer.built < ttl or now < _retry_at):
+            _gazetteer = gazetteer
+            return gazetteer
+
+        import pandemics.fetch
+        try:
+            fresh = build(pandemics.fetch.county_table())
+        except Exception as e:
+            if gazetteer is None or gazetteer.version != GAZETTEER_VERSION:
+                raise
+            print(f'Could not rebuild the county gazetteer, keeping the old one: {e}')
+            # built is left alone, it is part of the county stage's fingerprint and matches the file
+            _retry_at = now + GAZETTEER_RETRY
+            fresh = gazetteer
+        else:
+            save(fresh, path)
+            print(f'Built county gazetteer with {len(fresh.fips)} counties')
+        _gazetteer = fresh
+        return fresh
@@ -0,0 +1,206 @@
+import shelve
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+import pandemics.metrics
+
+if TYPE_CHECKING:
+    from geopy.geocoders.base import Geocoder
+
+SHELF_PATH = 'latlon.shelve'
+
+# Names that could not be geocoded are retried once this many seconds have passed
+NEGATIVE_TTL = 24 * 60 * 60
+# Nominatim's usage policy allows one request per second
+MIN_INTERVAL = 1.0
+MAX_WORKERS = 4
+
+# Shelf keys holding the time a name last failed to geocode
+_NEGATIVE_PREFIX = '__negative__:'
+
+# Locations the geocoder gets wrong or cannot find
+KNOWN_LOCATIONS = {
+    'Bhutan': (27.5142, 90.4336), # NE
+    'Bosnia and Herzegovina': (43.9159, 17.6791), # NE
+    'Cabo Verde': (16.5388, -23.0418), #NW
+    'Central African Republic': (6.6111, 20.9394), # NE
+    'Chad': (15.4542, 18.7322), # NE
+    'Eswatini': (-26.5225, 31.4659), # SE
+    'Gambia': (13.4432, -15.3101), # NW
+    'Holy See': (41.9029, 12.4534), # NE
+    'Mauritania': (21.0079, -10.9408), # NW
+    'Nepal': (28.3949, 84.1240), # NE
+    'Nicaragua': (12.8654, -85.2072), # NW
+    'Papua New Guinea': (-6.3150, 143.9555), # SE
+    'Saint Vincent and the Grenadines': (12.9843, -61.2872), # NW
+    'Somalia': (5.1521, 46.1996), # NE
+    'Zimbabwe': (-19.0154, 29.1549), # SE
+    'Dominica': (15.4150, -61.3710), # NW
+    'Timor-Leste': (-8.8742, 125.7275), # SE
+    'Belize': (17.1899, -88.4976), # NW
+    'West Bank and Gaza': (31.9466, 35.3027), # NE
+    'Saint Kitts and Nevis': (17.3578, -62.7830), # NW
+    'Burma': (21.9162, 95.9560), # NE
+    'MS Zaandam': (26.0851, -80.1167), # NW
+    'Botswana': (-22.3285, 24.6849), # SE
+    'Burundi': (-3.3731, 29.9189), # SE
+    'Sierra Leone': (8.4606, -11.7799), # NW
+    'Malawi': (-13.2543, 34.3015), # SE
+    'South Sudan': (6.8770, 31.3070), # NE
+    'Western Sahara': (24.2155, -12.8858), # NW
+    'Georgia': (42.3154, 43.3569), # NE
+    'Washington, United States': (47.7511, -120.7401)
+}
+
+LatLon = Union[Tuple[float, float], Tuple[None, None]]
+
+class LocationCache:
+    """In-process view of a lat/lon shelf.
+
+    The shelf is read once when the cache is created, after which lookups never touch dbm.
+    New results are written through to the shelf so they survive restarts. Failed lookups
+    are remembered with the time they failed and expire after negative_ttl seconds.
+    """
+
+    def __init__(self, path: str = SHELF_PATH, negative_ttl: float = NEGATIVE_TTL):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.locations = {}
+        self.negatives = {}
+        self._lock = threading.Lock()
+        self._shelf = shelve.open(path)
+
+        for key in self._shelf:
+            value = self._shelf[key]
+            if key.startswith(_NEGATIVE_PREFIX):
+                self.negatives[key[len(_NEGATIVE_PREFIX):]] = value
+            elif value[0] is None:
+                # Failures cached forever by older versions, retry them on first use
+                self.negatives[key] = 0.0
+            else:
+                self.locations[key] = value
+
+        for name, latlon in KNOWN_LOCATIONS.items():
+            self.put(name, latlon)
+        self._shelf.sync()
+
+    def get(self, name: str) -> Optional[LatLon]:
+        """Looks a name up without geocoding it.
+
+        Returns:
+            Optional[LatLon]: The cached coordinates, (None, None) for a recent failure or None when unknown.
+        """
+        latlon = self.locations.get(name)
+        if latlon is not None:
+            return latlon
+        failed = self.negatives.get(name)
+        if failed is not None and time.time() - failed < self.negative_ttl:
+            return None, None
+        return None
+
+    def put(self, name: str, latlon: LatLon) -> None:
+        with self._lock:
+            if latlon[0] is None:
+                now = time.time()
+                self.negatives[name] = now
+                self._shelf[_NEGATIVE_PREFIX + name] = now
+                return
+            if self.locations.get(name) == latlon:
+                return
+            self.locations[name] = latlon
+            self.negatives.pop(name, None)
+            self._shelf[name] = latlon
+            if _NEGATIVE_PREFIX + name in self._shelf:
+                del self._shelf[_NEGATIVE_PREFIX + name]
+
+    def sync(self) -> None:
+        with self._lock:
+            self._shelf.sync()
+
+    def close(self) -> None:
+        # Some dbm backends lock the file until it is closed
+        with self._lock:
+            self._shelf.close()
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_cache(path: str = SHELF_PATH) -> LocationCache:
+    """Returns the cache for path, loading it from the shelf on first use."""
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = LocationCache(path)
+        return _caches[path]
+
+class RateLimiter:
+    """Spaces out calls from any number of threads by at least min_interval seconds."""
+
+    def __init__(self, min_interval: float = MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+_limiter = RateLimiter()
+
+def lookup(geocoder: 'Geocoder', location: str) -> LatLon:
+    """Geocodes a single location, returning (None, None) when it cannot be found."""
+    from geopy.exc import GeopyError
+    try:
+        loc = geocoder.geocode(location)
+    except GeopyError:
+        return None, None
+    else:
+        lat = loc.latitude if loc else None
+        lon = loc.longitude if loc else None
+        return lat, lon
+
+@pandemics.metrics.timed('geocode')
+def geocode_many(geocoder: 'Geocoder', locations: Iterable[str], path: str = SHELF_PATH,
+                 max_workers: int = MAX_WORKERS) -> Dict[str, LatLon]:
+    """Resolves every location a scrape needs in one batch.
+
+    Cached names are answered from memory. The misses are deduplicated and geocoded
+    concurrently, with requests spaced out by the shared rate limiter.
+
+    Args:
+        geocoder (Geocoder): The geocoder to use for names that are not cached.
+        locations (Iterable[str]): The names to resolve, duplicates are fine.
+        path (str): The shelf backing the cache.
+        max_workers (int): Geocoding requests allowed in flight at once.
+
+    Returns:
+        Dict[str, LatLon]: Coordinates of every location, (None, None) for ones that could not be found.
+    """
+    cache = get_cache(path)
+    resolved = {}
+    misses = []
+    for location in dict.fromkeys(locations):
+        latlon = cache.get(location)
+        if latlon is None:
+            misses.append(location)
+        else:
+            resolved[location] = latlon
+
+    if not misses:
+        return resolved
+
+    def limited_lookup(location):
+        _limiter.wait()
+        return lookup(geocoder, location)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(misses))) as pool:
+        for location, latlon in zip(misses, pool.map(limited_lookup, misses)):
+            cache.put(location, latlon)
+            resolved[location] = latlon
+    cache.sync()
+
+    return resolved
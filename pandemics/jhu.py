@@ -0,0 +1,118 @@
+import pandas as pd
+import io
+import os
+import re
+import threading
+import zlib
+from typing import *
+
+# JHU's date headers, M/D/YY
+DATE_COLUMN = re.compile(r'^\d{1,2}/\d{1,2}/\d{2,4}$')
+
+class CachedSeries(NamedTuple):
+    mtime_ns: int
+    size: int
+    # Fields on the header, every line of a JHU CSV has as many
+    fields: int
+    # Checksum of the file's lines, see lines_digest
+    digest: int
+    # The columns before the dates, as read, to normalize appended dates with
+    keys: pd.DataFrame
+    frame: pd.DataFrame
+
+def lines_digest(lines: Iterable[bytes]) -> int:
+    # Only has to notice upstream edits, not tampering, and crc32 is several times faster than sha1
+    crc = 0
+    for line in lines:
+        crc = zlib.crc32(b'\n', zlib.crc32(line, crc))
+    return crc
+
+def key_columns(df: pd.DataFrame) -> List[str]:
+    return [col for col in df.columns if not DATE_COLUMN.match(str(col))]
+
+class SeriesCache:
+    """Keeps JHU timeseries CSVs parsed and normalized between cycles.
+
+    JHU rewrites every file daily only to add a date column at the end of each line. When a
+    file has grown, the part of each line that was there before is checked against a digest
+    of the lines read last time, and only the new trailing columns are parsed and normalized
+    and appended to the kept frame. When anything before them changed, e.g. upstream revised
+    past numbers or added a region, the file is reloaded in full.
+    """
+
+    def __init__(self):
+        self._series = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.full_reads = 0
+        self.appends = 0
+
+    def forget(self, path: Optional[str] = None) -> None:
+        with self._lock:
+            if path is None:
+                self._series.clear()
+            else:
+                for key in [k for k in self._series if k[0] == path]:
+                    del self._series[key]
+
+    def read(self, path: str, normalize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None) -> pd.DataFrame:
+        """Reads a JHU timeseries CSV, parsing as little of it as it can.
+
+        Args:
+            path (str): The CSV.
+            normalize (Optional[Callable]): Applied to the frame as read, must treat each date column on its own.
+
+        Returns:
+            pd.DataFrame: The same frame pd.read_csv and normalize would give, which the caller is free to modify.
+        """
+        key = (path, normalize)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            st = os.stat(path)
+            cached = self._series.get(key)
+            if cached is None or (cached.mtime_ns, cached.size) != (st.st_mtime_ns, st.st_size):
+                with open(path, 'rb') as fp:
+                    data = fp.read()
+                cached = (cached and self._append(cached, data, st, normalize)) or self._load(data, st, normalize)
+                self._series[key] = cached
+            return cached.frame.copy()
+
+    def _load(self, data: bytes, st: os.stat_result, normalize: Optional[Callable]) -> CachedSeries:
+        self.full_reads += 1
+        lines = data.splitlines()
+        raw = pd.read_csv(io.BytesIO(data))
+        keys = raw[key_columns(raw)]
+        frame = normalize(raw) if normalize else raw
+        return CachedSeries(st.st_mtime_ns, st.st_size, len(raw.columns), lines_digest(lines), keys, frame)
+
+    def _append(self, cached: CachedSeries, data: bytes, st: os.stat_result, normalize: Optional[Callable]) -> Optional[CachedSeries]:
+        lines = data.splitlines()
+        if not lines:
+            return None
+        # Header fields are never quoted
+        added = lines[0].count(b',') + 1 - cached.fields
+        if added <= 0:
+            return None
+
+        # Date values are plain numbers, so the new columns are the last fields of every line
+        parts = [line.rsplit(b',', added) for line in lines]
+        if any(len(p) != added + 1 for p in parts):
+            return None
+        if lines_digest(p[0] for p in parts) != cached.digest:
+            return None
+        # A row with no new numbers is an empty line, which still has to be a row
+        new = pd.read_csv(io.BytesIO(b'\n'.join(b','.join(p[1:]) for p in parts)), skip_blank_lines=False)
+        if not all(DATE_COLUMN.match(str(col)) for col in new.columns) or len(new) != len(cached.keys):
+            return None
+
+        self.appends += 1
+        dates = new.columns.tolist()
+        if normalize:
+            new = normalize(pd.concat([cached.keys, new], axis=1))
+            # Normalizing has to have kept the regions in the same order as the full frame
+            keys = key_columns(new)
+            if keys != key_columns(cached.frame) or not new[keys].equals(cached.frame[keys]):
+                return None
+        frame = pd.concat([cached.frame, new[dates].set_axis(cached.frame.index)], axis=1)
+        return CachedSeries(st.st_mtime_ns, st.st_size, cached.fields + added, lines_digest(lines), cached.keys, frame)
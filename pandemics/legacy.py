@@ -0,0 +1,53 @@
+import pandas as pd
+from datetime import datetime
+from typing import *
+import pandemics.tables
+
+def transpose_nyt_data(df: pd.DataFrame, expand: str) -> pd.DataFrame:
+    # The original per-date filter and merge reshape, kept as the baseline to beat
+    dates = list(set(df.date))
+    dates.sort(key=lambda d: datetime.strptime(d, '%m/%d/%y'))
+    join_on = ['county', 'state', 'fips']
+    state_county = set(map(tuple, df[join_on].values))
+    t = pd.DataFrame(state_county, columns=join_on)
+    for date in dates:
+        s = df[df.date == date][join_on + [expand]]
+        s = s.rename(columns={expand: date})
+        t = t.merge(s, on=join_on, how='left')
+    return t
+
+def take_greatest(df: pd.DataFrame, pk: str = 'country') -> pd.DataFrame:
+    # The original column-by-column take_greatest, kept to time the new engine against and in tests/test_reconcile.py
+    to_drop = {col for col in df.columns if col.endswith('_jhu') or col.endswith('_unh')}
+    dates = {col.split('_')[0] for col in df.columns if col != pk}
+
+    for date in dates:
+        df[date] = df.filter(like=date).max(axis=1)
+
+    df = df.drop(columns=to_drop)
+    date_cols = sorted(df.columns[3:], key=lambda d: datetime.strptime(d, '%m/%d/%y'))
+    df = df.astype({d:'Int64' for d in date_cols})
+    df = df[[pk, 'latitude', 'longitude'] + date_cols]
+
+    df.latitude = df.latitude.fillna(0.0)
+    df.longitude = df.longitude.fillna(0.0)
+
+    df.iloc[:, -1] = df.iloc[:, [-1, -2]].max(axis=1)
+    df = df.astype({date_cols[-1]: 'Int64'})
+
+    return df
+
+def world_rows(text: str) -> pd.DataFrame:
+    # The original BeautifulSoup cell loop from fetch.world_data, without geocoding
+    from bs4 import BeautifulSoup
+    from pandemics.utils import try_int
+
+    soup = BeautifulSoup(text, 'lxml')
+    tbody = soup.find('tbody')
+    rows = []
+    for row in tbody.find_all('tr')[7:-3]:
+        tds = row.find_all('td')
+        percent_deaths = round(float(tds[5].string[:-1]) * .01, 4)
+        rows.append((tds[0].string, try_int(tds[1].string), try_int(tds[2].string), try_int(tds[3].string),
+                     try_int(tds[4].string), percent_deaths, try_int(tds[6].string), try_int(tds[7].string)))
+    return pd.DataFrame(rows, columns=[c.name for c in pandemics.tables.WORLD_SHEET.columns])
@@ -0,0 +1,228 @@
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from typing import *
+
+if TYPE_CHECKING:
+    from http.server import HTTPServer
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# CPU time of the calling thread where the platform supports it
+_cpu_time = getattr(time, 'thread_time', time.process_time)
+
+class StageRecord:
+    """What one run of a stage did, filled in by the stage and by the stage context manager.
+
+    Set rows and bytes inside the with block to report how much the stage processed.
+    """
+
+    def __init__(self, name: str, labels: Dict[str, Any]):
+        self.name = name
+        self.labels = labels
+        self.rows = None
+        self.bytes = None
+        self.status = 'ok'
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.max_rss_mb = None
+        self.traced_peak_mb = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        record = {'stage': self.name, **self.labels, 'status': self.status,
+                  'wall_s': round(self.wall_s, 6), 'cpu_s': round(self.cpu_s, 6)}
+        for key in ('rows', 'bytes', 'max_rss_mb', 'traced_peak_mb'):
+            value = getattr(self, key)
+            if value is not None:
+                record[key] = value
+        return record
+
+class Registry:
+    """Running totals per stage, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._last = {}
+
+    def add(self, record: StageRecord) -> None:
+        key = (record.name, record.status)
+        with self._lock:
+            totals = self._totals.setdefault(key, {'runs': 0, 'seconds': 0.0, 'cpu_seconds': 0.0, 'rows': 0, 'bytes': 0})
+            totals['runs'] += 1
+            totals['seconds'] += record.wall_s
+            totals['cpu_seconds'] += record.cpu_s
+            totals['rows'] += record.rows or 0
+            totals['bytes'] += record.bytes or 0
+            self._last[record.name] = record.wall_s
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for metric, kind in (('runs', 'counter'), ('seconds', 'counter'), ('cpu_seconds', 'counter'),
+                                 ('rows', 'counter'), ('bytes', 'counter')):
+                name = f'pandemics_stage_{metric}_total'
+                lines.append(f'# TYPE {name} {kind}')
+                for (stage, status), totals in sorted(self._totals.items()):
+                    lines.append(f'{name}{{stage="{stage}",status="{status}"}} {totals[metric]}')
+            lines.append('# TYPE pandemics_stage_last_seconds gauge')
+            for stage, seconds in sorted(self._last.items()):
+                lines.append(f'pandemics_stage_last_seconds{{stage="{stage}"}} {seconds}')
+        rss = max_rss_mb()
+        if rss is not None:
+            lines.append('# TYPE pandemics_max_rss_bytes gauge')
+            lines.append(f'pandemics_max_rss_bytes {int(rss * 2 ** 20)}')
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+# Lists collecting the records of the stages each thread runs, see recorded
+_collecting = threading.local()
+
+def max_rss_mb() -> Optional[float]:
+    """The process's peak resident memory so far, in MiB."""
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def count(result: Any) -> Tuple[Optional[int], Optional[int]]:
+    """Works out the rows or bytes a stage returned, for stages that do not report them."""
+    # A stage that returned a table has loaded its module already
+    tables = ()
+    pd = sys.modules.get('pandas')
+    if pd is not None:
+        tables += (pd.DataFrame,)
+    compact = sys.modules.get('pandemics.compact')
+    if compact is not None:
+        tables += (compact.CompactTable,)
+    if tables and isinstance(result, tables):
+        return len(result), None
+    if isinstance(result, (bytes, str)):
+        return None, len(result)
+    if isinstance(result, dict):
+        return len(result), None
+    if tables and isinstance(result, tuple) and result and all(isinstance(r, tables) for r in result):
+        return sum(len(r) for r in result), None
+    return None, None
+
+@contextmanager
+def stage(name: str, **labels) -> Iterator[StageRecord]:
+    """Measures the block it wraps as one run of a stage.
+
+    Wall time, CPU time of the calling thread and the process's peak memory are recorded, plus
+    the peak traced Python memory when tracemalloc is running. The record is logged as JSON
+    and added to the Prometheus registry, also when the block raises.
+
+    Args:
+        name (str): The stage, e.g. fetch, parse or join.
+        **labels: Extra fields identifying the run, e.g. url or file.
+
+    Yields:
+        StageRecord: Set its rows and bytes to report how much was processed.
+    """
+    record = StageRecord(name, labels)
+    tracing = tracemalloc.is_tracing()
+    if tracing and hasattr(tracemalloc, 'reset_peak'):
+        # Shared by every thread, so the peak of concurrent stages is approximate
+        tracemalloc.reset_peak()
+    wall = time.perf_counter()
+    cpu = _cpu_time()
+    try:
+        yield record
+    except BaseException:
+        record.status = 'error'
+        raise
+    finally:
+        record.wall_s = time.perf_counter() - wall
+        record.cpu_s = _cpu_time() - cpu
+        record.max_rss_mb = max_rss_mb()
+        if tracing:
+            record.traced_peak_mb = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        registry.add(record)
+        logger.info(json.dumps(record.as_dict(), default=str))
+        for records in getattr(_collecting, 'lists', ()):
+            records.append(record)
+
+@contextmanager
+def recorded() -> Iterator[List[StageRecord]]:
+    """Collects the record of every stage the calling thread runs inside the block.
+
+    Worker processes have their own registry, so they hand these back to the parent to merge.
+    """
+    records = []
+    lists = getattr(_collecting, 'lists', [])
+    _collecting.lists = lists + [records]
+    try:
+        yield records
+    finally:
+        _collecting.lists = lists
+
+def merge(records: Iterable[StageRecord], **labels) -> None:
+    """Adds records of stages run in another process to this one's registry and log."""
+    for record in records:
+        record.labels = {**record.labels, **labels}
+        registry.add(record)
+        logger.info(json.dumps(record.as_dict(), default=str))
+
+def timed(name: str, **labels) -> Callable:
+    """Decorates a function so every call is measured as a run of stage name.
+
+    Rows or bytes are taken from what the function returns when it is a DataFrame, a tuple
+    of them, or bytes.
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, func=func.__name__, **labels) as record:
+                result = func(*args, **kwargs)
+                record.rows, record.bytes = count(result)
+            return result
+        return wrapper
+    return decorator
+
+def serve(port: int, host: str = '127.0.0.1') -> 'HTTPServer':
+    """Serves the registry at http://host:port/metrics from a background thread.
+
+    Args:
+        port (int): Port to listen on.
+        host (str): Address to bind, local only by default.
+
+    Returns:
+        HTTPServer: The running server, shut it down with server.shutdown().
+    """
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
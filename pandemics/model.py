@@ -0,0 +1,212 @@
+import pandas as pd
+import numpy as np
+from datetime import datetime
+from typing import *
+import pandemics.compact
+import pandemics.reconcile
+import pandemics.utils
+
+class LongTable(NamedTuple):
+    """A timeseries held as one row per region, date and source.
+
+    values has the columns key and source (categoricals), date (datetime64) and value (int64),
+    with a row for every cell that has a number. coords holds latitude and longitude for every
+    region of the table, indexed by key in output order, so regions without any numbers are
+    kept. dates lists every date of the table, including ones no source has numbers for.
+    """
+    values: pd.DataFrame
+    coords: pd.DataFrame
+    dates: pd.DatetimeIndex
+
+def _compact(values: pd.DataFrame, keys: pd.Index) -> pd.DataFrame:
+    values['key'] = pd.Categorical(values.key, categories=keys)
+    values['source'] = values.source.astype('category')
+    return values
+
+def _unique_keys(keys: Iterable[Any]) -> pd.Index:
+    return pd.Index(list(dict.fromkeys(keys)), name='key')
+
+def from_wide(df: pd.DataFrame, pk: str, source: str) -> LongTable:
+    """Converts a wide table with M/D/YY date columns into a LongTable.
+
+    Date columns may carry a _<source> suffix, as left by merging two sources side by side,
+    in which case the suffix is used as the cell's source instead of source.
+
+    Args:
+        df (pd.DataFrame): The wide table, with pk, latitude and longitude columns.
+        pk (str): The region column.
+        source (str): Where the numbers came from.
+
+    Returns:
+        LongTable: The same numbers in long form.
+    """
+    date_cols = [col for col in df.columns if '/' in col]
+    labels = [col.split('_')[0] for col in date_cols]
+    sources = np.array([col.split('_')[1] if '_' in col else source for col in date_cols], dtype=object)
+
+    dates = pandemics.utils.parse_date_labels(labels)
+    unique_dates = dates.unique()
+
+    keys = df[pk].to_numpy()
+    cells = df[date_cols].to_numpy(dtype='float64', na_value=np.nan)
+    rows, cols = np.nonzero(~np.isnan(cells))
+
+    values = pd.DataFrame({
+        'key': keys[rows],
+        'date': dates.values[cols],
+        'source': sources[cols],
+        'value': cells[rows, cols].astype('int64')
+    })
+
+    coords = pd.DataFrame({
+        'latitude': df.latitude.to_numpy(dtype='float64'),
+        'longitude': df.longitude.to_numpy(dtype='float64')
+    }, index=pd.Index(keys, name='key'))
+    coords = coords[~coords.index.duplicated()]
+
+    return LongTable(_compact(values, coords.index), coords, unique_dates.sort_values())
+
+def from_snapshot(df: pd.DataFrame, pk: str, column: str, date: datetime, source: str) -> LongTable:
+    """Converts one column of a scraped snapshot into a LongTable dated date.
+
+    Args:
+        df (pd.DataFrame): The snapshot, with pk, latitude and longitude columns.
+        pk (str): The region column.
+        column (str): The column holding the numbers.
+        date (datetime): The day the snapshot is for.
+        source (str): Where the numbers came from.
+
+    Returns:
+        LongTable: The snapshot as a single day of data.
+    """
+    snapshot = df[[pk, 'latitude', 'longitude', column]]
+    snapshot = snapshot.rename(columns={column: pandemics.utils.format_date(date)})
+    return from_wide(snapshot, pk, source)
+
+def combine(tables: Sequence[LongTable], coords_from: int = -1) -> LongTable:
+    """Stacks the numbers of several sources for the same regions.
+
+    Regions keep the order they first appear in across tables, like an outer merge.
+
+    Args:
+        tables (Sequence[LongTable]): The tables to combine.
+        coords_from (int): Index of the table whose coordinates are kept, other regions get none.
+
+    Returns:
+        LongTable: Every source's numbers, not yet reconciled.
+    """
+    keys = _unique_keys(key for table in tables for key in table.coords.index)
+    values = pd.concat([table.values.astype({'key': object, 'source': object}) for table in tables], ignore_index=True)
+    coords = tables[coords_from].coords.reindex(keys)
+    dates = tables[0].dates
+    for table in tables[1:]:
+        dates = dates.union(table.dates)
+    return LongTable(_compact(values, keys), coords, dates)
+
+def truncate(table: LongTable, end: datetime) -> LongTable:
+    """Drops every date after end, as if the table had been built that day."""
+    end = pd.Timestamp(end)
+    values = table.values[table.values.date <= end].reset_index(drop=True)
+    return LongTable(values, table.coords, table.dates[table.dates <= end])
+
+def to_matrices(table: LongTable) -> Tuple[List[str], List[np.ndarray]]:
+    """Lays each source's numbers out on the table's regions x dates grid.
+
+    Args:
+        table (LongTable): The table to lay out.
+
+    Returns:
+        Tuple[List[str], List[np.ndarray]]: The sources and a float64 matrix for each, NaN where it has no number.
+    """
+    values = table.values
+    rows = values.key.cat.codes.to_numpy()
+    cols = table.dates.get_indexer(values.date)
+    sources = list(values.source.cat.categories)
+    codes = values.source.cat.codes.to_numpy()
+    cells = values.value.to_numpy(dtype='float64')
+
+    matrices = []
+    for i in range(len(sources)):
+        matrix = np.full((len(table.coords), len(table.dates)), np.nan)
+        mine = codes == i
+        np.fmax.at(matrix, (rows[mine], cols[mine]), cells[mine])
+        matrices.append(matrix)
+    return sources, matrices
+
+def reconcile(table: LongTable, monotonic: Optional[str] = 'last') -> LongTable:
+    """Keeps the greatest number reported for each region and date.
+
+    The source column of the result is the source that reported it.
+
+    Args:
+        table (LongTable): Numbers from one or more sources.
+        monotonic (Optional[str]): How to stop cumulative counts from decreasing, see pandemics.reconcile.reconcile.
+
+    Returns:
+        LongTable: One number per region and date.
+    """
+    sources, matrices = to_matrices(table)
+    if not matrices:
+        return table
+    result = pandemics.reconcile.reconcile(matrices, monotonic=monotonic)
+
+    rows, cols = np.nonzero(~np.isnan(result.values))
+    values = pd.DataFrame({
+        'key': pd.Categorical.from_codes(rows, categories=table.coords.index),
+        'date': table.dates.values[cols],
+        'source': pd.Categorical.from_codes(result.winner[rows, cols], categories=sources),
+        'value': result.values[rows, cols].astype('int64')
+    })
+    return LongTable(values, table.coords, table.dates)
+
+def to_compact(table: LongTable, pk: str) -> pandemics.compact.CompactTable:
+    """Widens a reconciled LongTable into a CompactTable, laid out like to_wide's result."""
+    values = table.values
+    rows = values.key.cat.codes.to_numpy()
+    cols = table.dates.get_indexer(values.date)
+    cells = values.value.to_numpy()
+
+    counts = np.zeros((len(table.coords), len(table.dates)), dtype=pandemics.compact.count_dtype(cells))
+    valid = np.zeros(counts.shape, dtype=bool)
+    counts[rows, cols] = cells
+    valid[rows, cols] = True
+
+    coords = table.coords.fillna(0.0)
+    keys = pd.DataFrame({pk: coords.index, 'latitude': coords.latitude.to_numpy(), 'longitude': coords.longitude.to_numpy()})
+    return pandemics.compact.CompactTable(pandemics.compact.compact_keys(keys), pandemics.utils.format_dates(table.dates), counts, valid)
+
+def to_wide(table: LongTable, pk: str, by_source: bool = False,
+            compact: bool = False) -> Union[pd.DataFrame, pandemics.compact.CompactTable]:
+    """Widens a LongTable into our CSV layout: pk, latitude, longitude and a column per date.
+
+    Args:
+        table (LongTable): The table to widen, reconciled unless by_source.
+        pk (str): Name of the region column.
+        by_source (bool): Give each source its own <date>_<source> columns instead.
+        compact (bool): Return a CompactTable instead, unless by_source.
+
+    Returns:
+        Union[pd.DataFrame, CompactTable]: The wide table with Int64 date columns, or its compact form.
+    """
+    if compact and not by_source:
+        return to_compact(table, pk)
+
+    keys = table.coords.index
+    if by_source:
+        wide = table.values.pivot(index='key', columns=['date', 'source'], values='value')
+        wide = wide.reindex(index=keys).sort_index(axis=1)
+        dates = pandemics.utils.format_dates(wide.columns.get_level_values(0))
+        wide.columns = [f'{date}_{source}' for date, source in zip(dates, wide.columns.get_level_values(1))]
+    else:
+        wide = table.values.pivot(index='key', columns='date', values='value')
+        wide = wide.reindex(index=keys, columns=table.dates)
+        wide.columns = pandemics.utils.format_dates(table.dates)
+    wide = wide.astype('Int64')
+
+    coords = table.coords
+    if not by_source:
+        coords = coords.fillna(0.0)
+
+    df = pd.concat([coords, wide], axis=1)
+    df.index.name = pk
+    return df.reset_index()
@@ -0,0 +1,175 @@
+import pandas as pd
+import numpy as np
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from os.path import join
+from typing import *
+import pandemics.compact
+import pandemics.fetch
+import pandemics.metrics
+import pandemics.processing
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+MAX_WORKERS = os.cpu_count() or 1
+# Workers are started from a server process instead of forked from whichever scheduler thread needs
+# the pool first, so they never inherit a lock another thread was holding at the time
+START_METHOD = 'forkserver'
+# Schema metadata marking Arrow files that hold a CompactTable
+COMPACT_KEY = b'pandemics'
+COMPACT_METADATA = {COMPACT_KEY: b'compact'}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def is_available() -> bool:
+    return pa is not None
+
+def _init_worker(compact: bool) -> None:
+    # Workers import the package afresh, settings the parent changed have to be passed on
+    pandemics.processing.COMPACT = compact
+
+def get_pool(max_workers: int = MAX_WORKERS) -> ProcessPoolExecutor:
+    """Returns the shared process pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context(START_METHOD) if START_METHOD in multiprocessing.get_all_start_methods() else None
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker,
+                                        initargs=(pandemics.processing.COMPACT,))
+        return _pool
+
+def _recorded(func: Callable, *args) -> Tuple[Any, List[pandemics.metrics.StageRecord]]:
+    # Runs func in a worker, handing back the stages it ran along with its result
+    with pandemics.metrics.recorded() as records:
+        result = func(*args)
+    return result, records
+
+def _result(future) -> Any:
+    result, records = future.result()
+    pandemics.metrics.merge(records, process='worker')
+    return result
+
+def write_frame(df: Union[pd.DataFrame, pandemics.compact.CompactTable], path: str) -> str:
+    """Writes df to an uncompressed Arrow IPC file, which read_frame can map without copying.
+
+    A CompactTable is written as its key columns and a column per date whose nulls are its
+    validity mask, so neither side goes through an Int64 DataFrame.
+    """
+    if isinstance(df, pandemics.compact.CompactTable):
+        arrays = [pa.Array.from_pandas(df.keys[col]) for col in df.keys.columns]
+        arrays += [pa.array(df.counts[:, i], mask=~df.valid[:, i]) for i in range(len(df.labels))]
+        table = pa.Table.from_arrays(arrays, names=df.columns, metadata=COMPACT_METADATA)
+    else:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    feather.write_feather(table, path, compression='uncompressed')
+    return path
+
+def read_frame(path: str) -> Union[pd.DataFrame, pandemics.compact.CompactTable]:
+    table = feather.read_table(path, memory_map=True)
+    if (table.schema.metadata or {}).get(COMPACT_KEY) != COMPACT_METADATA[COMPACT_KEY]:
+        return table.to_pandas()
+
+    labels = [name for name in table.column_names if '/' in name]
+    keys = table.select([name for name in table.column_names if name not in labels]).to_pandas()
+    dtype = table.schema.field(labels[0]).type.to_pandas_dtype() if labels else pandemics.compact.COUNT_DTYPES[0]
+    counts = np.empty((table.num_rows, len(labels)), dtype=dtype)
+    valid = np.empty(counts.shape, dtype=bool)
+    for i, label in enumerate(labels):
+        column = table.column(label)
+        counts[:, i] = column.fill_null(0).to_numpy()
+        valid[:, i] = column.is_valid().to_numpy()
+    return pandemics.compact.CompactTable(keys, labels, counts, valid)
+
+def _world_series(jhu_path: str, unh_path: str, column: str, today: datetime, greatest: bool, out_path: str) -> str:
+    df = pandemics.processing.join_world_series(read_frame(jhu_path), read_frame(unh_path), column, today, greatest)
+    return write_frame(df, out_path)
+
+def _state_series(jhu_path: str, unh_path: str, column: str, today: datetime, greatest: bool, out_path: str) -> str:
+    df = pandemics.processing.join_state_series(read_frame(jhu_path), read_frame(unh_path), column, today, greatest)
+    return write_frame(df, out_path)
+
+def _county_update(normalize: bool, confirmed_path: str, deaths_path: str) -> Tuple[str, str]:
+    confirmed, deaths = pandemics.processing.get_county_update(normalize)
+    return write_frame(confirmed, confirmed_path), write_frame(deaths, deaths_path)
+
+def _run_series(func: Callable, read: Callable[[str, bool], pd.DataFrame], jhu_timeseries_path: str, csvs: Sequence[str],
+                snapshot: pd.DataFrame, columns: Sequence[str], normalize: bool, greatest: bool,
+                pool: Optional[ProcessPoolExecutor]) -> List[pd.DataFrame]:
+    pool = pool or get_pool()
+    today = pandemics.processing.snapshot_date()
+    tmp = tempfile.mkdtemp(prefix='pandemics-')
+    try:
+        # Workers get the snapshot and hand back their tables as Arrow files instead of pickles
+        unh_path = write_frame(snapshot, join(tmp, 'snapshot.arrow'))
+        # The JHU series are read here, so the parent's cache only parses what JHU appended since the last cycle
+        jhu_paths = [write_frame(read(join(jhu_timeseries_path, csv), normalize), join(tmp, f'jhu_{column}.arrow'))
+                     for csv, column in zip(csvs, columns)]
+        futures = [
+            pool.submit(_recorded, func, jhu_path, unh_path, column, today, greatest, join(tmp, f'{column}.arrow'))
+            for jhu_path, column in zip(jhu_paths, columns)
+        ]
+        return [read_frame(_result(future)) for future in futures]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def get_world_update(jhu_timeseries_path: str, normalize: bool = True, greatest: bool = True,
+                     pool: Optional[ProcessPoolExecutor] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Same as pandemics.processing.get_world_update, with each series built in its own process.
+
+    Our world page is fetched and geocoded once, here, and shared with the workers.
+
+    Args:
+        jhu_timeseries_path (str): The JHU timeseries folder.
+        normalize (bool): Normalize the data.
+        greatest (bool): Keep the greatest number per date instead of both sources' columns.
+        pool (Optional[ProcessPoolExecutor]): Pool to run in, the shared one when None.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]: The confirmed, recovered and deaths tables.
+    """
+    print('getting world update in parallel')
+    unh_world = pandemics.fetch.world_data(normalize=normalize)
+    csvs = [pandemics.processing.JHU_WORLD_CONFIRMED_CSV, pandemics.processing.JHU_WORLD_RECOVERED_CSV, pandemics.processing.JHU_WORLD_DEATHS_CSV]
+    confirmed, recovered, deaths = _run_series(_world_series, pandemics.processing.get_jhu_world_data, jhu_timeseries_path, csvs,
+                                               unh_world, ['cases', 'recovered', 'deaths'], normalize, greatest, pool)
+    return confirmed, recovered, deaths
+
+def get_state_update(jhu_timeseries_path: str, normalize: bool = True, greatest: bool = True,
+                     pool: Optional[ProcessPoolExecutor] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Same as pandemics.processing.get_state_update, with each series built in its own process.
+
+    Args:
+        jhu_timeseries_path (str): The JHU timeseries folder.
+        normalize (bool): Normalize the data.
+        greatest (bool): Keep the greatest number per date instead of both sources' columns.
+        pool (Optional[ProcessPoolExecutor]): Pool to run in, the shared one when None.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: The confirmed and deaths tables.
+    """
+    print('getting state update in parallel')
+    unh_state = pandemics.fetch.state_data(normalize=normalize)
+    csvs = [pandemics.processing.JHU_STATE_CONFIRMED_CSV, pandemics.processing.JHU_STATE_DEATHS_CSV]
+    confirmed, deaths = _run_series(_state_series, pandemics.processing.get_jhu_state_data, jhu_timeseries_path, csvs,
+                                    unh_state, ['cases', 'deaths'], normalize, greatest, pool)
+    return confirmed, deaths
+
+def get_county_update(normalize: bool = True, pool: Optional[ProcessPoolExecutor] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Same as pandemics.processing.get_county_update, run in a worker process."""
+    pool = pool or get_pool()
+    tmp = tempfile.mkdtemp(prefix='pandemics-')
+    try:
+        paths = _result(pool.submit(_recorded, _county_update, normalize, join(tmp, 'confirmed.arrow'), join(tmp, 'deaths.arrow')))
+        return tuple(read_frame(path) for path in paths)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
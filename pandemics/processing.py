@@ -2,10 +2,36 @@ import pandas as pd
 import numpy as np
 from typing import *
 import pandemics.utils
+import pandemics.compact
+import pandemics.model
+import pandemics.metrics
+import pandemics.gazetteer
+import pandemics.jhu
+import logging
 from datetime import datetime
 from os.path import join
-from geopy.geocoders import Nominatim
 
+JHU_WORLD_RECOVERED_CSV = 'time_series_covid19_recovered_global.csv'
+JHU_WORLD_CONFIRMED_CSV = 'time_series_covid19_confirmed_global.csv'
+JHU_WORLD_DEATHS_CSV = 'time_series_covid19_deaths_global.csv'
+JHU_STATE_CONFIRMED_CSV = 'time_series_covid19_confirmed_US.csv'
+JHU_STATE_DEATHS_CSV = 'time_series_covid19_deaths_US.csv'
+
+# How reconciling sources keeps cumulative counts from falling, see pandemics.reconcile
+MONOTONIC = 'last'
+# Build tables as CompactTables, an int32 block of counts with a validity mask, instead of
+# DataFrames with an Int64 column per date. Both write the same CSVs, see pandemics.compact
+COMPACT = False
+
+logger = logging.getLogger(__name__)
+
+JHU_WORLD_CSVS = [JHU_WORLD_RECOVERED_CSV, JHU_WORLD_CONFIRMED_CSV, JHU_WORLD_DEATHS_CSV]
+JHU_STATE_CSVS = [JHU_STATE_CONFIRMED_CSV, JHU_STATE_DEATHS_CSV]
+
+# Parsed JHU timeseries kept between cycles, only the columns JHU appends are read again
+jhu_series = pandemics.jhu.SeriesCache()
+
+@pandemics.metrics.timed('normalize')
 def jhu_world_normalize(df: pd.DataFrame) -> pd.DataFrame:
     # We are just gonna do per country data in this CSV file
     df = df.drop(columns=['Province/State'])
@@ -49,13 +75,15 @@ def jhu_world_normalize(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
+@pandemics.metrics.timed('normalize')
 def unh_world_normalize(df: pd.DataFrame) -> pd.DataFrame:
+    count_dtype = 'Int32' if COMPACT else 'Int64'
     df = df.astype({
-        'cases': 'Int64',
-        'new_cases': 'Int64',
-        'deaths': 'Int64',
-        'serious_and_critical': 'Int64',
-        'recovered': 'Int64'
+        'cases': count_dtype,
+        'new_cases': count_dtype,
+        'deaths': count_dtype,
+        'serious_and_critical': count_dtype,
+        'recovered': count_dtype
     })
     df.country = df.country.replace({
         'Congo Republic': 'Republic of the Congo',
@@ -63,6 +91,7 @@ def unh_world_normalize(df: pd.DataFrame) -> pd.DataFrame:
     })
     return df
 
+@pandemics.metrics.timed('normalize')
 def jhu_state_normalize(df: pd.DataFrame) -> pd.DataFrame:
     df = df.drop(columns=['UID', 'iso2', 'iso3', 'code3', 'Country_Region', 'Combined_Key', 'Population'], errors='ignore')
     df = df.rename(columns={
@@ -80,6 +109,7 @@ def jhu_state_normalize(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
+@pandemics.metrics.timed('normalize')
 def unh_state_normalize(df: pd.DataFrame) -> pd.DataFrame:
 
     df.state = df.state.str.strip('\'')
@@ -92,47 +122,42 @@ def unh_state_normalize(df: pd.DataFrame) -> pd.DataFrame:
     
     return df
 
+@pandemics.metrics.timed('normalize')
 def nyt_county_normalize(df: pd.DataFrame) -> pd.DataFrame:
     
     df = df.rename(columns={
         'cases': 'confirmed'
     })
 
-    # Change their dates to the date format we use
-    # They use YYYY-MM-DD
-    # We use M/D/YYYY
-    def convert_nyt_date(date):
-        old = datetime.strptime(date, '%Y-%m-%d')
-        new = old.strftime('%-m/%-d/%y')
-        return new
-
-    df.date = df.date.map(convert_nyt_date)
-
-    def split_nyt_data(df: pd.DataFrame) -> pd.DataFrame:
-        deaths = df.loc[:, df.columns != 'cases']
-        confirmed = df.loc[:, df.columns != 'deaths']
-        return confirmed, deaths
-
-    # Need to turn date column into a bunch of different columns for each state/county
-    dates = list(set(df.date))
-    dates.sort(key=lambda d: datetime.strptime(d, '%m/%d/%y'))
-
-    # Split into two dataframes for cases and deaths
-    confirmed, deaths = split_nyt_data(df)
-
-    # Do the following for each of recovered and deaths
-    def transpose_nyt_data(df: pd.DataFrame, expand: str) -> pd.DataFrame:
-        join_on = ['county', 'state', 'fips']
-        state_county = set(map(tuple, df[join_on].values))
-        t = pd.DataFrame(state_county, columns=join_on)
-        for date in dates:
-            s = df[df.date == date][join_on + [expand]]
-            s = s.rename(columns={expand: date})
-            t = t.merge(s, on=join_on, how='left')
-        return t
-
-    confirmed = transpose_nyt_data(confirmed, expand='confirmed')
-    deaths = transpose_nyt_data(deaths, expand='deaths')
+    # They use YYYY-MM-DD, dates only become our M/D/YY headers once widened
+    df.date = pandemics.utils.parse_dates(df.date, '%Y-%m-%d')
+
+    confirmed, deaths = pivot_nyt_data(df)
+    return geocode_nyt_tables(*label_nyt_dates(confirmed, deaths))
+
+@pandemics.metrics.timed('normalize')
+def nyt_county_normalize_chunks(chunks: Iterable[pd.DataFrame]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Normalizes the NYT county feed from an iterator of compact chunks.
+
+    Each chunk is widened as it arrives, so only the growing output tables and one chunk
+    are ever held in memory instead of the whole long feed.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): Chunks from pandemics.fetch.county_chunks, with parsed dates.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: The confirmed and deaths tables, laid out like nyt_county_normalize.
+    """
+    chunks = (chunk.rename(columns={'cases': 'confirmed'}) for chunk in chunks)
+    confirmed, deaths = pivot_nyt_chunks(chunks)
+    return geocode_nyt_tables(*label_nyt_dates(confirmed, deaths))
+
+def label_nyt_dates(*tables: pd.DataFrame) -> Tuple[pd.DataFrame, ...]:
+    # Parsed dates become the M/D/YY headers we use
+    labels = dict(zip(tables[0].columns[3:], pandemics.utils.format_dates(tables[0].columns[3:])))
+    return tuple(t.rename(columns=labels) for t in tables)
+
+def geocode_nyt_tables(confirmed: pd.DataFrame, deaths: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
 
      # make fips an str instead of a float
     confirmed = confirmed.astype({'fips': 'object'})
@@ -141,16 +166,19 @@ def nyt_county_normalize(df: pd.DataFrame) -> pd.DataFrame:
     confirmed.fips = confirmed.fips.astype('Int64').astype(str).str.zfill(5)
     deaths.fips = deaths.fips.astype('Int64').astype(str).str.zfill(5)
 
-    table = pandemics.fetch.county_table()
+    gazetteer = pandemics.gazetteer.get_gazetteer()
 
     def geocode_nyt(df):
-        df = pd.merge(df, table, how='left', on='fips')
-
-        cols = df.columns.tolist()
-        cols = cols[:3] + cols[-2:] + cols[3:-2]
-        df = df[cols]
+        # Rows without a fips hold <NA>, which becomes NaN and matches no county
+        latitude, longitude = gazetteer.lookup(pd.to_numeric(df.fips, errors='coerce'))
+        df = df.reset_index(drop=True)
+        df.insert(3, 'latitude', latitude)
+        df.insert(4, 'longitude', longitude)
 
         date_cols = [col for col in df.columns if '/' in col]
+        if COMPACT:
+            keys = df[[col for col in df.columns if col not in date_cols]]
+            return pandemics.compact.CompactTable.from_values(keys, date_cols, df[date_cols].to_numpy(dtype='float64', na_value=np.nan))
         date_retype = {d: 'Int64' for d in date_cols}
 
         df = df.astype(date_retype)
@@ -162,124 +190,221 @@ def nyt_county_normalize(df: pd.DataFrame) -> pd.DataFrame:
 
     return confirmed, deaths
 
+def pivot_nyt_data(df: pd.DataFrame, values: Sequence[str] = ('confirmed', 'deaths')) -> Tuple[pd.DataFrame, ...]:
+    """Reshapes the long NYT county feed into one wide table per value column.
+
+    All value columns are pivoted together in a single pass, so the feed is only
+    grouped once regardless of how many tables are produced.
+
+    Args:
+        df (pd.DataFrame): Long NYT data with county, state, fips, date and value columns.
+        values (Sequence[str]): The value columns to widen, in output order.
+
+    Returns:
+        Tuple[pd.DataFrame, ...]: One frame per value with county, state, fips and a column per date.
+    """
+    join_on = ['county', 'state', 'fips']
+
+    # Rows without a fips (NYC, Unknown, ...) would be dropped as null group keys
+    wide = df.groupby(join_on + ['date'], sort=False, dropna=False, observed=True)[list(values)].last()
+    wide = wide.unstack('date')
+
+    dates = list(wide.columns.levels[1])
+    if dates and isinstance(dates[0], str):
+        dates = pandemics.utils.sort_date_labels(dates)
+    else:
+        dates.sort()
+
+    tables = []
+    for value in values:
+        t = wide[value].reindex(columns=dates)
+        t.columns.name = None
+        tables.append(t.reset_index())
+
+    return tuple(tables)
+
+def pivot_nyt_chunks(chunks: Iterable[pd.DataFrame], values: Sequence[str] = ('confirmed', 'deaths')) -> Tuple[pd.DataFrame, ...]:
+    """Runs pivot_nyt_data over a date-sorted stream of chunks and stitches the pieces together.
+
+    Rows of the last date in a chunk are held back and pivoted with the next chunk, so a date
+    split across two chunks still lands in a single column.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): Long NYT data in date order.
+        values (Sequence[str]): The value columns to widen, in output order.
+
+    Returns:
+        Tuple[pd.DataFrame, ...]: One frame per value, as returned by pivot_nyt_data.
+    """
+    join_on = ['county', 'state', 'fips']
+    parts = [[] for _ in values]
+    held = None
+
+    def add(df):
+        for part, t in zip(parts, pivot_nyt_data(df, values)):
+            part.append(t.set_index(join_on))
+
+    for chunk in chunks:
+        if held is not None:
+            chunk = pd.concat([held, chunk], ignore_index=True)
+        last = chunk.date.max()
+        held = chunk[chunk.date == last]
+        chunk = chunk[chunk.date != last]
+        if len(chunk):
+            add(chunk)
+    if held is not None and len(held):
+        add(held)
+
+    tables = []
+    for part in parts:
+        if not part:
+            tables.append(pd.DataFrame(columns=join_on))
+            continue
+        t = pd.concat(part, axis=1)
+        if t.columns.duplicated().any():
+            # The feed was not in date order, merge the repeated dates
+            t = t.T.groupby(level=0).last().T
+        t = t.reindex(columns=sorted(t.columns))
+        tables.append(t.reset_index())
+
+    return tuple(tables)
+
+def state_centroids(df: pd.DataFrame) -> pd.DataFrame:
+    """Locates each state at the mean of its counties' coordinates.
+
+    JHU's placeholder rows (Unassigned, Out of ...) sit at 0, 0 and are left out.
+
+    Args:
+        df (pd.DataFrame): Normalized JHU US data with state, latitude and longitude columns.
+
+    Returns:
+        pd.DataFrame: latitude and longitude indexed by state.
+    """
+    located = df[(df.latitude != 0) | (df.longitude != 0)]
+    return located.groupby('state')[['latitude', 'longitude']].mean()
+
 def split_jhu_state_data(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
     
     state = df[df.duplicated(['state'])]
     state = state.groupby('state').sum()
     state = state.reset_index()
-    state.latitude = 0.0
-    state.longitude = 0.0
-
-    geocoder = Nominatim(timeout=60)
 
-    lat, lon = zip(*[pandemics.utils.geocode(geocoder, f'{state}, United States') for state in state.state])
-
-    state.latitude = lat
-    state.longitude = lon
+    # Place states from the county coordinates JHU already gives us instead of geocoding them
+    centroids = state_centroids(df)
+    state.latitude = state.state.map(centroids.latitude)
+    state.longitude = state.state.map(centroids.longitude)
 
     state = state.drop(columns=['fips'])
 
     return df, state
 
 
-def split_unh_data(df: pd.DataFrame, pk: str = 'country') -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    date = pandemics.utils.timeseries_date()
-    common_cols = [pk, 'latitude', 'longitude']
-    recovered = df[common_cols + ['recovered']].rename(columns={'recovered': date})
-    confirmed = df[common_cols + ['cases']].rename(columns={'cases': date})
-    deaths = df[common_cols + ['deaths']].rename(columns={'deaths': date})
-    return recovered, confirmed, deaths
-
 def take_greatest(df: pd.DataFrame, pk: str = 'country') -> pd.DataFrame:
-    to_drop = {col for col in df.columns if col.endswith('_jhu') or col.endswith('_unh')}
-    dates = {col.split('_')[0] for col in df.columns if col != pk}
+    # Each source's numbers sit side by side as <date>_jhu/<date>_unh columns
+    table = pandemics.model.from_wide(df, pk, source='merged')
+    return pandemics.model.to_wide(pandemics.model.reconcile(table, monotonic=MONOTONIC), pk, compact=COMPACT)
 
-    for date in dates:
-        df[date] = df.filter(like=date).max(axis=1)
-    
-    df = df.drop(columns=to_drop)
-    # Sort the date columns by their datetime value
-    
-    date_cols = sorted(df.columns[3:], key=lambda d: datetime.strptime(d, '%m/%d/%y'))
-    # Convert date columns to integer
-    df = df.astype({d:'Int64' for d in date_cols})
-    df = df[[pk, 'latitude', 'longitude'] + date_cols]
+@pandemics.metrics.timed('join')
+def join_sources(tables: Sequence[pandemics.model.LongTable], pk: str = 'country', greatest: bool = True) -> pd.DataFrame:
+    """Outer joins several sources' numbers for the same regions and widens the result.
 
-    # Make null lat/lons 0s
-    df.latitude = df.latitude.fillna(0.0)
-    df.longitude = df.longitude.fillna(0.0)
+    Coordinates are taken from the last table.
 
-    # If the new number is lower than the old number, use the old number
-    df.iloc[:, -1] = df.iloc[:, [-1, -2]].max(axis=1)
-    df = df.astype({date_cols[-1]: 'Int64'})
+    Args:
+        tables (Sequence[LongTable]): The sources, in the order their regions should appear.
+        pk (str): Name of the region column.
+        greatest (bool): Keep the greatest number for each region and date, otherwise each source gets its own columns.
 
-    return df
+    Returns:
+        pd.DataFrame: The joined wide table, a CompactTable when COMPACT and greatest.
+    """
+    joined = pandemics.model.combine(tables)
+    if greatest:
+        return pandemics.model.to_wide(pandemics.model.reconcile(joined, monotonic=MONOTONIC), pk, compact=COMPACT)
+    return pandemics.model.to_wide(joined, pk, by_source=True)
 
 def join_unh_jhu(df: pd.DataFrame, to_join: Union[pd.DataFrame, Iterable[pd.DataFrame]], pk: str = 'country', greatest: bool = True) -> pd.DataFrame:
     if isinstance(to_join, pd.DataFrame):
         to_join = [to_join]
 
-    for j in to_join:
-        df = df.merge(j, how='outer', on=pk, suffixes=['_jhu', '_unh'])
-        df = df.drop(columns=['latitude_jhu', 'longitude_jhu'])
-        df = df.rename(columns={
-            'latitude_unh': 'latitude',
-            'longitude_unh': 'longitude'
-        })
-    
-    # Rearrange the data so latitude and longitude is at the beginning
-    cols = list(df)
-    cols.insert(1, cols.pop(cols.index('latitude')))
-    cols.insert(2, cols.pop(cols.index('longitude')))
-    df = df[cols]
-
-    if greatest:
-        df = take_greatest(df, pk=pk)
-
-    return df
+    tables = [pandemics.model.from_wide(df, pk, 'jhu')]
+    tables += [pandemics.model.from_wide(j, pk, 'unh') for j in to_join]
+    return join_sources(tables, pk=pk, greatest=greatest)
 
 def get_jhu_world_data(path: str, normalize: bool = True) -> pd.DataFrame:
-    df = pd.read_csv(path)
-    if normalize:
-        df = pandemics.processing.jhu_world_normalize(df)
-    return df
+    return jhu_series.read(path, jhu_world_normalize if normalize else None)
 
 def get_jhu_state_data(path: str, normalize: bool = True) -> pd.DataFrame:
-    df = pd.read_csv(path)
-    if normalize:
-        df = pandemics.processing.jhu_state_normalize(df)
-    return df
+    return jhu_series.read(path, jhu_state_normalize if normalize else None)
+
+def world_series(jhu_path: str, unh_world: pd.DataFrame, column: str, today: datetime, normalize: bool = True, greatest: bool = True) -> pd.DataFrame:
+    """Builds one world timeseries from a JHU CSV and a column of our world snapshot.
+
+    Args:
+        jhu_path (str): The JHU global timeseries CSV.
+        unh_world (pd.DataFrame): Our world snapshot, from pandemics.fetch.world_data.
+        column (str): The snapshot column matching the CSV, e.g. cases for confirmed.
+        today (datetime): The date the snapshot is for.
+        normalize (bool): Normalize the JHU data.
+        greatest (bool): Keep the greatest number per date instead of both sources' columns.
+
+    Returns:
+        pd.DataFrame: The joined timeseries.
+    """
+    return join_world_series(get_jhu_world_data(jhu_path, normalize=normalize), unh_world, column, today, greatest)
+
+def join_world_series(jhu_world: pd.DataFrame, unh_world: pd.DataFrame, column: str, today: datetime, greatest: bool = True) -> pd.DataFrame:
+    """Like world_series, from a JHU global timeseries that was already read."""
+    jhu = pandemics.model.from_wide(jhu_world, 'country', 'jhu')
+    unh = pandemics.model.from_snapshot(unh_world, 'country', column, today, 'unh')
+    return join_sources([jhu, unh], greatest=greatest)
+
+def state_series(jhu_path: str, unh_state: pd.DataFrame, column: str, today: datetime, normalize: bool = True, greatest: bool = True) -> pd.DataFrame:
+    """Builds one state timeseries from a JHU US CSV and a column of our state snapshot.
+
+    Args:
+        jhu_path (str): The JHU US timeseries CSV.
+        unh_state (pd.DataFrame): Our state snapshot, from pandemics.fetch.state_data.
+        column (str): The snapshot column matching the CSV.
+        today (datetime): The date the snapshot is for.
+        normalize (bool): Normalize the JHU data.
+        greatest (bool): Keep the greatest number per date instead of both sources' columns.
+
+    Returns:
+        pd.DataFrame: The joined timeseries.
+    """
+    return join_state_series(get_jhu_state_data(jhu_path, normalize=normalize), unh_state, column, today, greatest)
+
+def join_state_series(jhu_us: pd.DataFrame, unh_state: pd.DataFrame, column: str, today: datetime, greatest: bool = True) -> pd.DataFrame:
+    """Like state_series, from a JHU US timeseries that was already read."""
+    # JHU's US data is per county, only the state rows are joined
+    _, jhu_state = split_jhu_state_data(jhu_us)
+    jhu = pandemics.model.from_wide(jhu_state, 'state', 'jhu')
+    unh = pandemics.model.from_snapshot(unh_state, 'state', column, today, 'unh')
+    # Our states come first, JHU's coordinates are kept
+    return join_sources([unh, jhu], pk='state', greatest=greatest)
+
+def snapshot_date() -> datetime:
+    return pandemics.utils.parse_date_labels([pandemics.utils.timeseries_date()])[0]
 
 def get_world_update(jhu_timeseries_path: str, normalize: bool = True, greatest: bool = True) -> pd.DataFrame:
 
     print('getting world update')
 
-    recovered_jhu = get_jhu_world_data(join(jhu_timeseries_path, 'time_series_covid19_recovered_global.csv'), normalize=normalize)
-    confirmed_jhu = get_jhu_world_data(join(jhu_timeseries_path, 'time_series_covid19_confirmed_global.csv'), normalize=normalize)
-    deaths_jhu = get_jhu_world_data(join(jhu_timeseries_path, 'time_series_covid19_deaths_global.csv'), normalize=normalize)
-
-    print('got jhu world data, showing recovered')
-    print(recovered_jhu.head())
-
     print('fetching unh world data')
     # Get the most recent world data (contains confirmed, deaths, and recovered all in one)
     unh_world = pandemics.fetch.world_data(normalize=normalize)
 
-    print('got unh world data')
-    print(unh_world.head())
-
-    recovered_unh, confirmed_unh, deaths_unh = split_unh_data(unh_world)
-
-    print('split unh data, showing recovered')
-    print(recovered_unh.head())
+    # Formatting DataFrames is not free, only do it when debugging
+    logger.debug('got unh world data\n%s', unh_world.head())
 
+    today = snapshot_date()
     print('joining our data with jhu')
-    recovered = join_unh_jhu(recovered_jhu, recovered_unh, greatest=greatest)
-    confirmed = join_unh_jhu(confirmed_jhu, confirmed_unh, greatest=greatest)
-    deaths = join_unh_jhu(deaths_jhu, deaths_unh, greatest=greatest)
+    recovered = world_series(join(jhu_timeseries_path, JHU_WORLD_RECOVERED_CSV), unh_world, 'recovered', today, normalize, greatest)
+    confirmed = world_series(join(jhu_timeseries_path, JHU_WORLD_CONFIRMED_CSV), unh_world, 'cases', today, normalize, greatest)
+    deaths = world_series(join(jhu_timeseries_path, JHU_WORLD_DEATHS_CSV), unh_world, 'deaths', today, normalize, greatest)
 
-    print('joined, showing combined recovered')
-    print(recovered.head())
+    logger.debug('joined, showing combined recovered\n%s', recovered.head())
 
     return confirmed, recovered, deaths
 
@@ -287,34 +412,17 @@ def get_state_update(jhu_timeseries_path: str, normalize: bool = True, greatest:
 
     print('getting state update')
 
-    confirmed_jhu = get_jhu_state_data(join(jhu_timeseries_path, 'time_series_covid19_confirmed_US.csv'), normalize=normalize)
-    deaths_jhu = get_jhu_state_data(join(jhu_timeseries_path, 'time_series_covid19_deaths_US.csv'), normalize=normalize)
-
-    print('got jhu state data, showing confirmed')
-    print(confirmed_jhu.head())
-
-    confirmed_jhu_county, confirmed_jhu_state = split_jhu_state_data(confirmed_jhu)
-    deaths_jhu_county, deaths_jhu_state = split_jhu_state_data(deaths_jhu)
-    # JHU does not provide recovered US state data
-    print('split jhu into county/state data, showing confirmed state')
-    print(confirmed_jhu_state.head())
-
     print('fetching unh state data')
     unh_state = pandemics.fetch.state_data(normalize=normalize)
 
-    print('got our state data')
-    print(unh_state.head())
-
-    recovered_unh, confirmed_unh, deaths_unh = split_unh_data(unh_state, pk='state')
+    logger.debug('got our state data\n%s', unh_state.head())
 
-    print('split our state data, showing confirmed')
-    print(recovered_unh.head())
-
-    confirmed_state = join_unh_jhu(confirmed_unh, confirmed_jhu_state, pk='state', greatest=greatest)
-    deaths_state = join_unh_jhu(deaths_unh, deaths_jhu_state, pk='state', greatest=greatest)
+    today = snapshot_date()
+    # JHU does not provide recovered US state data
+    confirmed_state = state_series(join(jhu_timeseries_path, JHU_STATE_CONFIRMED_CSV), unh_state, 'cases', today, normalize, greatest)
+    deaths_state = state_series(join(jhu_timeseries_path, JHU_STATE_DEATHS_CSV), unh_state, 'deaths', today, normalize, greatest)
 
-    print('joined, showing combined confirmed')
-    print(confirmed_state.head())
+    logger.debug('joined, showing combined confirmed\n%s', confirmed_state.head())
 
     return confirmed_state, deaths_state
 
@@ -0,0 +1,58 @@
+import numpy as np
+from typing import *
+
+# Winner of cells no source has a number for
+NO_SOURCE = -1
+
+MONOTONIC_MODES = (None, 'last', 'all')
+
+class Reconciled(NamedTuple):
+    """The reconciled regions x dates matrix.
+
+    values is float64 with NaN where no source has a number. winner holds, for every cell,
+    the index of the source whose number was kept, or NO_SOURCE.
+    """
+    values: np.ndarray
+    winner: np.ndarray
+
+def reconcile(arrays: Sequence[np.ndarray], monotonic: Optional[str] = 'last') -> Reconciled:
+    """Takes the elementwise greatest of several sources' regions x dates matrices.
+
+    Missing numbers are NaN and never win over a present one.
+
+    Args:
+        arrays (Sequence[np.ndarray]): One 2-D matrix per source, all with the same regions and dates in the same order.
+        monotonic (Optional[str]): Cumulative counts never decrease. 'last' only lifts the newest date up to the one
+            before it, 'all' carries the running maximum across every date, None leaves the numbers as reported.
+
+    Returns:
+        Reconciled: The greatest numbers and which source each one came from.
+    """
+    if monotonic not in MONOTONIC_MODES:
+        raise ValueError(f'monotonic must be one of {MONOTONIC_MODES}, not {monotonic!r}')
+
+    stack = np.stack([np.asarray(a, dtype='float64') for a in arrays])
+    missing = np.isnan(stack)
+
+    # argmax over -inf filled copies picks the source holding the max, fmax ignores NaN
+    winner = np.where(missing, -np.inf, stack).argmax(axis=0)
+    values = np.fmax.reduce(stack, axis=0)
+    winner[np.isnan(values)] = NO_SOURCE
+
+    dates = values.shape[1] if values.ndim == 2 else 0
+    if monotonic == 'last' and dates > 1:
+        lifted = np.fmax(values[:, -1], values[:, -2])
+        raised = lifted != values[:, -1]
+        raised &= ~np.isnan(lifted)
+        winner[raised, -1] = winner[raised, -2]
+        values[:, -1] = lifted
+    elif monotonic == 'all' and dates > 1:
+        carried = np.fmax.accumulate(values, axis=1)
+        # Find the date each running maximum was set on to carry its winner along with it
+        set_on = np.where(values == carried, np.arange(dates)[None, :], 0)
+        set_on = np.maximum.accumulate(set_on, axis=1)
+        winner = np.take_along_axis(winner, set_on, axis=1)
+        winner[np.isnan(carried)] = NO_SOURCE
+        values = carried
+
+    return Reconciled(values, winner)
@@ -0,0 +1,225 @@
+import pandas as pd
+import argparse
+import bisect
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from os.path import join
+from typing import *
+import pandemics.model
+import pandemics.processing
+import pandemics.utils
+
+ARCHIVE_ROOT = 'data_archive'
+# utils.time_fname names every snapshot after the day it was taken, MM-DD-YYYY.csv
+SNAPSHOT_NAME = re.compile(r'^(\d{2})-(\d{2})-(\d{4})\.csv$')
+
+WORLD_SOURCE = 'world'
+STATE_SOURCE = 'us/state'
+
+# Snapshot column and output CSV of every series a kind rebuilds
+WORLD_SERIES = {
+    'confirmed': ('cases', pandemics.processing.JHU_WORLD_CONFIRMED_CSV, 'world_country_confirmed.csv'),
+    'recovered': ('recovered', pandemics.processing.JHU_WORLD_RECOVERED_CSV, 'world_country_recovered.csv'),
+    'deaths': ('deaths', pandemics.processing.JHU_WORLD_DEATHS_CSV, 'world_country_deaths.csv')
+}
+STATE_SERIES = {
+    'confirmed': ('cases', pandemics.processing.JHU_STATE_CONFIRMED_CSV, 'us_state_confirmed.csv'),
+    'deaths': ('deaths', pandemics.processing.JHU_STATE_DEATHS_CSV, 'us_state_deaths.csv')
+}
+
+class Snapshot(NamedTuple):
+    source: str
+    date: datetime
+    path: str
+
+ArchiveIndex = Dict[str, List[Snapshot]]
+
+def index_archive(root: str = ARCHIVE_ROOT) -> ArchiveIndex:
+    """Finds every daily snapshot under root without opening any of them.
+
+    Args:
+        root (str): The archive directory, laid out as <source>/<MM-DD-YYYY>.csv.
+
+    Returns:
+        ArchiveIndex: Snapshots of each source, e.g. world or us/state, oldest first.
+    """
+    index = {}
+    for directory, _, files in os.walk(root):
+        source = os.path.relpath(directory, root).replace(os.sep, '/')
+        for name in files:
+            match = SNAPSHOT_NAME.match(name)
+            if match:
+                month, day, year = map(int, match.groups())
+                index.setdefault(source, []).append(Snapshot(source, datetime(year, month, day), join(directory, name)))
+    for snapshots in index.values():
+        snapshots.sort(key=lambda s: s.date)
+    return index
+
+def select(index: ArchiveIndex, source: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Snapshot]:
+    """Returns the snapshots of source taken between start and end, both included."""
+    snapshots = index.get(source, [])
+    dates = [s.date for s in snapshots]
+    lo = bisect.bisect_left(dates, start) if start else 0
+    hi = bisect.bisect_right(dates, end) if end else len(dates)
+    return snapshots[lo:hi]
+
+def newest(index: ArchiveIndex, source: str) -> Optional[Snapshot]:
+    snapshots = index.get(source)
+    return snapshots[-1] if snapshots else None
+
+def load_snapshots(index: ArchiveIndex, source: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   usecols: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Reads only the snapshots of source in a date range into one frame.
+
+    Args:
+        index (ArchiveIndex): The archive, from index_archive.
+        source (str): e.g. world or us/state.
+        start (Optional[datetime]): First day to load.
+        end (Optional[datetime]): Last day to load.
+        usecols (Optional[Sequence[str]]): Columns to read, all of them when None.
+
+    Returns:
+        pd.DataFrame: The snapshots' rows with a date column saying which day each came from.
+    """
+    frames = []
+    for snapshot in select(index, source, start, end):
+        df = pd.read_csv(snapshot.path, usecols=usecols)
+        df['date'] = snapshot.date
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=list(usecols or []) + ['date'])
+    return pd.concat(frames, ignore_index=True)
+
+def _snapshot_tables(snapshots: pd.DataFrame, pk: str, column: str) -> List[pandemics.model.LongTable]:
+    return [pandemics.model.from_snapshot(day, pk, column, date, 'unh') for date, day in snapshots.groupby('date', sort=True)]
+
+def rebuild_world(jhu: Dict[str, pandemics.model.LongTable], snapshots: pd.DataFrame, day: datetime) -> Dict[str, pd.DataFrame]:
+    """Rebuilds the merged world timeseries as they would have been published on day.
+
+    Unlike a live run, which only has today's snapshot, every archived snapshot up to day is
+    reconciled with JHU's numbers.
+
+    Args:
+        jhu (Dict[str, LongTable]): JHU's series by name, see WORLD_SERIES.
+        snapshots (pd.DataFrame): Normalized world snapshots with a date column, from load_snapshots.
+        day (datetime): The day to rebuild.
+
+    Returns:
+        Dict[str, pd.DataFrame]: The merged tables by series name.
+    """
+    snapshots = snapshots[snapshots.date <= day]
+    merged = {}
+    for name, (column, _, _) in WORLD_SERIES.items():
+        tables = [pandemics.model.truncate(jhu[name], day)] + _snapshot_tables(snapshots, 'country', column)
+        merged[name] = pandemics.processing.join_sources(tables)
+    return merged
+
+def rebuild_state(jhu: Dict[str, pandemics.model.LongTable], snapshots: pd.DataFrame, day: datetime) -> Dict[str, pd.DataFrame]:
+    """Rebuilds the merged state timeseries as they would have been published on day, see rebuild_world."""
+    snapshots = snapshots[snapshots.date <= day]
+    merged = {}
+    for name, (column, _, _) in STATE_SERIES.items():
+        # Our states come first, JHU's coordinates are kept
+        tables = _snapshot_tables(snapshots, 'state', column) + [pandemics.model.truncate(jhu[name], day)]
+        merged[name] = pandemics.processing.join_sources(tables, pk='state')
+    return merged
+
+def _load_jhu(kind: str, jhu_timeseries_path: str) -> Dict[str, pandemics.model.LongTable]:
+    jhu = {}
+    if kind == 'world':
+        for name, (_, csv, _) in WORLD_SERIES.items():
+            df = pandemics.processing.get_jhu_world_data(join(jhu_timeseries_path, csv))
+            jhu[name] = pandemics.model.from_wide(df, 'country', 'jhu')
+    else:
+        for name, (_, csv, _) in STATE_SERIES.items():
+            _, df = pandemics.processing.split_jhu_state_data(pandemics.processing.get_jhu_state_data(join(jhu_timeseries_path, csv)))
+            jhu[name] = pandemics.model.from_wide(df, 'state', 'jhu')
+    return jhu
+
+def _load_unh(kind: str, index: ArchiveIndex, start: Optional[datetime], end: datetime) -> pd.DataFrame:
+    if kind == 'world':
+        return pandemics.processing.unh_world_normalize(load_snapshots(index, WORLD_SOURCE, start, end))
+    return pandemics.processing.unh_state_normalize(load_snapshots(index, STATE_SOURCE, start, end))
+
+def _rebuild_days(kind: str, jhu_timeseries_path: str, index: ArchiveIndex, days: Sequence[datetime],
+                  start: Optional[datetime], out_dir: str) -> List[str]:
+    # JHU and the snapshots are loaded once for the whole batch of days
+    jhu = _load_jhu(kind, jhu_timeseries_path)
+    unh = _load_unh(kind, index, start, max(days))
+    rebuild, series = (rebuild_world, WORLD_SERIES) if kind == 'world' else (rebuild_state, STATE_SERIES)
+
+    written = []
+    for day in days:
+        day_dir = join(out_dir, day.strftime('%m-%d-%Y'))
+        pandemics.utils.build_path(day_dir)
+        for name, df in rebuild(jhu, unh, day).items():
+            path = join(day_dir, series[name][2])
+            df.to_csv(path)
+            written.append(path)
+    return written
+
+def split_days(days: Sequence[datetime], workers: int) -> List[List[datetime]]:
+    """Splits sorted days into at most workers contiguous batches, all but the last of the same size."""
+    if not days:
+        return []
+    size = -(-len(days) // min(workers, len(days)))
+    return [list(days[i:i + size]) for i in range(0, len(days), size)]
+
+def replay(kind: str, jhu_timeseries_path: str, days: Sequence[datetime], out_dir: str, root: str = ARCHIVE_ROOT,
+           start: Optional[datetime] = None, max_workers: Optional[int] = None) -> List[str]:
+    """Rebuilds the merged timeseries of kind for many past days, spread over every core.
+
+    Days are split into contiguous batches, one per worker, so each worker reads JHU's CSVs and
+    the archive once. Each day is written to out_dir/<MM-DD-YYYY>/ with the live file names.
+
+    Args:
+        kind (str): world or state.
+        jhu_timeseries_path (str): The JHU timeseries folder.
+        days (Sequence[datetime]): The days to rebuild.
+        out_dir (str): Where to write the rebuilt CSVs.
+        root (str): The snapshot archive.
+        start (Optional[datetime]): Ignore snapshots taken before this day.
+        max_workers (Optional[int]): Processes to use, every core when None.
+
+    Returns:
+        List[str]: The files written.
+    """
+    if kind not in ('world', 'state'):
+        raise ValueError(f'kind must be world or state, not {kind!r}')
+    days = sorted(days)
+    if not days:
+        return []
+    index = index_archive(root)
+    batches = split_days(days, max_workers or os.cpu_count() or 1)
+
+    if len(batches) == 1:
+        return _rebuild_days(kind, jhu_timeseries_path, index, batches[0], start, out_dir)
+
+    with ProcessPoolExecutor(max_workers=len(batches)) as pool:
+        futures = [pool.submit(_rebuild_days, kind, jhu_timeseries_path, index, batch, start, out_dir) for batch in batches]
+        return [path for future in futures for path in future.result()]
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Rebuilds past merged timeseries from the snapshot archive')
+    parser.add_argument('kind', choices=['world', 'state'])
+    parser.add_argument('--jhu', required=True, help='The JHU csse_covid_19_time_series folder')
+    parser.add_argument('--from', dest='first', required=True, help='First day to rebuild, YYYY-MM-DD')
+    parser.add_argument('--to', dest='last', help='Last day to rebuild, YYYY-MM-DD, defaults to --from')
+    parser.add_argument('--out', required=True, help='Directory to write the rebuilt CSVs to')
+    parser.add_argument('--archive', default=ARCHIVE_ROOT)
+    parser.add_argument('--since', help='Ignore snapshots taken before this day, YYYY-MM-DD')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args(argv)
+
+    first = datetime.strptime(args.first, '%Y-%m-%d')
+    last = datetime.strptime(args.last, '%Y-%m-%d') if args.last else first
+    since = datetime.strptime(args.since, '%Y-%m-%d') if args.since else None
+    days = list(pd.date_range(first, last).to_pydatetime())
+
+    written = replay(args.kind, args.jhu, days, args.out, root=args.archive, start=since, max_workers=args.workers)
+    print(f'Rebuilt {len(days)} days, wrote {len(written)} files to {args.out}')
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,18 @@
-import git
 import shutil
 import os
 from pathlib import Path
-import pandas as pd
-import pandemics.processing
 from typing import *
 import subprocess
+import hashlib
+import tempfile
+import time
 
-def clone_repo(git_url: str, path: str, force: bool = True, use_ssh: bool = False) -> Union[git.Repo, None]:
+# GitPython runs git when it is imported, so it is only loaded once a repo is needed
+if TYPE_CHECKING:
+    import git
+
+def clone_repo(git_url: str, path: str, force: bool = True, use_ssh: bool = False) -> Union['git.Repo', None]:
+    import git
     repo_path = Path(path)
     if repo_path.exists():
         if not force:
@@ -21,10 +26,88 @@ def clone_repo(git_url: str, path: str, force: bool = True, use_ssh: bool = Fals
     
     return repo
 
+JHU_GIT_URL = 'git@github.com:CSSEGISandData/COVID-19.git'
+JHU_BRANCH = 'master'
+# The only part of the JHU repo we read
+JHU_TIMESERIES_DIR = 'csse_covid_19_data/csse_covid_19_time_series'
+
 def clone_jhu(path: str, force: bool = True) -> None:
-    return clone_repo('git@github.com:CSSEGISandData/COVID-19.git', path, force=force, use_ssh=False)
+    return clone_repo(JHU_GIT_URL, path, force=force, use_ssh=False)
+
+def sync_repo(git_url: str, path: str, branch: str = 'master', sparse_paths: Optional[Sequence[str]] = None,
+              shallow: bool = True, use_ssh: bool = False) -> Tuple['git.Repo', List[str]]:
+    """Brings a read-only mirror of a repository up to date without re-cloning it.
+
+    The first call makes a clone limited to sparse_paths, without history when shallow and
+    without any blobs outside the checkout. Later calls fetch the branch into the existing
+    clone and move it to the fetched commit. An existing clone that is not sparse or shallow
+    when asked to be, such as a full clone made by clone_repo, is replaced by a fresh mirror.
+
+    Args:
+        git_url (str): The repository to mirror.
+        path (str): Where the mirror lives.
+        branch (str): The branch to follow.
+        sparse_paths (Optional[Sequence[str]]): Directories to check out, everything when None.
+        shallow (bool): Only fetch the newest commit.
+        use_ssh (bool): Authenticate with ~/.ssh/id_rsa.
+
+    Returns:
+        Tuple[git.Repo, List[str]]: The mirror and the files under sparse_paths that changed, all of them after a fresh clone.
+    """
+    import git
+    env = {}
+    if use_ssh:
+        key = os.path.expanduser('~/.ssh/id_rsa')
+        env['GIT_SSH_COMMAND'] = f'ssh -i {key}'
+    depth = {'depth': 1} if shallow else {}
+    paths = list(sparse_paths or [])
+
+    repo_path = Path(path)
+    if (repo_path / '.git').exists() and not _is_mirror(git.Repo(path), paths, shallow):
+        # A full clone left by clone_repo, cloned again so it stops holding history and unused files
+        print(f'Converting {path} to a sparse, shallow mirror')
+        shutil.rmtree(repo_path)
+    if not (repo_path / '.git').exists():
+        if repo_path.exists():
+            shutil.rmtree(repo_path)
+        repo = git.Repo.clone_from(git_url, path, env=env, branch=branch, no_checkout=True,
+                                   filter='blob:none', **depth)
+        if paths:
+            repo.git.sparse_checkout('init', '--cone')
+            repo.git.sparse_checkout('set', *paths)
+        repo.git.checkout(branch)
+        return repo, repo.git.ls_files('--', *paths).splitlines()
+
+    repo = git.Repo(path)
+    old = repo.head.commit.hexsha
+    with repo.git.custom_environment(**env):
+        repo.git.fetch('origin', branch, **depth)
+    # Nothing is ever committed to the mirror, so moving it to the fetched commit is a fast-forward
+    repo.git.reset('--hard', 'FETCH_HEAD')
+    new = repo.head.commit.hexsha
+
+    if old == new:
+        return repo, []
+    return repo, repo.git.diff('--name-only', old, new, '--', *paths).splitlines()
+
+def _is_mirror(repo: 'git.Repo', paths: List[str], shallow: bool) -> bool:
+    # Whether an existing clone has the layout sync_repo gives a fresh one
+    if shallow and repo.git.rev_parse('--is-shallow-repository') != 'true':
+        return False
+    if paths:
+        import git
+        try:
+            # Fails when the clone is not sparse
+            return repo.git.sparse_checkout('list').splitlines() == paths
+        except git.GitCommandError:
+            return False
+    return True
 
-def push_files(repo: git.Repo, files: Iterable[str], msg: str = '') -> None:
+def sync_jhu(path: str) -> Tuple['git.Repo', List[str]]:
+    """Brings the JHU mirror up to date, checking out only the time series directory."""
+    return sync_repo(JHU_GIT_URL, path, branch=JHU_BRANCH, sparse_paths=[JHU_TIMESERIES_DIR])
+
+def push_files(repo: 'git.Repo', files: Iterable[str], msg: str = '') -> None:
     try:
         origin = repo.remote(name='origin')
         origin.pull()
@@ -35,6 +118,131 @@ def push_files(repo: git.Repo, files: Iterable[str], msg: str = '') -> None:
     except Exception as e:
         print(f'Error pushing files: {e}')
 
+# Pushes slower than this, or failed ones, make the publisher wait before pushing again
+SLOW_PUSH_SECONDS = 60
+MAX_PUSH_BACKOFF = 60 * 60
+
+class PublishReport(NamedTuple):
+    files: List[str]
+    bytes: int
+    committed: bool
+    pushed: bool
+    pending_commits: int
+
+def blob_sha(data: bytes) -> str:
+    """Returns the id git would give data as a blob."""
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+def head_blob_shas(repo: 'git.Repo', files: Iterable[str]) -> Dict[str, Optional[str]]:
+    try:
+        tree = repo.head.commit.tree
+    except ValueError:
+        # No commits yet
+        return {f: None for f in files}
+    shas = {}
+    for f in files:
+        try:
+            shas[f] = (tree / f).hexsha
+        except KeyError:
+            shas[f] = None
+    return shas
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Writes data to path through a temporary file, so readers never see a half written file."""
+    directory = os.path.dirname(path) or '.'
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+class Publisher:
+    """Commits and pushes generated files only when their contents actually changed.
+
+    New contents are compared against the blobs in HEAD after pulling, so unchanged files are
+    neither rewritten nor committed. When a push is slow or fails, later cycles keep committing
+    locally and the publisher waits an increasing backoff before pushing them all at once.
+    """
+
+    def __init__(self, slow_push: float = SLOW_PUSH_SECONDS, max_backoff: float = MAX_PUSH_BACKOFF):
+        self.slow_push = slow_push
+        self.max_backoff = max_backoff
+        self.backoff = 0.0
+        self.last_push = 0.0
+        self.pending_commits = 0
+
+    def pull(self, repo: 'git.Repo') -> bool:
+        """Brings the clone up to date with upstream, returning whether that worked.
+
+        Call it before reading anything from the clone that the outputs are built from, then
+        publish with pull=False.
+        """
+        try:
+            repo.remote(name='origin').pull()
+        except Exception as e:
+            print(f'Error pulling before publishing: {e}')
+            return False
+        return True
+
+    def publish(self, repo: 'git.Repo', outputs: Dict[str, bytes], msg: str = '', pull: bool = True) -> PublishReport:
+        """Publishes the files whose contents differ from HEAD.
+
+        Args:
+            repo (git.Repo): The repository to publish to.
+            outputs (Dict[str, bytes]): New contents keyed by path relative to the repository root.
+            msg (str): The commit message.
+            pull (bool): Pull first, leave it off when the caller already did.
+
+        Returns:
+            PublishReport: What was written, committed and pushed this cycle.
+        """
+        # Pulled before comparing, so contents upstream already has are not committed again
+        if pull:
+            self.pull(repo)
+        heads = head_blob_shas(repo, outputs)
+        changed = {f: data for f, data in outputs.items() if blob_sha(data) != heads[f]}
+
+        committed = False
+        if changed:
+            for f, data in changed.items():
+                write_atomic(os.path.join(repo.working_tree_dir, f), data)
+            repo.git.add(list(changed))
+            staged = repo.git.diff('--cached', '--name-only', '--', *changed).splitlines()
+            changed = {f: changed[f] for f in staged}
+        if changed:
+            repo.index.commit(msg)
+            self.pending_commits += 1
+            committed = True
+
+        pushed = False
+        if self.pending_commits and time.monotonic() - self.last_push >= self.backoff:
+            pushed = self._push(repo)
+
+        return PublishReport(sorted(changed), sum(len(d) for d in changed.values()), committed, pushed, self.pending_commits)
+
+    def _push(self, repo: 'git.Repo') -> bool:
+        start = time.monotonic()
+        try:
+            repo.remote(name='origin').push().raise_if_error()
+        except Exception as e:
+            print(f'Error pushing files: {e}')
+            ok = False
+        else:
+            ok = True
+            self.pending_commits = 0
+        self.last_push = time.monotonic()
+
+        # Slow or failing remote, let a few cycles of commits pile up before the next push
+        if ok and self.last_push - start < self.slow_push:
+            self.backoff = 0.0
+        else:
+            self.backoff = min(max(self.backoff * 2, self.slow_push), self.max_backoff)
+        return ok
+
 def push_files_cmd(repo_dir: str, files: Iterable[str], msg: str = '') -> None:
     os.chdir(repo_dir)
 
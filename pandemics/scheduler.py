@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import *
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 4
+# Runs kept per job for latency reporting
+HISTORY_SIZE = 100
+
+class JobRun(NamedTuple):
+    started: float
+    seconds: float
+    status: str
+    error: Optional[str] = None
+
+class Job:
+    """A function run every interval seconds on the scheduler's worker pool.
+
+    A run still going when the next one is due is not started again. A run exceeding
+    timeout is reported as timed out, its thread is left to finish in the background and
+    keeps blocking new runs of the job until it does.
+    """
+
+    def __init__(self, name: str, func: Callable[[], Any], interval: float, timeout: Optional[float] = None,
+                 jitter: float = 0.0, run_now: bool = True, history: int = HISTORY_SIZE):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout
+        self.jitter = jitter
+        self.run_now = run_now
+        self.history = deque(maxlen=history)
+        self._future = None
+
+    @property
+    def running(self) -> bool:
+        return self._future is not None and not self._future.done()
+
+    def latencies(self) -> List[float]:
+        return [run.seconds for run in self.history if run.status != 'skipped']
+
+    def stats(self) -> Dict[str, Any]:
+        """Summarizes the job's recent runs."""
+        latencies = sorted(self.latencies())
+        statuses = [run.status for run in self.history]
+        return {
+            'runs': len(statuses),
+            'ok': statuses.count('ok'),
+            'failed': statuses.count('failed'),
+            'timeout': statuses.count('timeout'),
+            'skipped': statuses.count('skipped'),
+            'last': self.latencies()[-1] if latencies else None,
+            'median': latencies[len(latencies) // 2] if latencies else None,
+            'max': latencies[-1] if latencies else None
+        }
+
+class Scheduler:
+    """Runs jobs on fixed intervals from an asyncio event loop.
+
+    Every job has its own timer, so a slow job only delays itself. Blocking work goes to a
+    thread pool, leaving the loop free to start other jobs on time. Runs are scheduled on a
+    fixed grid from the first one, so they do not drift by however long each run took.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.jobs = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # The loop only holds weak references to tasks, these keep runs alive until they finish
+        self._tasks = set()
+
+    def every(self, interval: float, func: Callable[[], Any], name: Optional[str] = None,
+              timeout: Optional[float] = None, jitter: float = 0.0, run_now: bool = True) -> Job:
+        """Registers func to run every interval seconds.
+
+        Args:
+            interval (float): Seconds between the starts of consecutive runs.
+            func (Callable[[], Any]): The blocking function to run.
+            name (Optional[str]): Name used in logs and stats, defaults to the function's name.
+            timeout (Optional[float]): Seconds after which a run is reported as timed out.
+            jitter (float): Up to this many seconds are added at random to every start, so jobs sharing an interval do not fire together.
+            run_now (bool): Start the first run straight away instead of after one interval.
+
+        Returns:
+            Job: The registered job.
+        """
+        job = Job(name or func.__name__, func, interval, timeout=timeout, jitter=jitter, run_now=run_now)
+        self.jobs[job.name] = job
+        return job
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    async def run_job(self, job: Job) -> JobRun:
+        """Runs job once unless it is still running, and records how it went."""
+        started = time.time()
+        if job.running:
+            print(f'[{job.name}] Previous run still in progress, skipping')
+            run = JobRun(started, 0.0, 'skipped')
+            job.history.append(run)
+            return run
+
+        job._future = self._executor.submit(job.func)
+        start = time.monotonic()
+        try:
+            # shield keeps a timeout from cancelling the wrapper the overlap check relies on
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job._future)), job.timeout)
+        except asyncio.TimeoutError:
+            run = JobRun(started, time.monotonic() - start, 'timeout', f'exceeded {job.timeout}s')
+        except Exception as e:
+            # The traceback goes to the log, the run only keeps a summary for the stats
+            logger.exception('[%s] Job raised', job.name)
+            run = JobRun(started, time.monotonic() - start, 'failed', repr(e))
+        else:
+            run = JobRun(started, time.monotonic() - start, 'ok')
+        job.history.append(run)
+
+        message = f'[{job.name}] {run.status} in {run.seconds:.1f}s'
+        print(f'{message}: {run.error}' if run.error else message)
+        return run
+
+    def _finished(self, task: 'asyncio.Future') -> None:
+        self._tasks.discard(task)
+        # run_job handles the job's own errors, anything reaching here is a bug in the scheduler
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Job run crashed', exc_info=task.exception())
+
+    async def _loop(self, job: Job) -> None:
+        loop = asyncio.get_event_loop()
+        due = loop.time() if job.run_now else loop.time() + job.interval
+        while True:
+            await asyncio.sleep(max(0.0, due - loop.time()) + random.uniform(0, job.jitter))
+            task = asyncio.ensure_future(self.run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._finished)
+            due += job.interval
+            # Skip the slots we slept through instead of firing them back to back
+            while due <= loop.time():
+                due += job.interval
+
+    def run_forever(self) -> None:
+        """Starts every job and blocks, running them until interrupted."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(asyncio.gather(*[self._loop(job) for job in self.jobs.values()]))
+        finally:
+            self._executor.shutdown(wait=False)
+            loop.close()
+
+class SharedLock:
+    """A lock any number of readers can hold at once, or a single writer.
+
+    Lets the pipelines read the JHU mirror concurrently while a sync has to wait for them,
+    and them for it.
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._cond:
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        # Holding the condition's lock keeps new readers out until the writer is done
+        with self._cond:
+            self._cond.wait_for(lambda: not self._readers)
+            yield
@@ -0,0 +1,165 @@
+import pandas as pd
+import numpy as np
+import io
+import os
+import pandemics.compact
+import pandemics.utils
+from datetime import datetime
+from typing import *
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FORMATS = {
+    'parquet': '.parquet',
+    'feather': '.arrow'
+}
+
+def is_available() -> bool:
+    return pa is not None
+
+def columnar_path(csv_path: str, fmt: str = 'parquet') -> str:
+    """Returns the path the columnar copy of csv_path is written to."""
+    return os.path.splitext(csv_path)[0] + FORMATS[fmt]
+
+def to_long(df: Union[pd.DataFrame, pandemics.compact.CompactTable]) -> pd.DataFrame:
+    """Turns a wide timeseries table into one row per region and date.
+
+    Every column that is not an M/D/YY date is kept as a key column. Missing cells are
+    dropped, so the value column is a plain int64.
+
+    Args:
+        df (Union[pd.DataFrame, CompactTable]): A wide table as written to the timeseries CSVs.
+
+    Returns:
+        pd.DataFrame: The key columns followed by date (datetime64) and value (int64).
+    """
+    if isinstance(df, pandemics.compact.CompactTable):
+        # Categorical region names come out as the strings they stand for, not as dictionaries
+        rows, cols = np.nonzero(df.valid)
+        long = {col: df.keys[col].to_numpy()[rows] for col in df.keys.columns}
+        long['date'] = pandemics.utils.parse_date_labels(df.labels).values[cols]
+        long['value'] = df.counts[rows, cols].astype('int64')
+        return pd.DataFrame(long)
+
+    date_cols = [col for col in df.columns if '/' in col]
+    key_cols = [col for col in df.columns if col not in date_cols]
+    dates = pandemics.utils.parse_date_labels(date_cols)
+
+    values = df[date_cols].to_numpy(dtype='float64', na_value=np.nan)
+    present = ~np.isnan(values)
+    rows, cols = np.nonzero(present)
+
+    long = {col: df[col].to_numpy()[rows] for col in key_cols}
+    long['date'] = dates.values[cols]
+    long['value'] = values[rows, cols].astype('int64')
+    return pd.DataFrame(long)
+
+class WideTable(NamedTuple):
+    """A wide timeseries CSV as published, split into what it is made of.
+
+    keys holds the columns before the dates as the strings the CSV has, '' where empty, so
+    they can be written back out unchanged. values holds a row per region and a column per
+    date label, NaN where a cell is empty.
+    """
+    keys: pd.DataFrame
+    dates: List[str]
+    values: np.ndarray
+
+def read_wide(data: bytes) -> WideTable:
+    """Parses a timeseries CSV as the service writes it, with an index column first."""
+    header = pd.read_csv(io.BytesIO(data), index_col=0, nrows=0).columns
+    date_cols = [col for col in header if '/' in col]
+    key_cols = [col for col in header if col not in date_cols]
+    dtypes = {**{col: str for col in key_cols}, **{col: 'float64' for col in date_cols}}
+    df = pd.read_csv(io.BytesIO(data), index_col=0, dtype=dtypes)
+    return WideTable(df[key_cols].fillna('').reset_index(drop=True), date_cols, df[date_cols].to_numpy())
+
+def write_wide(table: WideTable) -> bytes:
+    """Writes a table read by read_wide back out exactly like the service writes it."""
+    present = ~np.isnan(table.values)
+    if np.array_equal(table.values[present], np.round(table.values[present])):
+        counts = np.where(present, table.values, 0).astype('int64')
+        columns = {d: pd.arrays.IntegerArray(counts[:, i], ~present[:, i]) for i, d in enumerate(table.dates)}
+    else:
+        columns = {d: table.values[:, i] for i, d in enumerate(table.dates)}
+    df = pd.concat([table.keys, pd.DataFrame(columns, index=table.keys.index)], axis=1)
+    return df.to_csv().encode()
+
+def write_columnar(df: Union[pd.DataFrame, pandemics.compact.CompactTable], csv_path: str, fmt: str = 'parquet') -> str:
+    """Writes a long copy of a wide table next to its CSV.
+
+    Args:
+        df (Union[pd.DataFrame, CompactTable]): The wide table.
+        csv_path (str): Where the CSV copy lives, the extension is swapped for the format's.
+        fmt (str): parquet or feather (Arrow IPC).
+
+    Returns:
+        str: The path written to.
+    """
+    if not is_available():
+        raise ImportError('pyarrow is required for columnar output')
+
+    path = columnar_path(csv_path, fmt)
+    table = pa.Table.from_pandas(to_long(df), preserve_index=False)
+    tmp = path + '.tmp'
+    if fmt == 'parquet':
+        pq.write_table(table, tmp)
+    else:
+        feather.write_feather(table, tmp, compression='uncompressed')
+    os.replace(tmp, path)
+    return path
+
+def read_columnar(path: str, columns: Optional[Sequence[str]] = None, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None, **keys) -> pd.DataFrame:
+    """Reads a long table written by write_columnar, loading only what is asked for.
+
+    The file is memory-mapped and only the requested columns are read. Date and key filters
+    are pushed down to the Parquet reader so row groups outside them are skipped.
+
+    Args:
+        path (str): A .parquet or .arrow file.
+        columns (Optional[Sequence[str]]): Columns to load, all of them when None.
+        start (Optional[datetime]): First date to include.
+        end (Optional[datetime]): Last date to include.
+        **keys: Key column values to keep, e.g. country='Italy' or state=['Ohio', 'Iowa'].
+
+    Returns:
+        pd.DataFrame: The matching rows.
+    """
+    if not is_available():
+        raise ImportError('pyarrow is required for columnar input')
+
+    filters = []
+    if start is not None:
+        filters.append(('date', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('date', '<=', pd.Timestamp(end)))
+    for col, wanted in keys.items():
+        if isinstance(wanted, (list, tuple, set)):
+            filters.append((col, 'in', list(wanted)))
+        else:
+            filters.append((col, '==', wanted))
+
+    if path.endswith(FORMATS['parquet']):
+        table = pq.read_table(path, columns=columns, filters=filters or None, memory_map=True)
+        return table.to_pandas()
+
+    needed = None if columns is None else list(dict.fromkeys(list(columns) + [f[0] for f in filters]))
+    df = feather.read_table(path, columns=needed, memory_map=True).to_pandas()
+    for col, op, value in filters:
+        if op == '>=':
+            df = df[df[col] >= value]
+        elif op == '<=':
+            df = df[df[col] <= value]
+        elif op == 'in':
+            df = df[df[col].isin(value)]
+        else:
+            df = df[df[col] == value]
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
@@ -0,0 +1,226 @@
+import pandas as pd
+import numpy as np
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import *
+import pandemics.fetch
+import pandemics.gazetteer
+import pandemics.processing
+
+def nyt_counties(days: int = 730, counties: int = 3200, seed: int = 0) -> pd.DataFrame:
+    """Builds a long frame shaped like the NYT us-counties.csv feed.
+
+    Counties start reporting on staggered days and counts only ever grow, like the real feed.
+    A handful of rows have no fips, mirroring NYC and the Unknown counties.
+
+    Args:
+        days (int): Number of days the feed spans.
+        counties (int): Number of distinct counties.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        pd.DataFrame: Columns date, county, state, fips, cases, deaths with NYT style YYYY-MM-DD dates.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2020, 1, 21)
+    dates = np.array([(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)])
+
+    fips = (np.arange(counties) + 1001).astype(float)
+    fips[::500] = np.nan
+    county = np.array([f'County {i}' for i in range(counties)])
+    state = np.array([f'State {i % 55}' for i in range(counties)])
+
+    first_day = rng.integers(0, max(days // 3, 1), size=counties)
+    rows = days - first_day
+    idx = np.repeat(np.arange(counties), rows)
+    day = np.concatenate([np.arange(f, days) for f in first_day])
+
+    cases = rng.integers(0, 50, size=len(idx))
+    cases = pd.Series(cases).groupby(idx).cumsum().to_numpy()
+    deaths = cases // 50
+
+    df = pd.DataFrame({
+        'date': dates[day],
+        'county': county[idx],
+        'state': state[idx],
+        'fips': fips[idx],
+        'cases': cases,
+        'deaths': deaths
+    })
+    return df.sort_values('date', kind='stable').reset_index(drop=True)
+
+def merged(days: int = 250, regions: int = 200, seed: int = 0) -> pd.DataFrame:
+    """Builds a table shaped like two sources merged side by side before take_greatest.
+
+    The newest date is reported by both sources as <date>_jhu and <date>_unh columns, some
+    cells are missing and some of the newest numbers drop below the day before.
+
+    Args:
+        days (int): Number of date columns.
+        regions (int): Number of rows.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        pd.DataFrame: country, latitude, longitude and the date columns.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2020, 1, 22)
+    labels = [f'{d.month}/{d.day}/{d:%y}' for d in (start + timedelta(days=i) for i in range(days))]
+
+    counts = rng.integers(0, 100, size=(regions, days)).cumsum(axis=1).astype(float)
+    counts[rng.random(size=counts.shape) < 0.05] = np.nan
+
+    df = pd.DataFrame(counts[:, :-1], columns=labels[:-1])
+    df.insert(0, 'country', [f'Country {i}' for i in range(regions)])
+    df.insert(1, 'latitude', rng.uniform(-60, 60, size=regions))
+    df.insert(2, 'longitude', rng.uniform(-180, 180, size=regions))
+    df.loc[::7, 'latitude'] = np.nan
+
+    newest = counts[:, -1]
+    df[f'{labels[-1]}_jhu'] = newest - rng.integers(0, 200, size=regions) * (rng.random(size=regions) < 0.3)
+    df[f'{labels[-1]}_unh'] = np.where(rng.random(size=regions) < 0.5, newest, np.nan)
+    return df
+
+def world_sheet(countries: int = 200, seed: int = 0) -> str:
+    """Builds an HTML page laid out like the published UNH world Google Sheet.
+
+    Seven header rows and three footer rows surround one row per country, and some cells are
+    blank like in the real sheet.
+
+    Args:
+        countries (int): Number of country rows.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        str: The page.
+    """
+    rng = np.random.default_rng(seed)
+    rows = ['<tr><th>1</th><td>header</td></tr>'] * 7
+    for i in range(countries):
+        cases = int(rng.integers(1, 2000000))
+        deaths = int(rng.integers(0, max(cases // 20, 1)))
+        cells = [f'Country {i:04d}', f'{cases:,}', f'{int(rng.integers(0, 5000)):,}', f'{deaths:,}',
+                 str(int(rng.integers(0, 300))), f'{deaths / cases * 100:.2f}%',
+                 '' if i % 5 == 0 else f'{int(rng.integers(0, 900)):,}', f'{int(rng.integers(0, cases)):,}']
+        tds = ''.join(f'<td class="s{j}" dir="ltr">{cell}</td>' for j, cell in enumerate(cells))
+        rows.append(f'<tr style="height: 20px"><th class="row-header">{i + 8}</th>{tds}</tr>')
+    rows += ['<tr><th>x</th><td>footer</td></tr>'] * 3
+    return f'<html><head><style>td {{ }}</style></head><body><table><tbody>{"".join(rows)}</tbody></table></body></html>'
+
+def date_labels(days: int, start: datetime = datetime(2020, 1, 22)) -> List[str]:
+    return [f'{d.month}/{d.day}/{d:%y}' for d in (start + timedelta(days=i) for i in range(days))]
+
+def _cumulative(rng: np.random.Generator, rows: int, days: int, high: int) -> np.ndarray:
+    return rng.integers(0, high, size=(rows, days)).cumsum(axis=1)
+
+def jhu_global(days: int = 250, countries: int = 190, seed: int = 0) -> pd.DataFrame:
+    """Builds a frame shaped like JHU's time_series_covid19_*_global.csv.
+
+    Every tenth country is split into a few provinces, which jhu_world_normalize sums back up.
+
+    Args:
+        days (int): Number of date columns.
+        countries (int): Number of distinct countries.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        pd.DataFrame: Province/State, Country/Region, Lat, Long and the date columns.
+    """
+    rng = np.random.default_rng(seed)
+    country = np.array([f'Country {i}' for i in range(countries)])
+    provinces = np.where(np.arange(countries) % 10 == 0, 4, 1)
+    idx = np.repeat(np.arange(countries), provinces)
+    province = [f'Province {j}' if provinces[i] > 1 else np.nan for i, j in zip(idx, np.concatenate([np.arange(n) for n in provinces]))]
+
+    df = pd.DataFrame(_cumulative(rng, len(idx), days, 100), columns=date_labels(days))
+    df.insert(0, 'Province/State', province)
+    df.insert(1, 'Country/Region', country[idx])
+    df.insert(2, 'Lat', rng.uniform(-60, 60, size=len(idx)))
+    df.insert(3, 'Long', rng.uniform(-180, 180, size=len(idx)))
+    return df
+
+def jhu_us(days: int = 250, counties: int = 3200, seed: int = 0) -> pd.DataFrame:
+    """Builds a frame shaped like JHU's time_series_covid19_*_US.csv.
+
+    Every state also gets an Unassigned row at 0, 0 like the real file.
+
+    Args:
+        days (int): Number of date columns.
+        counties (int): Number of county rows.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        pd.DataFrame: JHU's identifier columns followed by the date columns.
+    """
+    rng = np.random.default_rng(seed)
+    states = 58
+    state = np.array([f'State {i}' for i in range(states)])
+    idx = np.concatenate([np.arange(counties) % states, np.arange(states)])
+    rows = len(idx)
+    unassigned = np.arange(rows) >= counties
+
+    df = pd.DataFrame(_cumulative(rng, rows, days, 30), columns=date_labels(days))
+    ident = pd.DataFrame({
+        'UID': 84000000 + np.arange(rows),
+        'iso2': 'US',
+        'iso3': 'USA',
+        'code3': 840,
+        'FIPS': np.where(unassigned, np.nan, 1001 + np.arange(rows)),
+        'Admin2': np.where(unassigned, 'Unassigned', [f'County {i}' for i in range(rows)]),
+        'Province_State': state[idx],
+        'Country_Region': 'US',
+        'Lat': np.where(unassigned, 0.0, rng.uniform(25, 49, size=rows)),
+        'Long_': np.where(unassigned, 0.0, rng.uniform(-124, -67, size=rows)),
+        'Combined_Key': [f'County {i}, {s}, US' for i, s in enumerate(state[idx])]
+    })
+    return pd.concat([ident, df], axis=1)
+
+def unh_world(countries: int = 190, seed: int = 0) -> pd.DataFrame:
+    """Builds a geocoded world snapshot like pandemics.fetch.world_data returns."""
+    rng = np.random.default_rng(seed)
+    cases = rng.integers(1, 2000000, size=countries)
+    deaths = cases // rng.integers(20, 100, size=countries)
+    df = pd.DataFrame({
+        'country': [f'Country {i}' for i in range(countries)],
+        'cases': cases,
+        'new_cases': rng.integers(0, 5000, size=countries),
+        'deaths': deaths,
+        'new_deaths': rng.integers(0, 300, size=countries),
+        'percent_deaths': (deaths / cases).round(4),
+        'serious_and_critical': rng.integers(0, 900, size=countries),
+        'recovered': cases // 2,
+        'latitude': rng.uniform(-60, 60, size=countries),
+        'longitude': rng.uniform(-180, 180, size=countries)
+    })
+    return pandemics.processing.unh_world_normalize(df)
+
+def county_table(fips: Iterable[float], seed: int = 0) -> pd.DataFrame:
+    """Builds the fips to coordinates table pandemics.fetch.county_table scrapes."""
+    rng = np.random.default_rng(seed)
+    codes = [str(int(f)).zfill(5) for f in pd.unique(pd.Series(list(fips)).dropna())]
+    return pd.DataFrame({
+        'fips': codes,
+        'latitude': rng.uniform(25, 49, size=len(codes)),
+        'longitude': rng.uniform(-124, -67, size=len(codes))
+    })
+
+@contextmanager
+def stubbed_network(county_table: Optional[pd.DataFrame] = None, world: Optional[pd.DataFrame] = None,
+                    state: Optional[pd.DataFrame] = None) -> Iterator[None]:
+    """Answers the fetch functions and gazetteer the stages use from synthetic frames instead of the network."""
+    stubs = {
+        'county_table': lambda: county_table.copy(),
+        'world_data': lambda normalize=True: world.copy(),
+        'state_data': lambda normalize=True: state.copy()
+    }
+    originals = {name: getattr(pandemics.fetch, name) for name in stubs}
+    for name, stub in stubs.items():
+        setattr(pandemics.fetch, name, stub)
+    if county_table is not None:
+        pandemics.gazetteer.set_gazetteer(pandemics.gazetteer.build(county_table))
+    try:
+        yield
+    finally:
+        for name, original in originals.items():
+            setattr(pandemics.fetch, name, original)
+        pandemics.gazetteer.set_gazetteer(None)
@@ -0,0 +1,122 @@
+import pandas as pd
+from typing import *
+import pandemics.metrics
+
+class Column(NamedTuple):
+    """One column to pull out of an HTML table.
+
+    kind says how the cell text is cleaned: 'text' keeps it as is, 'int' parses counts like
+    1,234, 'percent' turns 12.5% into 0.125 and 'degrees' parses coordinates like -81.2°.
+    """
+    name: str
+    index: int
+    kind: str = 'text'
+
+class TableSpec(NamedTuple):
+    """Where a table lives in a page and which of its rows and cells we want.
+
+    Args:
+        columns (Sequence[Column]): The columns to extract, in output order. Negative indexes count from the end of each row.
+        rows (slice): The tr elements to keep, e.g. to skip header and footer rows.
+        table (str): XPath of the element holding the rows.
+    """
+    columns: Sequence[Column]
+    rows: slice = slice(None)
+    table: str = '(//tbody)[1]'
+
+# Google Sheets pages published by the UNH team
+WORLD_SHEET = TableSpec(
+    columns=(
+        Column('country', 0),
+        Column('cases', 1, 'int'),
+        Column('new_cases', 2, 'int'),
+        Column('deaths', 3, 'int'),
+        Column('new_deaths', 4, 'int'),
+        Column('percent_deaths', 5, 'percent'),
+        Column('serious_and_critical', 6, 'int'),
+        Column('recovered', 7, 'int')
+    ),
+    rows=slice(7, -3)
+)
+
+STATE_SHEET = TableSpec(
+    columns=(
+        Column('state', 0),
+        Column('cases', 1, 'int'),
+        Column('deaths', 3, 'int'),
+        Column('recovered', 7, 'int')
+    ),
+    rows=slice(5, 64)
+)
+
+CANADA_SHEET = TableSpec(
+    columns=(
+        Column('province', 0),
+        Column('cases', 1, 'int'),
+        Column('deaths', 2, 'int'),
+        Column('serious', 3, 'int'),
+        Column('critical', 4, 'int'),
+        Column('recovered', 5, 'int')
+    ),
+    rows=slice(5, -1)
+)
+
+# Wikipedia's county table, the first row holds the headers
+COUNTY_TABLE = TableSpec(
+    columns=(
+        Column('fips', 2),
+        Column('latitude', -2, 'degrees'),
+        Column('longitude', -1, 'degrees')
+    ),
+    rows=slice(1, None),
+    table='(//table)[1]//tbody'
+)
+
+def _clean(texts: List[Optional[str]], kind: str) -> pd.Series:
+    s = pd.Series(texts, dtype=object)
+    if kind == 'text':
+        return s
+    s = s.str.strip()
+    if kind == 'int':
+        n = pd.to_numeric(s.str.replace(',', '', regex=False), errors='coerce')
+        # Anything that is not a whole number (blank, n/a, 1.5) is missing, like try_int
+        return n.where(n % 1 == 0).astype('Int64')
+    if kind == 'percent':
+        return (pd.to_numeric(s.str[:-1]) * .01).round(4)
+    if kind == 'degrees':
+        s = s.str.strip('°').str.replace('–', '-', regex=False)
+        return pd.to_numeric(s).astype('float64')
+    raise ValueError(f'Unknown column kind {kind!r}')
+
+@pandemics.metrics.timed('parse')
+def extract_table(html: Union[str, bytes], spec: TableSpec) -> pd.DataFrame:
+    """Pulls the columns described by spec out of an HTML page.
+
+    The page is parsed once with lxml and only the wanted cells are read, after which every
+    column is cleaned in one vectorized pass.
+
+    Args:
+        html (Union[str, bytes]): The page.
+        spec (TableSpec): What to extract.
+
+    Returns:
+        pd.DataFrame: One column per spec column, counts as Int64.
+    """
+    import lxml.html
+    doc = lxml.html.fromstring(html)
+    table = doc.xpath(spec.table)[0]
+    rows = table.findall('.//tr')[spec.rows]
+
+    texts = [[] for _ in spec.columns]
+    for row in rows:
+        cells = row.findall('.//td')
+        for column, out in zip(spec.columns, texts):
+            try:
+                cell = cells[column.index]
+            except IndexError:
+                out.append(None)
+            else:
+                # Most cells hold bare text, only walk the ones with markup inside
+                out.append((cell.text if len(cell) == 0 else cell.text_content()) or None)
+
+    return pd.DataFrame({column.name: _clean(out, column.kind) for column, out in zip(spec.columns, texts)})
@@ -0,0 +1,108 @@
+import gzip
+import http.client
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import pandemics.api
+
+STATES = ['Ohio', 'Iowa', 'Utah'] + [f'State {i}' for i in range(40)]
+DAYS = 30
+
+def state_csv(offset: int = 0) -> bytes:
+    dates = pd.date_range('2020-03-01', periods=DAYS)
+    df = pd.DataFrame({'state': STATES, 'latitude': np.linspace(30, 45, len(STATES)), 'longitude': np.linspace(-120, -70, len(STATES))})
+    for i, date in enumerate(dates):
+        counts = pd.array(np.arange(len(STATES)) * 100 + i + offset, dtype='Int64')
+        # Iowa only starts reporting on the third day
+        if i < 2:
+            counts[1] = pd.NA
+        df[f'{date.month}/{date.day}/{date:%y}'] = counts
+    return df.to_csv().encode()
+
+def average_csv() -> bytes:
+    return pd.DataFrame({'state': ['Ohio'], 'latitude': [40.0], 'longitude': [-82.0], '3/1/20': [1.5], '3/2/20': [2.25]}).to_csv().encode()
+
+@pytest.fixture
+def api():
+    store = pandemics.api.Store()
+    store.update_csvs({'out/us_state_confirmed.csv': state_csv(), 'out/us_state_confirmed_avg7.csv': average_csv()})
+    server = pandemics.api.serve(store, 0)
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+
+    def get(path, **headers):
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        return response, response.read()
+    get.store = store
+    yield get
+    conn.close()
+    server.shutdown()
+    server.server_close()
+
+def test_lists_datasets(api):
+    response, body = api('/')
+    listing = json.loads(body)
+    assert sorted(listing) == ['us_state_confirmed', 'us_state_confirmed_avg7']
+    assert listing['us_state_confirmed'] == {'regions': len(STATES), 'first': '2020-03-01', 'last': '2020-03-30', 'keys': ['state']}
+
+def test_filters_and_date_slices(api):
+    response, body = api('/us_state_confirmed?state=Iowa&state=Ohio&start=2020-03-02&end=2020-03-04')
+    assert response.status == 200 and response.getheader('Content-Type') == 'application/json'
+    doc = json.loads(body)
+    assert doc['dates'] == ['2020-03-02', '2020-03-03', '2020-03-04']
+    # Table order, not the order asked for, with missing cells as null
+    assert [r['state'] for r in doc['regions']] == ['Ohio', 'Iowa']
+    assert doc['regions'][0]['values'] == [1, 2, 3]
+    assert doc['regions'][1]['values'] == [None, 102, 103]
+    assert isinstance(doc['regions'][0]['latitude'], float)
+
+    _, body = api('/us_state_confirmed?state=Nowhere')
+    assert json.loads(body)['regions'] == []
+    _, body = api('/us_state_confirmed?start=2020-04-01')
+    assert json.loads(body)['dates'] == []
+
+    _, body = api('/us_state_confirmed_avg7')
+    assert json.loads(body)['regions'][0]['values'] == [1.5, 2.25]
+
+def test_csv_format(api):
+    response, body = api('/us_state_confirmed?state=Iowa&end=2020-03-03&format=csv')
+    assert response.getheader('Content-Type') == 'text/csv'
+    assert body.decode().splitlines() == ['state,latitude,longitude,3/1/20,3/2/20,3/3/20', f'Iowa,{np.linspace(30, 45, len(STATES))[1]},{np.linspace(-120, -70, len(STATES))[1]},,,102']
+
+@pytest.mark.parametrize('path,status', [
+    ('/nothing', 404),
+    ('/us_state_confirmed?county=King', 400),
+    ('/us_state_confirmed?format=xml', 400),
+    ('/us_state_confirmed?start=3/1/20', 400)
+])
+def test_bad_requests(api, path, status):
+    response, _ = api(path)
+    assert response.status == status
+
+def test_etag_and_gzip(api):
+    plain, body = api('/us_state_confirmed')
+    assert len(body) >= pandemics.api.GZIP_MIN_BYTES and plain.getheader('Content-Encoding') is None
+    etag = plain.getheader('ETag')
+    response, empty = api('/us_state_confirmed', **{'If-None-Match': etag})
+    assert response.status == 304 and empty == b''
+
+    zipped, compressed = api('/us_state_confirmed', **{'Accept-Encoding': 'gzip'})
+    assert zipped.getheader('Content-Encoding') == 'gzip'
+    assert gzip.decompress(compressed) == body
+    assert zipped.getheader('ETag') != etag
+
+    # Below the threshold the body is sent as it is
+    small, _ = api('/us_state_confirmed?state=Ohio', **{'Accept-Encoding': 'gzip'})
+    assert small.getheader('Content-Encoding') is None
+
+def test_update_swaps_datasets(api):
+    before, old = api('/us_state_confirmed?state=Ohio')
+    api.store.update_csvs({'out/us_state_confirmed.csv': state_csv(offset=1000)})
+
+    response, new = api('/us_state_confirmed?state=Ohio', **{'If-None-Match': before.getheader('ETag')})
+    assert response.status == 200
+    assert json.loads(new)['regions'][0]['values'][0] == json.loads(old)['regions'][0]['values'][0] + 1000
+    # Datasets that were not reloaded are still served
+    response, _ = api('/us_state_confirmed_avg7')
+    assert response.status == 200
@@ -0,0 +1,100 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+import pandemics.fetch
+import pandemics.gazetteer
+import pandemics.legacy
+import pandemics.processing
+
+KEYS = ['county', 'state', 'fips']
+
+def nyt_feed() -> pd.DataFrame:
+    # NYC and Unknown have no fips, Snohomish only starts reporting on the second day
+    rows = []
+    for day, date in enumerate(['2020-03-01', '2020-03-02', '2020-03-03']):
+        rows += [(date, 'King', 'Washington', 53033.0, 10 + day, day),
+                 (date, 'New York City', 'New York', np.nan, 100 + day, 2 * day),
+                 (date, 'Unknown', 'Washington', np.nan, day, 0)]
+        if day:
+            rows.append((date, 'Snohomish', 'Washington', 53061.0, 5 * day, 0))
+    return pd.DataFrame(rows, columns=['date', 'county', 'state', 'fips', 'cases', 'deaths'])
+
+@pytest.fixture
+def gazetteer():
+    table = pd.DataFrame({'fips': ['53033', '53061'], 'latitude': [47.49, 48.05], 'longitude': [-121.83, -121.7]})
+    pandemics.gazetteer.set_gazetteer(pandemics.gazetteer.build(table))
+    yield
+    pandemics.gazetteer.set_gazetteer(None)
+
+def test_nan_fips_counties_are_one_row(gazetteer):
+    confirmed, deaths = pandemics.processing.nyt_county_normalize(nyt_feed())
+
+    for table in (confirmed, deaths):
+        assert list(table.columns) == KEYS + ['latitude', 'longitude', '3/1/20', '3/2/20', '3/3/20']
+        assert (table.dtypes[5:] == 'Int64').all()
+        assert sorted(table.county) == ['King', 'New York City', 'Snohomish', 'Unknown']
+
+    nyc = confirmed[confirmed.county == 'New York City'].iloc[0]
+    assert list(nyc[5:]) == [100, 101, 102]
+    assert np.isnan(nyc.latitude)
+    snohomish = confirmed[confirmed.county == 'Snohomish'].iloc[0]
+    assert snohomish['3/1/20'] is pd.NA and snohomish['3/2/20'] == 5
+    king = deaths[deaths.county == 'King'].iloc[0]
+    assert (king.fips, king.latitude, list(king[5:])) == ('53033', 47.49, [0, 1, 2])
+
+def test_pivot_matches_legacy_transpose_once_per_region():
+    df = nyt_feed().rename(columns={'cases': 'confirmed'})
+    df['date'] = pd.to_datetime(df.date).dt.strftime('%-m/%-d/%y')
+    confirmed, _ = pandemics.processing.pivot_nyt_data(df)
+
+    legacy = pandemics.legacy.transpose_nyt_data(df.drop(columns='deaths'), 'confirmed')
+    # The legacy merge seeded a row per NaN-fips row, repeating NYC and Unknown once per date
+    assert (legacy.county == 'New York City').sum() == 3
+    legacy = legacy.drop_duplicates(KEYS)
+
+    def ordered(t):
+        return t.sort_values(KEYS[:2]).reset_index(drop=True).astype(object)
+    assert ordered(confirmed).equals(ordered(legacy))
+
+class FeedResponse:
+    """Stands in for the streamed response county_chunks reads the feed from."""
+
+    def __init__(self, body: bytes):
+        self.raw = io.BytesIO(body)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.raw.close()
+
+    def raise_for_status(self):
+        pass
+
+def long_feed(days: int = 8) -> pd.DataFrame:
+    # Counties join on later days, so the categories of each chunk differ
+    counties = [('King', 'Washington', 53033.0), ('New York City', 'New York', np.nan), ('Unknown', 'Washington', np.nan),
+                ('Snohomish', 'Washington', 53061.0), ('Kings', 'New York', 36047.0)]
+    rows = []
+    for day, date in enumerate(pd.date_range('2020-03-01', periods=days).strftime('%Y-%m-%d')):
+        for i, (county, state, fips) in enumerate(counties[:2 + day // 2]):
+            rows.append((date, county, state, fips, 10 * i + day, day // 3))
+    return pd.DataFrame(rows, columns=['date', 'county', 'state', 'fips', 'cases', 'deaths'])
+
+def test_streamed_chunks_match_whole_body(gazetteer, monkeypatch):
+    text = long_feed().to_csv(index=False)
+    monkeypatch.setattr(pandemics.fetch, '_get', lambda url, **kwargs: FeedResponse(text.encode()))
+    monkeypatch.setattr(pandemics.fetch, 'get_text', lambda url: text)
+
+    chunks = list(pandemics.fetch.county_chunks(chunk_rows=6))
+    # A date is split across two chunks and later chunks know counties the first does not
+    assert chunks[0].date.iloc[-1] == chunks[1].date.iloc[0]
+    assert set(chunks[-1].county.cat.categories) - set(chunks[0].county.cat.categories)
+    assert chunks[0].fips.isna().any()
+
+    streamed = pandemics.processing.nyt_county_normalize_chunks(iter(chunks))
+    whole = pandemics.fetch.county_data(stream=False)
+    for a, b in zip(streamed, whole):
+        assert len(a) == 5
+        assert a.to_csv() == b.to_csv()
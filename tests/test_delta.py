@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import os
+from os.path import join
+import pandemics.delta
+
+def wide_csv(counts: np.ndarray, regions: int) -> bytes:
+    dates = pd.date_range('2020-01-22', periods=counts.shape[1])
+    df = pd.DataFrame({
+        'country': [f'Country {i}' for i in range(regions)],
+        'latitude': np.linspace(-40, 60, regions),
+        'longitude': np.linspace(-120, 150, regions)
+    })
+    for i, date in enumerate(dates):
+        df[f'{date.month}/{date.day}/{date.strftime("%y")}'] = pd.array(counts[:regions, i], dtype='Int64')
+    return df.to_csv().encode()
+
+def publish(root: str, files: dict) -> None:
+    for path, data in files.items():
+        os.makedirs(os.path.dirname(join(root, path)), exist_ok=True)
+        with open(join(root, path), 'wb') as fp:
+            fp.write(data)
+
+def test_rebuild_from_every_listed_base(tmp_path):
+    root = str(tmp_path)
+    rng = np.random.default_rng(0)
+    # An even number of slots with two tables taking turns is what used to make changesets share files
+    slots = 4
+    tables = {
+        'covid_19_timeseries_data/a.csv': {'counts': np.cumsum(rng.integers(0, 9, (12, 5)), axis=1), 'regions': 10},
+        'covid_19_timeseries_data/b.csv': {'counts': np.cumsum(rng.integers(0, 9, (12, 5)), axis=1), 'regions': 10}
+    }
+    versions = {}
+
+    for cycle in range(30):
+        path = list(tables)[cycle % 2]
+        table = tables[path]
+        if cycle % 3 == 0:
+            table['counts'] = np.hstack([table['counts'], table['counts'][:, -1:] + rng.integers(0, 9, (12, 1))])
+        else:
+            table['counts'][rng.integers(0, 12), -1] += 1 + rng.integers(0, 9)
+        if cycle % 7 == 0:
+            table['regions'] = min(12, table['regions'] + 1)
+        data = wide_csv(table['counts'], table['regions'])
+        versions[pandemics.delta.sha1(data)] = data
+
+        files = pandemics.delta.changesets(root, {path: data}, slots=slots)
+        publish(root, {**files, path: data})
+
+    manifest = pandemics.delta.load_manifest(root)
+    for path in tables:
+        name = pandemics.delta.table_name(path)
+        entry = manifest['tables'][name]
+        assert len(entry['deltas']) == slots
+        with open(join(root, path), 'rb') as fp:
+            latest = fp.read()
+        for delta in entry['deltas']:
+            base = versions[delta['previous_sha1']]
+            assert pandemics.delta.rebuild(base, manifest, name, root) == latest
+
+def test_identical_tables_get_no_changeset(tmp_path):
+    root = str(tmp_path)
+    data = wide_csv(np.arange(15).reshape(3, 5), 3)
+    publish(root, {'t.csv': data})
+    files = pandemics.delta.changesets(root, {'t.csv': data})
+    assert list(files) == [join(pandemics.delta.DELTA_FOLDER, pandemics.delta.MANIFEST_NAME)]
+    assert pandemics.delta.load_manifest(root)['sequence'] == 0
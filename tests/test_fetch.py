@@ -0,0 +1,105 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import pytest
+import pandemics.fetch
+import pandemics.metrics
+
+FEED = b'date,county,state,fips,cases,deaths\n2020-03-01,King,Washington,53033,1,0\n2020-03-01,Snohomish,Washington,53061,2,0\n'
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.requests = []
+        self.connections = set()
+        self.failures = {'/flaky': 2}
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        server.connections.add(self.client_address)
+
+        if server.failures.get(self.path):
+            server.failures[self.path] -= 1
+            self.reply(503, b'try again')
+        elif self.path == '/etag' and self.headers.get('If-None-Match') == '"v1"':
+            self.reply(304, b'', etag='"v1"')
+        elif self.path == '/etag':
+            self.reply(200, b'versioned body', etag='"v1"')
+        elif self.path == '/feed.csv' and self.headers.get('If-None-Match') == '"f1"':
+            self.reply(304, b'', etag='"f1"')
+        elif self.path == '/feed.csv':
+            self.reply(200, FEED, etag='"f1"')
+        else:
+            self.reply(200, f'body of {self.path}'.encode())
+
+    def reply(self, status, body, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server(monkeypatch):
+    stub = StubServer()
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    # Retries back off for real otherwise
+    monkeypatch.setattr(pandemics.fetch, 'RETRY_BACKOFF', 0)
+    monkeypatch.setattr(pandemics.fetch, '_session', None)
+    monkeypatch.setattr(pandemics.fetch, '_bodies', {})
+    monkeypatch.setattr(pandemics.fetch, '_validators', {})
+    pandemics.fetch.set_session(pandemics.fetch.make_session())
+    yield stub
+    stub.shutdown()
+    stub.server_close()
+
+def test_connections_are_reused(server):
+    for _ in range(5):
+        assert pandemics.fetch.get_text(f'{server.url}/page') == 'body of /page'
+    assert len(server.requests) == 5
+    assert len(server.connections) == 1
+
+def test_5xx_is_retried(server):
+    assert pandemics.fetch.get_text(f'{server.url}/flaky') == 'body of /flaky'
+    assert [path for path, _ in server.requests] == ['/flaky'] * 3
+
+def test_unchanged_page_costs_a_304(server):
+    url = f'{server.url}/etag'
+    first = pandemics.fetch.page_digest(url)
+    # The body page_digest downloaded is handed to the next get_text instead of fetched again
+    assert pandemics.fetch.get_text(url) == 'versioned body'
+    assert pandemics.fetch.page_digest(url) == first
+
+    assert len(server.requests) == 2
+    assert 'If-None-Match' not in server.requests[0][1]
+    assert server.requests[1][1]['If-None-Match'] == '"v1"'
+
+def test_streamed_feed_is_downloaded_once_per_change(server, monkeypatch):
+    url = f'{server.url}/feed.csv'
+    monkeypatch.setattr(pandemics.fetch, 'COUNTY_URL', url)
+    monkeypatch.setattr(pandemics.fetch, 'STREAMED_URLS', {url})
+
+    with pandemics.metrics.recorded() as records:
+        first = pandemics.fetch.page_digest(url)
+        chunks = list(pandemics.fetch.county_chunks())
+        assert pandemics.fetch.page_digest(url) == first
+
+    # The change check reads only the headers, the parser downloads the body
+    assert [record.bytes for record in records] == [0, 0]
+    assert sum(len(chunk) for chunk in chunks) == 2
+    assert len(server.requests) == 3
+    assert server.requests[2][1]['If-None-Match'] == '"f1"'
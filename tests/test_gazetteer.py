@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+import pandemics.fetch
+import pandemics.gazetteer
+
+@pytest.fixture
+def stale(tmp_path):
+    path = str(tmp_path / 'gazetteer.npz')
+    old = pandemics.gazetteer.Gazetteer(np.array([53033], dtype='int32'), np.array([47.49]), np.array([-121.83]), 1000.0)
+    pandemics.gazetteer.save(old, path)
+    pandemics.gazetteer.set_gazetteer(None)
+    yield path
+    pandemics.gazetteer.set_gazetteer(None)
+
+def test_failed_rebuild_keeps_the_saved_gazetteer(stale, monkeypatch):
+    calls = []
+    def county_table():
+        calls.append(1)
+        raise ConnectionError('offline')
+    monkeypatch.setattr(pandemics.fetch, 'county_table', county_table)
+
+    kept = pandemics.gazetteer.get_gazetteer(stale)
+    # built is part of the county fingerprint, so it has to match what a restart loads
+    assert kept.built == pandemics.gazetteer.load(stale).built == 1000.0
+    assert pandemics.gazetteer.get_gazetteer(stale) is kept
+    assert len(calls) == 1
+
+    # A restart loads the same stamp and tries the rebuild again
+    pandemics.gazetteer.set_gazetteer(None)
+    assert pandemics.gazetteer.get_gazetteer(stale).built == 1000.0
+    assert len(calls) == 2
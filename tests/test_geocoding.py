@@ -0,0 +1,77 @@
+import shelve
+import threading
+from collections import Counter
+import pytest
+import pandemics.geocoding
+
+class Location:
+    def __init__(self, latitude: float, longitude: float):
+        self.latitude = latitude
+        self.longitude = longitude
+
+class FakeGeocoder:
+    """Knows a fixed set of places and counts how often each name is asked for."""
+
+    def __init__(self, places):
+        self.places = dict(places)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def geocode(self, name):
+        with self._lock:
+            self.calls[name] += 1
+        latlon = self.places.get(name)
+        return Location(*latlon) if latlon else None
+
+@pytest.fixture
+def shelf(tmp_path, monkeypatch):
+    monkeypatch.setattr(pandemics.geocoding, '_caches', {})
+    monkeypatch.setattr(pandemics.geocoding, '_limiter', pandemics.geocoding.RateLimiter(0))
+    return str(tmp_path / 'latlon.shelve')
+
+def test_misses_are_geocoded_once(shelf):
+    geocoder = FakeGeocoder({'Ohio': (40.4, -82.9), 'Iowa': (41.9, -93.1)})
+    coords = pandemics.geocoding.geocode_many(geocoder, ['Ohio', 'Iowa', 'Ohio', 'Ohio', 'Bhutan'], path=shelf)
+
+    assert coords == {'Ohio': (40.4, -82.9), 'Iowa': (41.9, -93.1), 'Bhutan': pandemics.geocoding.KNOWN_LOCATIONS['Bhutan']}
+    assert geocoder.calls == {'Ohio': 1, 'Iowa': 1}
+    pandemics.geocoding.geocode_many(geocoder, ['Iowa', 'Ohio'], path=shelf)
+    assert geocoder.calls == {'Ohio': 1, 'Iowa': 1}
+
+    # Written through to the shelf, a restart does not geocode them again
+    pandemics.geocoding.get_cache(shelf).close()
+    assert pandemics.geocoding.LocationCache(shelf).get('Iowa') == (41.9, -93.1)
+
+def test_failures_expire_after_negative_ttl(shelf):
+    geocoder = FakeGeocoder({})
+    assert pandemics.geocoding.geocode_many(geocoder, ['Atlantis'], path=shelf) == {'Atlantis': (None, None)}
+    assert pandemics.geocoding.geocode_many(geocoder, ['Atlantis'], path=shelf) == {'Atlantis': (None, None)}
+    assert geocoder.calls['Atlantis'] == 1
+
+    cache = pandemics.geocoding.get_cache(shelf)
+    cache.negatives['Atlantis'] -= cache.negative_ttl + 1
+    geocoder.places['Atlantis'] = (1.0, 2.0)
+    assert pandemics.geocoding.geocode_many(geocoder, ['Atlantis'], path=shelf) == {'Atlantis': (1.0, 2.0)}
+    assert geocoder.calls['Atlantis'] == 2
+    assert 'Atlantis' not in cache.negatives
+    cache.close()
+    with shelve.open(shelf) as data:
+        assert data['Atlantis'] == (1.0, 2.0) and '__negative__:Atlantis' not in data
+
+def test_legacy_failures_are_retried_once(shelf):
+    # Older versions stored failures as (None, None) and never looked them up again
+    with shelve.open(shelf) as data:
+        data['Atlantis'] = (None, None)
+        data['Ohio'] = (40.4, -82.9)
+
+    geocoder = FakeGeocoder({})
+    cache = pandemics.geocoding.get_cache(shelf)
+    assert cache.get('Atlantis') is None and cache.get('Ohio') == (40.4, -82.9)
+
+    for _ in range(3):
+        assert pandemics.geocoding.geocode_many(geocoder, ['Atlantis', 'Ohio'], path=shelf)['Atlantis'] == (None, None)
+    assert geocoder.calls == {'Atlantis': 1}
+
+    # The retried failure now carries a timestamp, so a restart does not retry it either
+    cache.close()
+    assert pandemics.geocoding.LocationCache(shelf).get('Atlantis') == (None, None)
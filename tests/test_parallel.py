@@ -0,0 +1,62 @@
+import pandas as pd
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+import pandemics.compact
+import pandemics.fetch
+import pandemics.jhu
+import pandemics.metrics
+import pandemics.parallel
+import pandemics.processing
+import pandemics.synthetic
+import pandemics.utils
+
+pytestmark = pytest.mark.skipif(not pandemics.parallel.is_available(), reason='needs pyarrow')
+
+def test_world_update_parses_only_appended_columns(tmp_path, monkeypatch):
+    days, cycles = 40, 4
+    jhu = pandemics.synthetic.jhu_global(days + cycles, 30)
+    unh = pandemics.synthetic.unh_world(30)
+    monkeypatch.setattr(pandemics.fetch, 'world_data', lambda normalize=True: unh.copy())
+    monkeypatch.setattr(pandemics.utils, 'timeseries_date', lambda: '6/1/20')
+    monkeypatch.setattr(pandemics.processing, 'jhu_series', pandemics.jhu.SeriesCache())
+
+    dates = len(jhu.columns) - cycles
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        for cycle in range(cycles):
+            for csv in pandemics.processing.JHU_WORLD_CSVS:
+                jhu.iloc[:, :dates + cycle].to_csv(os.path.join(tmp_path, csv), index=False)
+            tables = pandemics.parallel.get_world_update(str(tmp_path), pool=pool)
+
+            expected = []
+            for csv, column in zip([pandemics.processing.JHU_WORLD_CONFIRMED_CSV, pandemics.processing.JHU_WORLD_RECOVERED_CSV,
+                                    pandemics.processing.JHU_WORLD_DEATHS_CSV], ['cases', 'recovered', 'deaths']):
+                world = pandemics.processing.jhu_world_normalize(pd.read_csv(os.path.join(tmp_path, csv)))
+                expected.append(pandemics.processing.join_world_series(world, unh, column, pandemics.processing.snapshot_date()))
+            assert [t.to_csv() for t in tables] == [t.to_csv() for t in expected]
+
+    # The cache lives in this process, the workers only join what it read
+    assert pandemics.processing.jhu_series.full_reads == len(pandemics.processing.JHU_WORLD_CSVS)
+    assert pandemics.processing.jhu_series.appends == len(pandemics.processing.JHU_WORLD_CSVS) * (cycles - 1)
+
+def test_shared_pool_passes_on_settings_and_stage_records(tmp_path, monkeypatch):
+    jhu = pandemics.synthetic.jhu_global(20, 10)
+    for csv in pandemics.processing.JHU_WORLD_CSVS:
+        jhu.to_csv(os.path.join(tmp_path, csv), index=False)
+    unh = pandemics.synthetic.unh_world(10)
+    monkeypatch.setattr(pandemics.fetch, 'world_data', lambda normalize=True: unh.copy())
+    monkeypatch.setattr(pandemics.utils, 'timeseries_date', lambda: '6/1/20')
+    monkeypatch.setattr(pandemics.processing, 'COMPACT', True)
+    monkeypatch.setattr(pandemics.parallel, '_pool', None)
+
+    def joins():
+        return pandemics.metrics.registry._totals.get(('join', 'ok'), {}).get('runs', 0)
+
+    before = joins()
+    try:
+        tables = pandemics.parallel.get_world_update(str(tmp_path))
+    finally:
+        pandemics.parallel.get_pool().shutdown()
+    assert all(isinstance(t, pandemics.compact.CompactTable) for t in tables)
+    # Each worker joined one series, their records were merged into this process's registry
+    assert joins() - before == 3
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+import pandemics.legacy
+import pandemics.processing
+import pandemics.reconcile
+import pandemics.synthetic
+
+nan = np.nan
+
+def pandas_reconcile(arrays, monotonic):
+    # The column-wise pandas way of doing it, which the engine replaced
+    stacked = pd.concat([pd.DataFrame(a) for a in arrays])
+    values = stacked.groupby(level=0).max()
+    if monotonic == 'last' and values.shape[1] > 1:
+        values.iloc[:, -1] = values.iloc[:, -2:].max(axis=1)
+    elif monotonic == 'all':
+        values = values.cummax(axis=1).ffill(axis=1)
+    return values.to_numpy(dtype='float64')
+
+def random_sources(rng, regions, dates, sources=2):
+    arrays = []
+    for _ in range(sources):
+        counts = rng.integers(0, 50, size=(regions, dates)).cumsum(axis=1).astype(float)
+        counts[rng.random(size=counts.shape) < 0.2] = nan
+        arrays.append(counts)
+    return arrays
+
+CASES = {
+    'synthetic': random_sources(np.random.default_rng(0), 40, 30, 3),
+    'all_nan_rows': [np.array([[nan, nan, nan], [1, 2, 3]]), np.array([[nan, nan, nan], [nan, 5, nan]])],
+    'single_date': [np.array([[3.0], [nan], [nan]]), np.array([[1.0], [4.0], [nan]])],
+    'decreasing': [np.array([[9, 7, 5, 3, 1.0]]), np.array([[8, 8, nan, 2, 0.0]])],
+    'one_source': [np.array([[1, nan, 0, 4.0], [nan, nan, 2, 1.0]])]
+}
+
+@pytest.mark.parametrize('monotonic', pandemics.reconcile.MONOTONIC_MODES)
+@pytest.mark.parametrize('case', CASES)
+def test_matches_pandas(case, monotonic):
+    arrays = CASES[case]
+    result = pandemics.reconcile.reconcile(arrays, monotonic=monotonic)
+    np.testing.assert_array_equal(result.values, pandas_reconcile(arrays, monotonic))
+
+    stack = np.stack(arrays)
+    present = result.winner != pandemics.reconcile.NO_SOURCE
+    assert np.array_equal(present, ~np.isnan(result.values))
+    if monotonic is None:
+        # Every kept number is one its winner reported for that cell
+        rows, cols = np.nonzero(present)
+        np.testing.assert_array_equal(stack[result.winner[rows, cols], rows, cols], result.values[rows, cols])
+
+def test_hand_worked_winners():
+    jhu = np.array([[1, 2, nan, 3], [5, nan, 4, 3]])
+    unh = np.array([[nan, 3, nan, nan], [nan, nan, nan, 6]])
+
+    last = pandemics.reconcile.reconcile([jhu, unh], monotonic='last')
+    np.testing.assert_array_equal(last.values, [[1, 3, nan, 3], [5, nan, 4, 6]])
+    np.testing.assert_array_equal(last.winner, [[0, 1, -1, 0], [0, -1, 0, 1]])
+
+    every = pandemics.reconcile.reconcile([jhu, unh], monotonic='all')
+    np.testing.assert_array_equal(every.values, [[1, 3, 3, 3], [5, 5, 5, 6]])
+    np.testing.assert_array_equal(every.winner, [[0, 1, 1, 0], [0, 0, 0, 1]])
+
+def test_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        pandemics.reconcile.reconcile(CASES['decreasing'], monotonic='first')
+
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('seed', range(3))
+def test_take_greatest_matches_legacy(seed, compact, monkeypatch):
+    # filter(like=date) in the legacy version also matches 11/22/20 for 1/22/20, so the data ends before November
+    monkeypatch.setattr(pandemics.processing, 'COMPACT', compact)
+    df = pandemics.synthetic.merged(days=250, regions=300, seed=seed)
+    old = pandemics.legacy.take_greatest(df.copy())
+    new = pandemics.processing.take_greatest(df.copy())
+    assert old.to_csv() == new.to_csv()
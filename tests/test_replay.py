@@ -0,0 +1,97 @@
+import pandas as pd
+import os
+from datetime import datetime
+from os.path import join
+import pytest
+import pandemics.model
+import pandemics.processing
+import pandemics.replay
+import pandemics.synthetic
+
+DAYS = [datetime(2020, 3, d) for d in (24, 25, 26, 27)]
+COUNTRIES = 4
+
+def snapshot(day: int) -> pd.DataFrame:
+    # Country 0's snapshot is far above anything JHU reports, so it has to win the merge
+    return pd.DataFrame({
+        'country': [f'Country {i}' for i in range(COUNTRIES)],
+        'cases': [10 ** 7 + day] + [1] * (COUNTRIES - 1),
+        'new_cases': 0,
+        'deaths': 0,
+        'new_deaths': 0,
+        'percent_deaths': 0.0,
+        'serious_and_critical': 0,
+        'recovered': 0,
+        'latitude': 1.0,
+        'longitude': 2.0
+    })
+
+@pytest.fixture
+def archive(tmp_path):
+    root = tmp_path / 'archive'
+    os.makedirs(root / 'world')
+    os.makedirs(root / 'us' / 'state')
+    for day in DAYS:
+        snapshot(day.day).to_csv(root / 'world' / day.strftime('%m-%d-%Y.csv'), index=False)
+    pd.DataFrame({'state': ['Alabama'], 'cases': [1], 'deaths': [0]}).to_csv(root / 'us' / 'state' / '03-25-2020.csv', index=False)
+    (root / 'world' / 'notes.txt').write_text('not a snapshot')
+
+    jhu = tmp_path / 'jhu'
+    os.makedirs(jhu)
+    # 1/22/20 to 3/27/20
+    df = pandemics.synthetic.jhu_global(66, COUNTRIES)
+    for _, csv, _ in pandemics.replay.WORLD_SERIES.values():
+        df.to_csv(jhu / csv, index=False)
+    return str(root), str(jhu)
+
+def test_index_and_select(archive):
+    root, _ = archive
+    index = pandemics.replay.index_archive(root)
+    assert sorted(index) == ['us/state', 'world']
+    assert [s.date for s in index['world']] == DAYS
+
+    def dates(start, end):
+        return [s.date.day for s in pandemics.replay.select(index, 'world', start, end)]
+    # Both ends are included
+    assert dates(DAYS[1], DAYS[2]) == [25, 26]
+    assert dates(None, DAYS[0]) == [24]
+    assert dates(DAYS[3], None) == [27]
+    assert dates(datetime(2020, 3, 24, 12), datetime(2020, 3, 25, 12)) == [25]
+    assert dates(datetime(2020, 4, 1), None) == []
+    assert pandemics.replay.select(index, 'canada/province') == []
+    assert pandemics.replay.newest(index, 'world').date == DAYS[-1]
+
+def test_truncate_drops_later_dates():
+    df = pandemics.processing.jhu_world_normalize(pandemics.synthetic.jhu_global(10, COUNTRIES))
+    table = pandemics.model.from_wide(df, 'country', 'jhu')
+    cut = pandemics.model.truncate(table, datetime(2020, 1, 25))
+
+    assert list(cut.dates) == list(pd.date_range('2020-01-22', '2020-01-25'))
+    assert cut.values.date.max() == pd.Timestamp('2020-01-25')
+    assert len(cut.values) == COUNTRIES * 4
+    assert cut.coords.equals(table.coords)
+
+def test_split_days():
+    days = list(pd.date_range('2020-03-01', periods=10).to_pydatetime())
+    batches = pandemics.replay.split_days(days, 3)
+    assert [len(b) for b in batches] == [4, 4, 2]
+    assert [d for b in batches for d in b] == days
+    assert pandemics.replay.split_days(days[:2], 8) == [[days[0]], [days[1]]]
+    assert pandemics.replay.split_days(days, 1) == [days]
+    assert pandemics.replay.split_days([], 4) == []
+
+def test_replay_world(archive, tmp_path):
+    root, jhu = archive
+    serial = pandemics.replay.replay('world', jhu, DAYS[1:], str(tmp_path / 'serial'), root=root, max_workers=1)
+    pooled = pandemics.replay.replay('world', jhu, DAYS[1:], str(tmp_path / 'pooled'), root=root, max_workers=2)
+    assert len(serial) == len(pooled) == 3 * len(pandemics.replay.WORLD_SERIES)
+
+    for a, b in zip(serial, pooled):
+        with open(a, 'rb') as fa, open(b, 'rb') as fb:
+            assert fa.read() == fb.read()
+
+    confirmed = pd.read_csv(join(str(tmp_path / 'serial'), '03-26-2020', 'world_country_confirmed.csv'), index_col=0)
+    # Nothing after the replayed day, and that day's snapshot is merged in
+    assert confirmed.columns[-1] == '3/26/20'
+    assert confirmed.set_index('country').loc['Country 0', '3/26/20'] == 10 ** 7 + 26
+    assert confirmed.set_index('country').loc['Country 0', '3/25/20'] == 10 ** 7 + 25
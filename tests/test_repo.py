@@ -0,0 +1,88 @@
+import subprocess
+from pathlib import Path
+import git as gitpython
+import pytest
+import pandemics.repo
+
+SERIES = 'data/series'
+
+def git(cwd, *args) -> str:
+    return subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+def commit(work, files, msg):
+    for name, text in files.items():
+        path = Path(work) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    git(work, 'add', '-A')
+    git(work, '-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-q', '-m', msg)
+    git(work, 'push', '-q', 'origin', 'master')
+
+@pytest.fixture
+def upstream(tmp_path):
+    bare = tmp_path / 'upstream.git'
+    work = tmp_path / 'work'
+    git(tmp_path, 'init', '-q', '--bare', '-b', 'master', str(bare))
+    git(tmp_path, 'clone', '-q', str(bare), str(work))
+    git(work, 'checkout', '-q', '-b', 'master')
+    commit(work, {f'{SERIES}/a.csv': 'a\n1\n', f'{SERIES}/b.csv': 'b\n1\n', 'docs/notes.md': 'readme\n'}, 'first')
+    commit(work, {f'{SERIES}/a.csv': 'a\n1\n2\n'}, 'second')
+    return f'file://{bare}', work
+
+def sync(url, path):
+    return pandemics.repo.sync_repo(url, str(path), sparse_paths=[SERIES])
+
+def assert_mirror(path):
+    assert git(path, 'rev-parse', '--is-shallow-repository') == 'true'
+    assert git(path, 'rev-list', '--count', 'HEAD') == '1'
+    assert (path / SERIES / 'a.csv').exists()
+    assert not (path / 'docs/notes.md').exists()
+
+def test_first_noop_and_update_syncs(upstream, tmp_path):
+    url, work = upstream
+    mirror = tmp_path / 'mirror'
+
+    repo, changed = sync(url, mirror)
+    assert sorted(changed) == [f'{SERIES}/a.csv', f'{SERIES}/b.csv']
+    assert_mirror(mirror)
+
+    repo, changed = sync(url, mirror)
+    assert changed == []
+
+    commit(work, {f'{SERIES}/b.csv': 'b\n1\n2\n', 'docs/notes.md': 'changed\n'}, 'third')
+    repo, changed = sync(url, mirror)
+    assert changed == [f'{SERIES}/b.csv']
+    assert (mirror / SERIES / 'b.csv').read_text() == 'b\n1\n2\n'
+    assert_mirror(mirror)
+
+def test_full_clone_becomes_mirror(upstream, tmp_path):
+    url, work = upstream
+    mirror = tmp_path / 'mirror'
+    git(tmp_path, 'clone', '-q', url, str(mirror))
+
+    repo, changed = sync(url, mirror)
+    assert sorted(changed) == [f'{SERIES}/a.csv', f'{SERIES}/b.csv']
+    assert_mirror(mirror)
+
+    repo, changed = sync(url, mirror)
+    assert changed == []
+
+def test_publisher_skips_contents_upstream_already_has(upstream, tmp_path):
+    url, work = upstream
+    outputs = {'data/derived.csv': b'x\n1\n'}
+    first = gitpython.Repo.clone_from(url, str(tmp_path / 'first'))
+    second = gitpython.Repo.clone_from(url, str(tmp_path / 'second'))
+    for repo in (first, second):
+        with repo.config_writer() as config:
+            config.set_value('user', 'name', 'test')
+            config.set_value('user', 'email', 'test@example.com')
+
+    report = pandemics.repo.Publisher().publish(first, outputs, msg='derived')
+    assert report.files == ['data/derived.csv'] and report.committed and report.pushed
+
+    # second has not pulled the commit yet, the same contents must not make another one
+    head = second.head.commit.hexsha
+    report = pandemics.repo.Publisher().publish(second, outputs, msg='derived')
+    assert report.files == [] and not report.committed and report.pending_commits == 0
+    assert second.head.commit.hexsha == first.head.commit.hexsha != head
+    assert git(work, 'ls-remote', url, 'master').split()[0] == first.head.commit.hexsha
@@ -0,0 +1,45 @@
+import asyncio
+import logging
+import pandemics.scheduler
+
+def broken_job():
+    raise ValueError('bad row')
+
+def test_failed_run_logs_traceback(caplog):
+    scheduler = pandemics.scheduler.Scheduler(max_workers=1)
+    job = scheduler.every(60, broken_job)
+    with caplog.at_level(logging.ERROR, logger='pandemics.scheduler'):
+        run = asyncio.run(scheduler.run_job(job))
+
+    assert run.status == 'failed'
+    assert run.error == "ValueError('bad row')"
+    [record] = caplog.records
+    assert '[broken_job]' in record.getMessage()
+    assert 'in broken_job' in caplog.text
+    assert job.stats()['failed'] == 1
+
+def test_loop_keeps_and_reaps_its_runs(caplog, monkeypatch):
+    scheduler = pandemics.scheduler.Scheduler(max_workers=1)
+    job = scheduler.every(60, broken_job)
+    held = []
+
+    async def crashing_run(job):
+        held.append(set(scheduler._tasks))
+        raise RuntimeError('scheduler bug')
+    monkeypatch.setattr(scheduler, 'run_job', crashing_run)
+
+    async def run_briefly():
+        try:
+            await asyncio.wait_for(scheduler._loop(job), 0.1)
+        except asyncio.TimeoutError:
+            pass
+
+    with caplog.at_level(logging.ERROR, logger='pandemics.scheduler'):
+        asyncio.run(run_briefly())
+
+    # The run was referenced while going, dropped once done and its crash logged
+    assert len(held) == 1 and len(held[0]) == 1
+    assert not scheduler._tasks
+    [record] = caplog.records
+    assert record.getMessage() == 'Job run crashed'
+    assert 'scheduler bug' in caplog.text
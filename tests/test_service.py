@@ -0,0 +1,61 @@
+import importlib.util
+import json
+import os
+import subprocess
+import git
+import pytest
+import pandemics.delta
+import pandemics.processing
+import pandemics.repo
+import pandemics.synthetic
+
+@pytest.fixture
+def service():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'covid-data-service.py')
+    spec = importlib.util.spec_from_file_location('covid_data_service', path)
+    module = importlib.util.module_from_spec(spec)
+    compact = pandemics.processing.COMPACT
+    spec.loader.exec_module(module)
+    yield module
+    pandemics.processing.COMPACT = compact
+
+def test_derived_files_are_the_ones_written(service):
+    df = pandemics.processing.jhu_world_normalize(pandemics.synthetic.jhu_global(30, 5))
+    written = {}
+    for path in service.REALTIME_FILES:
+        service.write_derived(written, df, os.path.join(service.UNH_REPO_PATH, path))
+    assert sorted(written) == sorted(service.DERIVED_FILES)
+
+def world_csv(days: int) -> bytes:
+    return pandemics.processing.jhu_world_normalize(pandemics.synthetic.jhu_global(days, 5)).to_csv().encode()
+
+def clone(url: str, path: str) -> git.Repo:
+    repo = git.Repo.clone_from(url, path)
+    with repo.config_writer() as config:
+        config.set_value('user', 'name', 'test')
+        config.set_value('user', 'email', 'test@example.com')
+    return repo
+
+def test_changesets_start_from_upstream(service, tmp_path, monkeypatch):
+    bare = tmp_path / 'upstream.git'
+    subprocess.run(['git', 'init', '-q', '--bare', '-b', 'master', str(bare)], check=True)
+    url = f'file://{bare}'
+    table = service.REALTIME_FILES[0]
+
+    other = clone(url, str(tmp_path / 'other'))
+    pandemics.repo.Publisher().publish(other, {table: world_csv(10)}, msg='first')
+    stale = clone(url, str(tmp_path / 'unh'))
+    # Upstream moves on after the service's clone was made
+    pandemics.repo.Publisher().publish(other, {table: world_csv(11)}, msg='second')
+
+    monkeypatch.setattr(service, 'UNH_REPO_PATH', stale.working_tree_dir)
+    monkeypatch.setattr(service, 'API_PORT', None)
+    monkeypatch.setattr(service, 'DELTAS', True)
+    service.publish('world', {table: world_csv(12)})
+
+    other.remote(name='origin').pull()
+    with open(os.path.join(other.working_tree_dir, pandemics.delta.DELTA_FOLDER, pandemics.delta.MANIFEST_NAME)) as fp:
+        manifest = json.load(fp)
+    [delta] = manifest['tables'][pandemics.delta.table_name(table)]['deltas']
+    assert delta['previous_sha1'] == pandemics.delta.sha1(world_csv(11))
+    assert delta['sha1'] == pandemics.delta.sha1(world_csv(12))